@@ -1,70 +1,75 @@
 ﻿from flask_restful import Resource
 
+#route of each explainer and the module and class implementing it. The modules are imported the first time the route is requested
+EXPLAINERS={
+    '/Images/Anchors':                      ("resources.explainers.images.anchors", "AnchorsImage"),
+    #'/Images/Counterfactuals':             ("resources.explainers.images.counterfactuals", "CounterfactualsImage"),
+    '/Images/ClassificationReport':         ("resources.explainers.images.classificationReport", "ClassificationReport"),
+    '/Images/ConfusionMatrix':              ("resources.explainers.images.confusionMatrix", "ConfusionMatrixImages"),
+    '/Images/DeconvNet':                    ("resources.explainers.images.deconvnet", "DeconvNetExp"),
+    '/Images/FORGrad':                      ("resources.explainers.images.forgrad", "FORGradExp"),
+    '/Images/GradCam++':                    ("resources.explainers.images.gradcampp", "GradCAMPPExp"),
+    '/Images/GradCam':                      ("resources.explainers.images.gradcam", "GradCam"),
+    '/Images/GradientInput':                ("resources.explainers.images.gradientInputs", "GradientInputExp"),
+    '/Images/GuidedBackprop':               ("resources.explainers.images.guidedBackprop", "GuidedBackpropExp"),
+    '/Images/HSIC':                         ("resources.explainers.images.hsic", "HsicAttributionMethodExp"),
+    '/Images/IntegratedGradients':          ("resources.explainers.images.integratedGradients", "IntegratedGradientsImage"),
+    '/Images/KernelSHAP':                   ("resources.explainers.images.kernelShap", "KernelSHAP"),
+    '/Images/LIME':                         ("resources.explainers.images.lime", "LimeImage"),
+    '/Images/NearestNeighbours':            ("resources.explainers.images.nn", "NearestNeighboursImage"),
+    '/Images/Occlusion':                    ("resources.explainers.images.occlusion", "OcclusionExp"),
+    '/Images/RISE':                         ("resources.explainers.images.rise", "RiseExp"),
+    '/Images/Saliency':                     ("resources.explainers.images.saliency", "SaliencyExp"),
+    '/Images/SmoothGrad':                   ("resources.explainers.images.smoothGrad", "SmoothGradExp"),
+    '/Images/Sobol':                        ("resources.explainers.images.sobol", "SobolAttributionMethodExp"),
+    '/Images/SquareGrad':                   ("resources.explainers.images.squareGrad", "SquareGradExp"),
+    '/Images/SSIMCounterfactuals':          ("resources.explainers.images.cfSSIM", "SSIMCounterfactual"),
+    '/Images/SSIMNearestNeighbours':        ("resources.explainers.images.nnSSIM", "SSIMNearestNeighbours"),
+    '/Images/VarGrad':                      ("resources.explainers.images.varGrad", "VarGradExp"),
+    '/Tabular/ALE':                         ("resources.explainers.tabular.ale", "Ale"),
+    '/Tabular/Anchors':                     ("resources.explainers.tabular.anchors", "Anchors"),
+    '/Tabular/ConfusionMatrix':             ("resources.explainers.tabular.confusionMatrix", "ConfusionMatrix"),
+    '/Tabular/CumulativePrecision':         ("resources.explainers.tabular.cumulativePrecision", "CumulativePrecision"),
+    '/Tabular/DeepSHAPGlobal':              ("resources.explainers.tabular.shapDeepGlobal", "ShapDeepGlobal"),
+    '/Tabular/DeepSHAPLocal':               ("resources.explainers.tabular.shapDeepLocal", "ShapDeepLocal"),
+    '/Tabular/DicePrivate':                 ("resources.explainers.tabular.dicePrivate", "DicePrivate"),
+    '/Tabular/DicePublic':                  ("resources.explainers.tabular.dicePublic", "DicePublic"),
+    '/Tabular/DisCERN':                     ("resources.explainers.tabular.discern", "DisCERN"),
+    '/Tabular/ICE':                         ("resources.explainers.tabular.skICE", "SklearnICE"),
+    '/Tabular/IREX':                        ("resources.explainers.tabular.irex", "IREX"),
+    '/Tabular/Importance':                  ("resources.explainers.tabular.importance", "Importance"),
+    '/Tabular/KernelSHAPGlobal':            ("resources.explainers.tabular.shapKernelGlobal", "ShapKernelGlobal"),
+    '/Tabular/KernelSHAPLocal':             ("resources.explainers.tabular.shapKernelLocal", "ShapKernelLocal"),
+    '/Tabular/LiftCurve':                   ("resources.explainers.tabular.liftCurve", "LiftCurve"),
+    '/Tabular/LIME':                        ("resources.explainers.tabular.lime", "Lime"),
+    '/Tabular/NICE':                        ("resources.explainers.tabular.nice", "Nice"),
+    '/Tabular/PDP':                         ("resources.explainers.tabular.skPDP", "SklearnPDP"),
+    '/Tabular/PertCF':                      ("resources.explainers.tabular.pertCF", "Pertcf"),
+    '/Tabular/PrecisionGraph':              ("resources.explainers.tabular.precisionGraph", "PrecisionGraph"),
+    '/Tabular/PR-AUC':                      ("resources.explainers.tabular.prAuc", "PRAUC"),
+    '/Tabular/RegressionPredictedVsActual': ("resources.explainers.tabular.regressionPredictedVsActual", "RegressionPredictedVsActual"),
+    '/Tabular/RegressionResiduals':         ("resources.explainers.tabular.regressionResiduals", "RegressionResiduals"),
+    '/Tabular/ROC-AUC':                     ("resources.explainers.tabular.rocAuc", "ROCAUC"),
+    '/Tabular/SHAPDependence':              ("resources.explainers.tabular.shapDependence", "ShapDependence"),
+    '/Tabular/SHAPInteraction':             ("resources.explainers.tabular.shapInteraction", "ShapInteraction"),
+    '/Tabular/SHAPSummary':                 ("resources.explainers.tabular.shapSummary", "ShapSummary"),
+    '/Tabular/SummaryMetrics':              ("resources.explainers.tabular.summaryMetrics", "SummaryMetrics"),
+    '/Tabular/TreeSHAPGlobal':              ("resources.explainers.tabular.shapTreeGlobal", "ShapTreeGlobal"),
+    '/Tabular/TreeSHAPLocal':               ("resources.explainers.tabular.shapTreeLocal", "ShapTreeLocal"),
+    '/Text/LIME':                           ("resources.explainers.text.lime", "LimeText"),
+    '/Text/NLPClassifier':                  ("resources.explainers.text.nlp_clf_explainer", "NLPClassifierExpl"),
+    '/Timeseries/CBRFox':                   ("resources.explainers.timeseries.cbrFox", "CBRFox"),
+    '/Timeseries/ConfusionMatrix':          ("resources.explainers.timeseries.confusionMatrix", "TSConfusionMatrix"),
+    '/Timeseries/iGenCBR':                  ("resources.explainers.timeseries.iGenCBR", "IGenCBR"),
+    '/Timeseries/LEFTIST':                  ("resources.explainers.timeseries.leftist", "Leftist"),
+    '/Timeseries/LIMESegment':              ("resources.explainers.timeseries.limeSegment", "LimeSegment"),
+    '/Timeseries/NativeGuides':             ("resources.explainers.timeseries.nativeGuides", "NativeGuides"),
+    '/Timeseries/NearestNeighbours':        ("resources.explainers.timeseries.nearestNeighbours", "TSNearestNeighbours"),
+    '/Timeseries/NEVES':                    ("resources.explainers.timeseries.neves", "Neves"),
+    '/Timeseries/SummaryMetrics':           ("resources.explainers.timeseries.summaryMetrics", "TSSummaryMetrics"),
+    '/Misc/AIModelPerformance':             ("resources.explainers.misc.performance", "AIModelPerformance")
+}
+
 class Explainers(Resource):
     def get(self):
-        return [ '/Images/Anchors',
-                 #'/Images/Counterfactuals',
-                 '/Images/ClassificationReport',
-                 '/Images/ConfusionMatrix',
-                 '/Images/DeconvNet',
-                 '/Images/FORGrad',
-                 '/Images/GradCam++',
-                 '/Images/GradCam',
-                 '/Images/GradientInput',
-                 '/Images/GuidedBackprop',
-                 '/Images/HSIC',
-                 '/Images/IntegratedGradients',
-                 '/Images/KernelSHAP',
-                 '/Images/LIME',
-                 '/Images/NearestNeighbours',
-                 '/Images/Occlusion',
-                 '/Images/RISE',
-                 '/Images/Saliency',
-                 '/Images/SmoothGrad',
-                 '/Images/Sobol',
-                 '/Images/SquareGrad',
-                 '/Images/SSIMCounterfactuals',
-                 '/Images/SSIMNearestNeighbours',
-                 '/Images/VarGrad',
-                 '/Tabular/ALE',
-                 '/Tabular/Anchors',
-                 '/Tabular/ConfusionMatrix',
-                 '/Tabular/CumulativePrecision',
-                 '/Tabular/DeepSHAPGlobal',
-                 '/Tabular/DeepSHAPLocal',
-                 '/Tabular/DicePrivate',
-                 '/Tabular/DicePublic',
-                 '/Tabular/DisCERN',
-                 '/Tabular/ICE',
-                 '/Tabular/IREX',
-                 '/Tabular/Importance',
-                 '/Tabular/KernelSHAPGlobal',
-                 '/Tabular/KernelSHAPLocal',
-                 '/Tabular/LiftCurve',
-                 '/Tabular/LIME',
-                 '/Tabular/NICE',  
-                 '/Tabular/PDP',
-                 '/Tabular/PertCF',
-                 '/Tabular/PrecisionGraph',
-                 '/Tabular/PR-AUC',
-                 '/Tabular/RegressionPredictedVsActual',
-                 '/Tabular/RegressionResiduals',
-                 '/Tabular/ROC-AUC',
-                 '/Tabular/SHAPDependence',
-                 '/Tabular/SHAPInteraction',
-                 '/Tabular/SHAPSummary',
-                 '/Tabular/SummaryMetrics', 
-                 '/Tabular/TreeSHAPGlobal',
-                 '/Tabular/TreeSHAPLocal',
-                 '/Text/LIME',
-                 '/Text/NLPClassifier',
-                 '/Timeseries/CBRFox',
-                 '/Timeseries/ConfusionMatrix',
-                 '/Timeseries/iGenCBR',
-                 '/Timeseries/LEFTIST',
-                 '/Timeseries/LIMESegment',
-                 '/Timeseries/NativeGuides',
-                 '/Timeseries/NearestNeighbours',
-                 '/Timeseries/NEVES',
-                 '/Timeseries/SummaryMetrics',
-                 '/Misc/AIModelPerformance']
+        return list(EXPLAINERS.keys())
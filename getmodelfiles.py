@@ -1,6 +1,12 @@
 from os.path import exists
+from utils.cache import LRUCache, file_fingerprint, env_number
 
 
+#loaded models are shared by all the explainers. The cache is bounded by number of models and, optionally, by the RSS of the process
+MODEL_CACHE=LRUCache("models",max_items=int(env_number("MODEL_CACHE_MAX_ITEMS",8)),max_rss_mb=env_number("MODEL_CACHE_MAX_RSS_MB"))
+#parsed training data, stored as read-only objects so that no request can modify what the next one receives
+DATA_CACHE=LRUCache("data",max_items=int(env_number("DATA_CACHE_MAX_ITEMS",4)),max_rss_mb=env_number("DATA_CACHE_MAX_RSS_MB"))
+
 
 def get_model_files(_id,model_folder):
 
@@ -30,3 +36,136 @@ def get_model_files(_id,model_folder):
         return model, model_info, data
     else:
         raise Exception("No directory with id '"+ _id +"' was found in the database.")
+
+
+def _read_model(path, backend, linear_output=False):
+    from utils import ontologyConstants
+    if backend in ontologyConstants.TENSORFLOW_URIS:
+        import tensorflow as tf
+        model=tf.keras.models.load_model(path,compile=False)
+        if linear_output:
+            try:
+                model.layers[-1].activation = tf.keras.activations.linear
+            except:
+                pass
+        return model
+    elif backend in ontologyConstants.PYTORCH_URIS:
+        import torch
+        return torch.load(path)
+    else:
+        import joblib
+        return joblib.load(path)
+
+
+def load_model(model_file, backend, linear_output=False):
+    #returns the deserialized model behind the file returned by get_model_files, loading it only once.
+    #linear_output=True gives a separate copy of a Keras model whose last activation was replaced by a linear one
+    path=model_file if isinstance(model_file,str) else model_file.name
+    key=(file_fingerprint(path),backend,bool(linear_output))
+    return MODEL_CACHE.get_or_load(key,lambda: _read_model(path,backend,linear_output))
+
+
+def load_predict_func(model_file, backend):
+    #prediction function used by most explainers: Keras models are callable, sklearn models return probabilities if available
+    from utils import ontologyConstants
+    model=load_model(model_file,backend)
+    if backend in ontologyConstants.TENSORFLOW_URIS:
+        return model
+    elif backend in ontologyConstants.SKLEARN_URIS:
+        try:
+            return model.predict_proba
+        except:
+            return model.predict
+    return model.predict
+
+
+def _read_data(path):
+    if path.endswith(".csv"):
+        import pandas as pd
+        return pd.read_csv(path,header=0)
+    import joblib
+    return joblib.load(path)
+
+
+def _freeze(data):
+    import numpy as np
+    import pandas as pd
+    arrays=[]
+    if isinstance(data,np.ndarray):
+        arrays=[data]
+    elif isinstance(data,pd.DataFrame):
+        #pandas has no public way to make a DataFrame read-only, so the arrays of its blocks are frozen.
+        #tests/data_cache.py checks it with the pinned pandas version; other versions without these internals are not frozen
+        try:
+            data._consolidate_inplace()
+            arrays=data._mgr.arrays
+        except AttributeError:
+            arrays=[]
+    elif isinstance(data,pd.Series):
+        arrays=[data.values]
+    for arr in arrays:
+        if isinstance(arr,np.ndarray):
+            arr.flags.writeable=False
+    return data
+
+
+def load_data(data_file):
+    #returns the training data behind the file returned by get_model_files (.pkl or .csv), parsing it only once.
+    #DataFrames are returned as shallow copies and arrays as views: columns can be dropped or replaced, but the values are read-only
+    import numpy as np
+    path=data_file if isinstance(data_file,str) else data_file.name
+    data=DATA_CACHE.get_or_load(file_fingerprint(path),lambda: _freeze(_read_data(path)))
+    if isinstance(data,np.ndarray):
+        return data.view()
+    try:
+        return data.copy(deep=False)
+    except AttributeError:
+        return data
+
+
+def _read_image_csv(path, chunksize):
+    #pixels are parsed by the C engine straight into float32, in chunks so the parser does not hold the whole file as text.
+    #The label is the last column
+    import numpy as np
+    import pandas as pd
+    chunks=[chunk.to_numpy(dtype=np.float32) for chunk in pd.read_csv(path,header=0,dtype=np.float32,engine="c",chunksize=chunksize)]
+    values=np.concatenate(chunks) if chunks else np.empty((0,1),dtype=np.float32)
+    return _freeze(np.ascontiguousarray(values[:,:-1])), _freeze(np.ascontiguousarray(values[:,-1]))
+
+
+def load_image_csv(data_file, label=None, exclude_label=False, chunksize=10000):
+    #returns the pixels (one row per image) and labels of an image dataset stored as csv, parsing the file only once.
+    #If label is given, only the rows of that label are returned, or the rows of the other labels if exclude_label=True
+    path=data_file if isinstance(data_file,str) else data_file.name
+    pixels, labels = DATA_CACHE.get_or_load((file_fingerprint(path),"image_csv"),lambda: _read_image_csv(path,chunksize))
+    if label is None:
+        return pixels.view(), labels.view()
+    mask=labels!=float(label) if exclude_label else labels==float(label)
+    return pixels[mask], labels[mask]
+
+
+def _penultimate_layer(model, backend):
+    import numpy as np
+    from utils import ontologyConstants
+    if backend in ontologyConstants.TENSORFLOW_URIS:
+        import tensorflow as tf
+        extractor=tf.keras.models.Model([model.inputs],[model.layers[-2].output])
+        def encode(x):
+            return np.asarray(extractor(np.asarray(x,dtype=np.float32),training=False)).reshape(len(x),-1)
+        return encode
+    elif backend in ontologyConstants.PYTORCH_URIS:
+        import torch
+        extractor=torch.nn.Sequential(*list(model.children())[:-1]).eval()
+        def encode(x):
+            with torch.no_grad():
+                return extractor(torch.as_tensor(np.asarray(x,dtype=np.float32))).reshape(len(x),-1).numpy()
+        return encode
+    raise Exception("Only Tensorflow and PyTorch backends are supported.")
+
+
+def load_feature_extractor(model_file, backend):
+    #returns a function giving the outputs of the penultimate layer of the model (one float32 row per input).
+    #The truncated model is built once per model file
+    path=model_file if isinstance(model_file,str) else model_file.name
+    model=load_model(model_file,backend)
+    return MODEL_CACHE.get_or_load((file_fingerprint(path),backend,"penultimate"),lambda: _penultimate_layer(model,backend))
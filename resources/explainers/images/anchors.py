@@ -6,18 +6,17 @@ from PIL import Image
 import numpy as np
 import tensorflow as tf
 import torch
-import h5py
 import joblib
 import json
 import matplotlib.pyplot as plt
 from alibi.explainers import AnchorImage
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
 from utils.img_processing import normalize_img
 from utils.validation import validate_params
 from io import BytesIO
-import requests
 import traceback
 
 
@@ -65,22 +64,19 @@ class AnchorsImage(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict_proba
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 else:
-                    mlp = joblib.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a locally stored model or a URL for the prediction function of the model must be provided.",BAD_REQUEST
                 
@@ -147,6 +143,10 @@ class AnchorsImage(Resource):
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #alibi samples with the global random generator, so the anchors cannot be reproduced
+        return False
+
     def get(self,id=None):
         return {
         "_method_description": "Uses anchors to find the groups of pixels that are sufficient for the model to justify the predicted class."
@@ -6,17 +6,16 @@ import os
 import numpy as np
 import tensorflow as tf
 import torch
-import h5py
 import json
 import matplotlib.pyplot as plt
 from io import BytesIO
-from skimage.metrics import structural_similarity
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector, PIL_to_base64
-from utils.img_processing import normalize_img, normalise_image_batch, denormalise_image_batch
-from utils.img_processing import normalise_image_batch
+from utils.img_processing import normalize_img, denormalise_image_batch
 from utils.validation import validate_params
+from utils.image_store import ImageDataset
+from utils.ssim import ssim_data_range, class_ssim
 import traceback
 
 class SSIMCounterfactual(Resource):
@@ -25,58 +24,13 @@ class SSIMCounterfactual(Resource):
         self.model_folder = model_folder
         self.upload_folder = upload_folder
         
-    def nn_data(self,label_raw, label,model_info, data_file,output_names,sample=None):
-        train_data = []
-        actual=[]
-        
-        if type(data_file)==str and os.path.isdir(data_file):
-            # classification image dataset in zipped folder
-            _folders = [_f for _f in os.listdir(data_file) if _f != label_raw]
-            if len(_folders)<1:
-                raise Exception("No data found.")
-
-            for folder in _folders:
-                _folder_path = os.path.join(data_file, folder)
-                _files = [os.path.join(_folder_path, f) for f in os.listdir(_folder_path)]
-                train_data=train_data+[np.array(Image.open(f)) for f in _files]
-                actual=actual+([output_names.index(folder)]*len(_files))
-            train_data=np.asarray(train_data)
-            actual=np.asarray(actual)
-
-            if sample!=None:
-                sample_idx=np.random.randint(train_data.shape[0], size=min(sample,len(train_data)))
-                train_data=train_data[sample_idx,:]
-                actual=actual[sample_idx]
-            train_data = normalise_image_batch(train_data, model_info)
-
-            return train_data,actual
-           
-        else:
-            header = next(data_file).split(',')
-            header = [elem.strip() for elem in header]
-
-            while True:
-                try:
-                    s_instance = next(data_file)
-                    s_instance = s_instance.replace('\n', '')
-                    s_array = s_instance.split(',')
-
-                    if label != float(s_array[-1]):
-                        s_array = [float(s) for s in s_array][:-1]
-                        actual.append(float(s_array[-1]))
-                        train_data.append(s_array)
-                except Exception as e: #end of rows
-                    train_data=np.asarray(train_data)
-                    actual=np.asarray(actual)
-
-                    if sample!=None:
-                        sample_idx=np.random.randint(train_data.shape[0], size=min(sample,len(train_data)))
-                        train_data=train_data[sample_idx,:]
-                        actual=actual[sample_idx]
-
-                    train_data = train_data.reshape((train_data.shape[0],)+tuple(model_info["attributes"]["features"]["image"]["shape"]))
-                    return train_data,actual                
-                   
+    def nn_data(self,label_raw, label,model_info, data_file):
+        #returns the training images and the classes other than the predicted one
+        dataset = ImageDataset(data_file, model_info)
+        class_keys = [c for c in dataset.class_keys() if c != dataset.class_key(label_raw, label)]
+        if len(class_keys)<1:
+            raise Exception("No data found.")
+        return dataset, class_keys
  
     def post(self):
         params = request.json
@@ -102,15 +56,26 @@ class SSIMCounterfactual(Resource):
         return self.explain(_id, instance, params_json)
     
 
-    def nun(self,num_cf,query,data,labels,channel_axis):
-        print(query.shape)
-        print(data[0].shape)
-        similarities=np.array([structural_similarity(query,image,channel_axis=channel_axis) for image in data])
+    def nun(self,num_cf,query,dataset,class_keys,data_range,sample=None,seed=None):
+        #SSIM of the query with the images of the other classes (or a random sample of them), class by class.
+        #The window statistics of the training images are precomputed, so only the cross term with the query is computed
+        counts=np.array([dataset.count(c) for c in class_keys])
+        offsets=np.concatenate([[0],np.cumsum(counts)])
+        rows=None
+        if sample!=None:
+            rows=np.sort(np.random.default_rng(seed).choice(offsets[-1], size=min(sample,offsets[-1]), replace=False))
+        similarities=[]
+        candidates=[]
+        for i, class_key in enumerate(class_keys):
+            class_rows=np.arange(counts[i]) if rows is None else rows[(rows>=offsets[i]) & (rows<offsets[i+1])]-offsets[i]
+            similarities.append(class_ssim(query,dataset,class_key,data_range,rows=class_rows))
+            candidates.extend((class_key,row) for row in class_rows)
+        similarities=np.concatenate(similarities)
+        num_cf=min(num_cf,len(similarities))
         ind = np.argpartition(similarities, -num_cf)[-num_cf:]
-        print(ind)
         top=ind[np.argsort(similarities[ind])[::-1]]
 
-        return top,labels[top]
+        return [candidates[t] for t in top]
 
     def explain(self, model_id, instance, params_json):
         try:
@@ -127,11 +92,10 @@ class SSIMCounterfactual(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model = h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                     predic_func=model   
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    model = torch.load(model_file)
+                    model = load_model(model_file, backend)
                     predic_func=model.predict
                 else:
                     return "Only Tensorflow and PyTorch backends are supported.",BAD_REQUEST
@@ -165,16 +129,11 @@ class SSIMCounterfactual(Resource):
             num_cf = params_json["num_cf"]
             sample=params_json["samples"]
 
-            channel_axis=None
-            if(instance.shape[-1]==3):
-                channel_axis=-1
-
-            train_data,labels = self.nn_data(instance_label_raw, instance_label, model_info, data_file,output_names,sample=sample)
-            print(len(train_data))
-            print(labels)
-            cf_indices,cf_labels = self.nun(num_cf,instance,train_data,labels,channel_axis)
-            print(cf_indices,cf_labels)
-            cf_indices = np.array([train_data[n] for n in cf_indices])
+            dataset, class_keys = self.nn_data(instance_label_raw, instance_label, model_info, data_file)
+            counterfactuals = self.nun(num_cf,instance,dataset,class_keys,ssim_data_range(model_info),sample=sample,seed=params_json["seed"])
+            cf_labels = [dataset.class_index(class_key, output_names) for class_key, _ in counterfactuals]
+            print(counterfactuals,cf_labels)
+            cf_indices = np.concatenate([dataset.images(class_key, [row]) for class_key, row in counterfactuals])
             
 
             preds=np.asarray(predic_func(cf_indices))
@@ -223,6 +182,10 @@ class SSIMCounterfactual(Resource):
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #the sampled images are only reproducible with a seed
+        return params_json.get("samples") is None or params_json.get("seed") is not None
+
     def get(self,id=None):
         return {
         "_method_description": "Finds the nearest neighbours to a data instances based on minimum euclidean distance",
@@ -237,9 +200,16 @@ class SSIMCounterfactual(Resource):
                         "required":False
                         },
                 "samples":{
-                    "description": "Number of samples to use from the background data. A hundred samples are used by default.",
+                    "description": "Number of images of the other classes randomly sampled to search the counterfactuals. All the images are searched by default.",
+                    "type":"int",
+                    "default": None,
+                    "range":None,
+                    "required":False
+                    },
+                "seed":{
+                    "description": "Integer used as seed for the sampling of the images. Requests with the same seed get the same explanation, which is then served from the cache. Random if not provided.",
                     "type":"int",
-                    "default": 100,
+                    "default": None,
                     "range":None,
                     "required":False
                     },                
@@ -6,14 +6,15 @@ import os
 import numpy as np
 import tensorflow as tf
 import torch
-import h5py
 import json
 import pandas as pd
 from sklearn.metrics import classification_report
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
-from utils.img_processing import normalise_image_batch
 from utils.validation import validate_params
+from utils.image_store import ImageDataset
+from utils.batch_predict import dataset_predictions
+from utils.cache import file_fingerprint
 import traceback
 
 class ClassificationReport(Resource):
@@ -22,68 +23,15 @@ class ClassificationReport(Resource):
         self.model_folder = model_folder
         self.upload_folder = upload_folder
         
-    def get_preds(self, model_info, predic_func, data_file,output_names,sample=None):
-        train_data = []
-        actual=[]
-        
-        if type(data_file)==str and os.path.isdir(data_file):
-            # classification image dataset in zipped folder
-            _folders = [_f for _f in os.listdir(data_file)]
-            if len(_folders)<1:
-                raise Exception("No data found.")
-
-            for folder in _folders:
-                _folder_path = os.path.join(data_file, folder)
-                _files = [os.path.join(_folder_path, f) for f in os.listdir(_folder_path)]
-                train_data=train_data+[np.array(Image.open(f)) for f in _files]
-                actual=actual+([output_names.index(folder)]*len(_files))
-        
-            train_data=np.asarray(train_data)
-            actual=np.asarray(actual)
-            if sample!=None:
-                sample_idx=np.random.randint(train_data.shape[0], size=sample)
-                train_data=train_data[sample_idx,:]
-                actual=actual[sample_idx]
-            train_data = normalise_image_batch(train_data, model_info)
-            
-            #instead of batch to avoid potential OOM errors
-            preds=[]
-            for instance in train_data:
-                pred=predic_func(np.expand_dims(instance,axis=0))[0]
-                preds.append(pred)
-            preds=np.array(preds)
-
-            return preds, actual
-           
-        else:
-            header = next(data_file).split(',')
-            header = [elem.strip() for elem in header]
-
-            while True:
-                try:
-                    s_instance = next(data_file)
-                    s_instance = s_instance.replace('\n', '')
-                    s_array = s_instance.split(',')
-                    actual.append(float(s_array[-1]))
-                    s_array = [float(s) for s in s_array][:-1]
-                    train_data.append(s_array)
-                except Exception as e: #end of rows
-                    train_data=np.asarray(train_data)
-                    actual=np.asarray(actual)
-                    if sample!=None:
-                        sample_idx=np.random.randint(train_data.shape[0], size=sample)
-                        train_data=train_data[sample_idx,:]
-                        actual=actual[sample_idx]
-                    train_data = train_data.reshape((train_data.shape[0],)+tuple(model_info["attributes"]["features"]["image"]["shape"]))
-                   #instead of batch to avoid potential OOM errors
-                    preds=[]
-                    for instance in train_data:
-                        pred=predic_func(np.expand_dims(instance,axis=0))[0]
-                        preds.append(pred)
-                    preds=np.array(preds)
-
-                    return preds, actual                 
-                   
+    def get_preds(self, model_info, predic_func, model_file, data_file,output_names,sample=None,seed=None):
+        #the predictions of the whole dataset are computed once per model and shared with ConfusionMatrix
+        dataset = ImageDataset(data_file, model_info)
+        preds, actual = dataset_predictions(file_fingerprint(model_file.name), predic_func, dataset, output_names)
+        if sample!=None:
+            sample_idx=np.random.default_rng(seed).choice(len(preds), size=min(sample,len(preds)), replace=False)
+            preds=preds[sample_idx]
+            actual=actual[sample_idx]
+        return preds, actual
  
     def post(self):
         params = request.json
@@ -124,11 +72,10 @@ class ClassificationReport(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model = h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                     predic_func=model   
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    model = torch.load(model_file)
+                    model = load_model(model_file, backend)
                     predic_func=model.predict
                 else:
                     return "Only Tensorflow and PyTorch backends are supported.",BAD_REQUEST
@@ -137,7 +84,7 @@ class ClassificationReport(Resource):
         
             sample=params_json["samples"]
 
-            preds, actual = self.get_preds(model_info, predic_func, data_file,output_names,sample=sample)
+            preds, actual = self.get_preds(model_info, predic_func, model_file, data_file,output_names,sample=sample,seed=params_json["seed"])
 
             if(len(preds.shape)==2):
                 preds = np.squeeze(np.argmax(preds,axis=-1))
@@ -151,6 +98,10 @@ class ClassificationReport(Resource):
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #the sampled images are only reproducible with a seed
+        return params_json.get("samples") is None or params_json.get("seed") is not None
+
     def get(self,id=None):
         return {
         "_method_description": "Finds the nearest neighbours to a data instances based on minimum euclidean distance",
@@ -158,9 +109,16 @@ class ClassificationReport(Resource):
         "instance": "Image to be explained in BASE64 format",
         "params": { 
                 "samples":{
-                    "description": "Number of samples to use from the background data. A hundred samples are used by default.",
+                    "description": "Number of images randomly sampled from the training data. All the images are used by default.",
+                    "type":"int",
+                    "default": None,
+                    "range":None,
+                    "required":False
+                    },
+                "seed":{
+                    "description": "Integer used as seed for the sampling of the images. Requests with the same seed get the same explanation, which is then served from the cache. Random if not provided.",
                     "type":"int",
-                    "default": 100,
+                    "default": None,
                     "range":None,
                     "required":False
                     }
@@ -4,13 +4,12 @@ from PIL import Image
 import numpy as np
 import tensorflow as tf
 import torch
-import h5py
 import joblib
 import json
 import matplotlib.pyplot as plt
 from alibi.explainers import Counterfactual
-from getmodelfiles import get_model_files
-import requests
+from getmodelfiles import get_model_files, load_model
+from utils.remote_predict import remote_predict_func
 from io import BytesIO
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
@@ -61,22 +60,19 @@ class CounterfactualsImage(Resource):
 
         if model_file!=None:
             if backend in ontologyConstants.TENSORFLOW_URIS:
-                model=h5py.File(model_file, 'w')
-                mlp = tf.keras.models.load_model(model)
+                mlp = load_model(model_file, backend)
                 predic_func=mlp.predict
             elif backend in ontologyConstants.SKLEARN_URIS:
-                mlp = joblib.load(model_file)
+                mlp = load_model(model_file, backend)
                 predic_func=mlp.predict_proba
             elif backend in ontologyConstants.PYTORCH_URIS:
-                mlp = torch.load(model_file)
+                mlp = load_model(model_file, backend)
                 predic_func=mlp.predict
             else:
-                mlp = joblib.load(model_file)
+                mlp = load_model(model_file, backend)
                 predic_func=mlp.predict
         elif url!=None:
-            def predict(X):
-                return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-            predic_func=predict
+            predic_func=remote_predict_func(url)
         else:
             raise Exception("Either a locally stored model or a URL for the prediction function of the model must be provided.")
                 
@@ -3,14 +3,13 @@ from flask_restful import Resource
 from flask import request
 from PIL import Image
 import tensorflow as tf
-import h5py
 import json
 import matplotlib.pyplot as plt
 import numpy as np
 from xplique.attributions import DeconvNet
 from xplique.plots import plot_attributions
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
 from utils.img_processing import normalize_img
@@ -57,8 +56,7 @@ class DeconvNetExp(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend, linear_output=True)
                 else:
                     return "This method only supports Tensorflow/Keras models.",BAD_REQUEST
             else:
@@ -87,10 +85,6 @@ class DeconvNetExp(Resource):
                     target_class = output_names.index(params_json["target_class"])
 
             ## Generating explanation
-            try:
-                mlp.layers[-1].activation = tf.keras.activations.linear
-            except:
-                pass
             explainer=DeconvNet(mlp)
             explanations = explainer(instance, tf.one_hot(np.array([target_class]), depth=len(output_names), axis=-1))
 
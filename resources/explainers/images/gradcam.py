@@ -7,7 +7,6 @@ import torch
 import json
 import numpy as np
 import tensorflow as tf
-import h5py
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 from torchvision import transforms
@@ -15,7 +14,7 @@ from pytorch_grad_cam.utils.image import show_cam_on_image
 from pytorch_grad_cam.utils.model_targets import ClassifierOutputTarget
 from pytorch_grad_cam import GradCAM
 from saveinfo import save_file_info
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
 from utils.img_processing import normalize_img
@@ -61,11 +60,10 @@ class GradCam(Resource):
             is_tf=False
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend)
                     is_tf=True
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
+                    mlp = load_model(model_file, backend)
                     mlp.eval()
 
                 else:
@@ -316,11 +314,10 @@ class GradCam(Resource):
             is_tf=False
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend)
                     is_tf=True
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
+                    mlp = load_model(model_file, backend)
                     mlp.eval()
 
 
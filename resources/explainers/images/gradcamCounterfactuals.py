@@ -6,7 +6,6 @@ import torch
 import json
 import numpy as np
 import tensorflow as tf
-import h5py
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 from torchvision import transforms
@@ -14,7 +13,7 @@ from pytorch_grad_cam.utils.image import show_cam_on_image
 from pytorch_grad_cam.utils.model_targets import ClassifierOutputTarget
 from pytorch_grad_cam import GradCAM
 from saveinfo import save_file_info
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
 from utils.img_processing import normalize_img
@@ -55,8 +54,7 @@ class GradCamCounterfactuals(Resource):
 
         if model_file!=None:
             if backend in ontologyConstants.TENSORFLOW_URIS:
-                model=h5py.File(model_file, 'w')
-                mlp = tf.keras.models.load_model(model)
+                mlp = load_model(model_file, backend)
             else:
                 raise Exception("This method only supports Tensorflow/Keras models.")
         else:
@@ -4,14 +4,13 @@ from flask import request
 from PIL import Image
 import numpy as np
 import tensorflow as tf
-import h5py
 import json
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 from alibi.explainers import IntegratedGradients
 from alibi.utils import visualize_image_attr
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
 from utils.img_processing import normalize_img
@@ -62,8 +61,7 @@ class IntegratedGradientsImage(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend)
                 else:
                     return "This method only supports Tensorflow/Keras models.",BAD_REQUEST
             else:
@@ -3,14 +3,13 @@ from flask_restful import Resource
 from flask import request
 from PIL import Image
 import tensorflow as tf
-import h5py
 import json
 import matplotlib.pyplot as plt
 import numpy as np
 from xplique.attributions import KernelShap
 from xplique.plots import plot_attributions
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
 from utils.img_processing import normalize_img
@@ -57,8 +56,7 @@ class KernelSHAP(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend, linear_output=True)
                 else:
                     return "This method only supports Tensorflow/Keras models.",BAD_REQUEST
             else:
@@ -87,10 +85,6 @@ class KernelSHAP(Resource):
                     target_class = output_names.index(params_json["target_class"])
 
             ## Generating explanation
-            try:
-                mlp.layers[-1].activation = tf.keras.activations.linear
-            except:
-                pass
             explainer=KernelShap(mlp,nb_samples=1600)
             explanations = explainer(instance, tf.one_hot(np.array([target_class]), depth=len(output_names), axis=-1))
 
@@ -107,6 +101,10 @@ class KernelSHAP(Resource):
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #the perturbations are sampled with the global TensorFlow generator, so the attributions cannot be reproduced
+        return False
+
     def get(self,id=None):
         base_dict={
         "_method_description": "By setting an appropriate perturbation function, the similarity kernel, and the interpretable model in the LIME framework, we can theoretically obtain Shapley Values more efficiently. Therefore, KernelSHAP is a method based on LIME with specific attributes.",
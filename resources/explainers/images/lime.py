@@ -7,13 +7,12 @@ from PIL import Image
 import numpy as np
 import tensorflow as tf
 import torch
-import h5py
 import joblib
 import json
 import matplotlib.pyplot as plt
 from lime import lime_image
-from getmodelfiles import get_model_files
-import requests
+from getmodelfiles import get_model_files, load_model
+from utils.remote_predict import remote_predict_func
 from io import BytesIO
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
@@ -63,22 +62,19 @@ class LimeImage(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict_proba
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 else:
-                    mlp = joblib.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a locally stored model or a URL for the prediction function of the model must be provided.",BAD_REQUEST
         
@@ -110,11 +106,12 @@ class LimeImage(Resource):
 
             kwargsData = dict(
                 top_labels=params_json["top_classes"],
+                random_seed=params_json["seed"],
                 segmentation_fn=SegmentationAlgorithm(segmentation_fn,**{k: v for k, v in segmentation_kwargs.items() if v is not None}))
 
             size=(params_json["png_width"]/100.0,params_json["png_height"]/100.0)
         
-            explainer = lime_image.LimeImageExplainer()
+            explainer = lime_image.LimeImageExplainer(random_state=params_json["seed"])
             explanation = explainer.explain_instance(instance[0], classifier_fn=predic_func,**{k: v for k, v in kwargsData.items() if v is not None})
 
             fig, axes = plt.subplots(1,len(explanation.top_labels)+1, figsize = size)
@@ -204,6 +201,13 @@ class LimeImage(Resource):
                     "default": 1200,
                     "range":None,
                     "required":False
+                    },
+                "seed":{
+                    "description": "Integer used as seed for the perturbations and the segmentation. Requests with the same seed get the same explanation, which is then served from the cache. Random if not provided.",
+                    "type":"int",
+                    "default": None,
+                    "range":None,
+                    "required":False
                     }
                 },
         "output_description":{
@@ -3,21 +3,20 @@ from flask_restful import Resource
 from flask import request
 from PIL import Image
 import os
-import torch.nn as nn
 import numpy as np
 import tensorflow as tf
 import torch
-import h5py
-import heapq
 import json
 from io import BytesIO
 import matplotlib.pyplot as plt
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_feature_extractor
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector, PIL_to_base64
-from utils.img_processing import normalize_img, normalise_image_batch, denormalise_image_batch
+from utils.img_processing import normalize_img, denormalise_image_batch
 from utils.validation import validate_params
-from sklearn.metrics.pairwise import euclidean_distances
+from utils.image_store import ImageDataset, derived_key
+from utils.embedding_index import load_embedding_index
+from utils.cache import file_fingerprint
 import traceback
 
 class NearestNeighboursImage(Resource):
@@ -26,73 +25,18 @@ class NearestNeighboursImage(Resource):
         self.model_folder = model_folder
         self.upload_folder = upload_folder
         
-    def nn_data(self, label_raw, label, model_info, encoder, data_file,sample=None):
-        train_data = []
-        
-        if type(data_file)==str and os.path.isdir(data_file):
-            # classification image dataset in zipped folder
-            _folders = [_f for _f in os.listdir(data_file) if _f == label_raw]
-            if len(_folders)!=1:
-                raise Exception("No data found.")
-
-            _folder_path = os.path.join(data_file, _folders[0])
-            _files = [os.path.join(_folder_path, f) for f in os.listdir(_folder_path)]
-            train_data = np.asarray([np.array(Image.open(f)) for f in _files])
-
-            if sample!=None:
-                train_data=train_data[np.random.randint(train_data.shape[0], size=min(sample,len(train_data))), :]
-            print(train_data.shape)
-            train_data = normalise_image_batch(train_data, model_info)
-            train_encodings = encoder(train_data)
-
-            return train_data, train_encodings
-        
-        # if os.path.isfile(data_file):
-        #     # csv file, first column is column names, 1st column maybe index 
-        #     with open(data_file, 'r') as f:
-        #         header = next(f).split(' ')
-        #         header = [elem.strip() for elem in header]
-
-        #         while True:
-        #             try:
-        #                 s_instance = next(f)
-        #                 s_instance = s_instance.replace('\n', '')
-        #                 s_array = s_instance.split(',')
-        #                 if label == float(s_array[-1]):
-        #                     s_array = [float(s) for s in s_array][:-2]
-        #                     train_data.append(s_array)
-        #             except Exception as e: #end of rows
-        #                 train_data = np.asarray(train_data, dtype=float)
-        #                 train_data = train_data.reshape((train_data.shape[0],)+tuple(model_info["attributes"]["features"]["image"]["shape"]))
-        #                 train_encodings = encoder(train_data)
-        #                 return train_data, train_encodings        
-        
-        else:
-            header = next(data_file).split(',')
-            header = [elem.strip() for elem in header]
-
-            while True:
-                try:
-                    s_instance = next(data_file)
-                    s_instance = s_instance.replace('\n', '')
-                    s_array = s_instance.split(',')
-                    if label == float(s_array[-1]):
-                        s_array = [float(s) for s in s_array][:-1]
-                        train_data.append(s_array)
-                except Exception as e: #end of rows
-                    
-                    train_data=np.array(train_data)
-                    if sample!=None:
-                        train_data=train_data[np.random.randint(train_data.shape[0], size=min(sample,len(train_data))), :]
-                    train_data = np.asarray(train_data, dtype=float)
-                    train_data = train_data.reshape((train_data.shape[0],)+tuple(model_info["attributes"]["features"]["image"]["shape"]))
-                    train_encodings = encoder(train_data)
-                    return train_data, train_encodings                 
-                    
-    def knn(self, sample_size, data, query):
-        ecd = euclidean_distances(query, data)[0]
-        top = heapq.nsmallest(sample_size+1, range(len(ecd)), ecd.take)
-        return top
+    def nn_data(self, label_raw, label, model_info, encoder, data_file, model_key):
+        #returns the training images of the class and the index of their embeddings,
+        #which are computed once per model and dataset and saved with the data
+        dataset = ImageDataset(data_file, model_info)
+        class_key = dataset.class_key(label_raw, label)
+        count = dataset.count(class_key)
+        if count==0:
+            raise Exception("No data found.")
+        index = load_embedding_index(os.path.join(dataset.derived_folder, "embeddings"),
+                                     derived_key(model_key, dataset.fingerprint, class_key), count,
+                                     lambda idx: dataset.images(class_key, idx), encoder)
+        return dataset, class_key, index
  
     def post(self):
         params = request.json
@@ -133,22 +77,14 @@ class NearestNeighboursImage(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model = h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                     predic_func=model   
-                    def last_layer(x):
-                        new_model = tf.keras.models.Model([model.inputs], [model.layers[-2].output])
-                        return new_model(x)
-                    last_layer_func = last_layer
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    model = torch.load(model_file)
+                    model = load_model(model_file, backend)
                     predic_func=model.predict
-                    def last_layer(x):
-                        new_model = nn.Sequential(*list(model.children())[:-1])
-                        return new_model(x).flatten()
-                    last_layer_func = last_layer
                 else:
                     return "Only Tensorflow and PyTorch backends are supported.",BAD_REQUEST
+                last_layer_func = load_feature_extractor(model_file, backend)
             else:
                 return "A ML model must be provided.",BAD_REQUEST
         
@@ -175,9 +111,13 @@ class NearestNeighboursImage(Resource):
             no_neighbours = params_json["no_neighbours"]
             sample=params_json["samples"]
 
-            train_data, train_encodings = self.nn_data(instance_label_raw, instance_label, model_info, last_layer_func, data_file,sample=sample)
-            nn_indices = self.knn(no_neighbours, train_encodings, last_layer_func(instance))
-            nn_instances = np.array([train_data[n] for n in nn_indices[1:]])
+            dataset, class_key, index = self.nn_data(instance_label_raw, instance_label, model_info, last_layer_func, data_file, file_fingerprint(model_file.name))
+            rows=None
+            if sample!=None:
+                rng = np.random.default_rng(params_json["seed"])
+                rows = rng.choice(len(index), size=min(sample,len(index)), replace=False)
+            nn_indices, _ = index.query(last_layer_func(instance), no_neighbours+1, rows=rows)
+            nn_instances = dataset.images(class_key, nn_indices[1:])
             nn_instances = denormalise_image_batch(nn_instances, model_info)
 
             size=(params_json["png_width"]/100.0,params_json["png_height"]/100.0)
@@ -212,6 +152,10 @@ class NearestNeighboursImage(Resource):
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #the sampled background data is only reproducible with a seed
+        return params_json.get("samples") is None or params_json.get("seed") is not None
+
     def get(self,id=None):
         return {
         "_method_description": "Finds the nearest neighbours to a data instances based on minimum euclidean distance",
@@ -226,9 +170,9 @@ class NearestNeighboursImage(Resource):
                     "required":False
                     },
                 "samples":{
-                    "description": "Number of samples to use from the background data. A hundred samples are used by default.",
+                    "description": "Number of images of the predicted class randomly sampled to search the neighbours. All the images of the class are searched by default.",
                     "type":"int",
-                    "default": 100,
+                    "default": None,
                     "range":None,
                     "required":False
                     },
@@ -245,6 +189,13 @@ class NearestNeighboursImage(Resource):
                     "default": 600,
                     "range":None,
                     "required":False
+                    },
+                "seed":{
+                    "description": "Integer used as seed for the sampling of the background data. Requests with the same seed get the same explanation, which is then served from the cache. Random if not provided.",
+                    "type":"int",
+                    "default": None,
+                    "range":None,
+                    "required":False
                     }
                 },
         "output_description":{
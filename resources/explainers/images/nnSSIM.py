@@ -6,17 +6,16 @@ import os
 import numpy as np
 import tensorflow as tf
 import torch
-import h5py
 import json
 import matplotlib.pyplot as plt
 from io import BytesIO
-from skimage.metrics import structural_similarity
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector, PIL_to_base64
-from utils.img_processing import normalize_img, normalise_image_batch, denormalise_image_batch
-from utils.img_processing import normalise_image_batch
+from utils.img_processing import normalize_img, denormalise_image_batch
 from utils.validation import validate_params
+from utils.image_store import ImageDataset
+from utils.ssim import ssim_data_range, full_ssim, batch_ssim, downsample, thumbnail_factor, load_thumbnails
 import traceback
 
 class SSIMNearestNeighbours(Resource):
@@ -25,50 +24,14 @@ class SSIMNearestNeighbours(Resource):
         self.model_folder = model_folder
         self.upload_folder = upload_folder
         
-    def nn_data(self,label_raw, label,model_info, data_file,sample=None):
-        train_data = []
-
-        
-        if type(data_file)==str and os.path.isdir(data_file):
-            # classification image dataset in zipped folder
-            _folders = [_f for _f in os.listdir(data_file) if _f == label_raw]
-            if len(_folders)<1:
-                raise Exception("No data found.")
-
-            _folder_path = os.path.join(data_file, _folders[0])
-            _files = [os.path.join(_folder_path, f) for f in os.listdir(_folder_path)]
-            train_data=train_data+[np.array(Image.open(f)) for f in _files]
-            train_data=np.asarray(train_data)
-
-            if sample!=None:
-                sample_idx=np.random.randint(train_data.shape[0], size=min(sample,len(train_data)))
-                train_data=train_data[sample_idx,:]
-            train_data = normalise_image_batch(train_data, model_info)
-
-            return train_data
-           
-        else:
-            header = next(data_file).split(',')
-            header = [elem.strip() for elem in header]
-
-            while True:
-                try:
-                    s_instance = next(data_file)
-                    s_instance = s_instance.replace('\n', '')
-                    s_array = s_instance.split(',')
-                    if label == float(s_array[-1]):
-                        s_array = [float(s) for s in s_array][:-1]
-                        train_data.append(s_array)
-                except Exception as e: #end of rows
-                    train_data=np.asarray(train_data)
-
-                    if sample!=None:
-                        sample_idx=np.random.randint(train_data.shape[0], size=min(sample,len(train_data)))
-                        train_data=train_data[sample_idx,:]
-
-                    train_data = train_data.reshape((train_data.shape[0],)+tuple(model_info["attributes"]["features"]["image"]["shape"]))
-                    return train_data                 
-                   
+    def nn_data(self,label_raw, label,model_info, data_file):
+        #returns the training images of the predicted class and their thumbnails, which are used to preselect the candidates
+        dataset = ImageDataset(data_file, model_info)
+        class_key = dataset.class_key(label_raw, label)
+        if dataset.count(class_key)==0:
+            raise Exception("No data found.")
+        factor = thumbnail_factor(dataset.shape)
+        return dataset, class_key, factor, load_thumbnails(dataset, class_key, factor)
  
     def post(self):
         params = request.json
@@ -93,14 +56,23 @@ class SSIMNearestNeighbours(Resource):
         return self.explain(_id, instance, params_json)
     
 
-    def knn(self,no_neighbours,query,data,channel_axis):
-        similarities=np.array([structural_similarity(query,image,channel_axis=channel_axis) for image in data])
-        ind = np.argpartition(similarities, -(no_neighbours+1))[-(no_neighbours+1):]
-
+    def knn(self,no_neighbours,query,dataset,class_key,factor,thumbnails,channel_axis,data_range,shortlist,rows=None):
+        #coarse to fine: the SSIM of the thumbnails selects a shortlist of candidates, and only these are compared at full resolution
+        rows=np.arange(len(thumbnails)) if rows is None else np.asarray(rows)
+        k=no_neighbours+1
+        n=max(shortlist,k)
+        if len(rows)>n:
+            coarse=batch_ssim(downsample(query[np.newaxis],factor)[0],thumbnails[rows],data_range)
+            rows=rows[np.argpartition(coarse,-n)[-n:]]
+        candidates=dataset.images(class_key,rows)
+        similarities=np.array([full_ssim(query,image,data_range,channel_axis) for image in candidates])
+        print("Full resolution SSIM evaluations: " + str(len(rows)) + " of " + str(len(thumbnails)) + " images")
+
+        k=min(k,len(rows))
+        ind = np.argpartition(similarities, -k)[-k:]
         top=ind[np.argsort(similarities[ind])[::-1]]
 
-
-        return top,similarities[top]
+        return candidates[top],similarities[top],len(rows)
 
     def explain(self, model_id, instance, params_json):
         try:
@@ -117,11 +89,10 @@ class SSIMNearestNeighbours(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model = h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                     predic_func=model   
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    model = torch.load(model_file)
+                    model = load_model(model_file, backend)
                     predic_func=model.predict
                 else:
                     return "Only Tensorflow and PyTorch backends are supported.",BAD_REQUEST
@@ -164,9 +135,13 @@ class SSIMNearestNeighbours(Resource):
             if(instance.shape[-1]==3):
                 channel_axis=-1
 
-            train_data = self.nn_data(instance_label_raw, instance_label, model_info, data_file,sample=sample)
-            nn_indices,sims = self.knn(no_neighbours,instance,train_data,channel_axis)
-            nn_instances = np.array([train_data[n] for n in nn_indices[1:]])
+            dataset, class_key, factor, thumbnails = self.nn_data(instance_label_raw, instance_label, model_info, data_file)
+            rows=None
+            if sample!=None:
+                rows=np.random.default_rng(params_json["seed"]).choice(len(thumbnails), size=min(sample,len(thumbnails)), replace=False)
+            nn_instances,sims,evaluations = self.knn(no_neighbours,instance,dataset,class_key,factor,thumbnails,channel_axis,
+                                                     ssim_data_range(model_info),params_json["shortlist"],rows=rows)
+            nn_instances = nn_instances[1:]
             sims=(1+sims[1:])/2
             
             preds=predic_func(nn_instances)
@@ -207,11 +182,15 @@ class SSIMNearestNeighbours(Resource):
                 exp_json["Neighbour "+str(i)]=nn.tolist()
                 i=i+1
 
-            response={"type":"image","explanation":b64Image,"explanation_llm":exp_json}
+            response={"type":"image","explanation":b64Image,"explanation_llm":exp_json,"full_ssim_evaluations":evaluations}
             return response
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #the sampled images are only reproducible with a seed
+        return params_json.get("samples") is None or params_json.get("seed") is not None
+
     def get(self,id=None):
         return {
         "_method_description": "Finds the nearest neighbours to a data instances based on minimum euclidean distance",
@@ -226,12 +205,26 @@ class SSIMNearestNeighbours(Resource):
                         "required":False
                         },
                 "samples":{
-                    "description": "Number of samples to use from the background data. A hundred samples are used by default.",
+                    "description": "Number of images of the predicted class randomly sampled to search the neighbours. All the images of the class are searched by default.",
+                    "type":"int",
+                    "default": None,
+                    "range":None,
+                    "required":False
+                    },
+                "seed":{
+                    "description": "Integer used as seed for the sampling of the images. Requests with the same seed get the same explanation, which is then served from the cache. Random if not provided.",
                     "type":"int",
-                    "default": 100,
+                    "default": None,
                     "range":None,
                     "required":False
                     },                
+                "shortlist":{
+                    "description": "Number of candidates compared at full resolution. The candidates are the images most similar to the query when both are downsampled. Defaults to 50.",
+                    "type":"int",
+                    "default": 50,
+                    "range":None,
+                    "required":False
+                    },
                 "png_width":{
                     "description": "Width (in pixels) of the png image containing the explanation.",
                     "type":"int",
@@ -248,7 +241,8 @@ class SSIMNearestNeighbours(Resource):
                     }
                 },
         "output_description":{
-                "0":"This explanation presents the nearest neighbours of the query using Structural Similarity Index Measure (SSIM). Nearest neighbours are examples that are similar to the query with similar AI system outcomes."
+                "0":"This explanation presents the nearest neighbours of the query using Structural Similarity Index Measure (SSIM). Nearest neighbours are examples that are similar to the query with similar AI system outcomes. "
+                    "The response also includes the number of images compared at full resolution (full_ssim_evaluations), which can be used to tune the shortlist."
             },
 
         "meta":{
@@ -3,14 +3,15 @@ from flask_restful import Resource
 from flask import request
 from PIL import Image
 import tensorflow as tf
-import h5py
 import json
 import matplotlib.pyplot as plt
 import numpy as np
 from xplique.attributions import Rise
+from xplique.attributions.base import sanitize_input_output
+from xplique.commons import repeat_labels, batch_tensor
 from xplique.plots import plot_attributions
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model
 from utils import ontologyConstants
 from utils.base64 import base64_to_vector,PIL_to_base64
 from utils.img_processing import normalize_img
@@ -18,6 +19,42 @@ from utils.validation import validate_params
 import traceback
 
 
+class SeededRise(Rise):
+    #draws the masks and their crops from a generator of its own instead of the global TensorFlow generator,
+    #which is shared by the threads of the server
+
+    def __init__(self, model, seed, **kwargs):
+        super().__init__(model, **kwargs)
+        self.generator=tf.random.Generator.from_seed(seed)
+        grid=self.grid_size if isinstance(self.grid_size,tuple) else (self.grid_size,self.grid_size)
+        self.binary_masks=self.generator.uniform((self.nb_samples,*grid,1),0,1)<self.preservation_probability
+
+    def _apply_seeded_masks(self, single_input, binary_masks):
+        #same as Rise._apply_masks, with a stateless crop
+        upsampled_size=(int(single_input.shape[0]*(1.0+1.0/binary_masks.shape[1])),
+                        int(single_input.shape[1]*(1.0+1.0/binary_masks.shape[2])))
+        upsampled_masks=tf.image.resize(tf.cast(binary_masks,tf.float32),upsampled_size)
+        masks=tf.image.stateless_random_crop(upsampled_masks,(binary_masks.shape[0],*single_input.shape[:-1],1),
+                                             seed=self.generator.make_seeds(1)[:,0])
+        return tf.expand_dims(single_input,0)*masks, masks
+
+    @sanitize_input_output
+    def explain(self, inputs, targets=None):
+        rise_maps=None
+        batch_size=self.batch_size or self.nb_samples
+        for single_input, single_target in zip(inputs, targets):
+            rise_nominator=tf.zeros((*single_input.shape[:-1],1))
+            rise_denominator=tf.zeros((*single_input.shape[:-1],1))
+            for batch_masks in batch_tensor(self.binary_masks,batch_size):
+                masked_inputs, masks_upsampled = self._apply_seeded_masks(single_input,batch_masks)
+                repeated_targets=repeat_labels(single_target[tf.newaxis,:],len(batch_masks))
+                predictions=self.inference_function(self.model,masked_inputs,repeated_targets)
+                rise_nominator+=tf.reduce_sum(tf.reshape(predictions,(-1,1,1,1))*masks_upsampled,0)
+                rise_denominator+=tf.reduce_sum(masks_upsampled,0)
+            rise_map=(rise_nominator/(rise_denominator+Rise.EPSILON))[tf.newaxis,:,:,0]
+            rise_maps=rise_map if rise_maps is None else tf.concat([rise_maps,rise_map],axis=0)
+        return rise_maps
+
 
 class RiseExp(Resource):
 
@@ -57,8 +94,7 @@ class RiseExp(Resource):
 
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend, linear_output=True)
                 else:
                     return "This method only supports Tensorflow/Keras models.",BAD_REQUEST
             else:
@@ -91,11 +127,10 @@ class RiseExp(Resource):
 
 
             ## Generating explanation
-            try:
-                mlp.layers[-1].activation = tf.keras.activations.linear
-            except:
-                pass
-            explainer=Rise(mlp,nb_samples=nb_samples, grid_size=grid_size)
+            if params_json["seed"] is not None:
+                explainer=SeededRise(mlp,params_json["seed"],nb_samples=nb_samples, grid_size=grid_size)
+            else:
+                explainer=Rise(mlp,nb_samples=nb_samples, grid_size=grid_size)
             explanations = explainer(instance, tf.one_hot(np.array([target_class]), depth=len(output_names), axis=-1))
 
             plot_attributions(explanations, np.expand_dims(im,axis=0), img_size=2., cmap='jet', alpha=0.4,absolute_value=True, clip_percentile=0.5)
@@ -140,6 +175,13 @@ class RiseExp(Resource):
                     "range":None,
                     "required":False
                     },
+                "seed":{
+                    "description": "Integer used as seed for the generation of the masks. Requests with the same seed get the same explanation, which is then served from the cache. Random if not provided.",
+                    "type":"int",
+                    "default": None,
+                    "range":None,
+                    "required":False
+                    }
                 },
         "output_description":{
                 "saliency_map":"Displays an image that highlights the most relevant pixels to the target class. Red pixels indicate greater importance."
@@ -4,18 +4,18 @@ import tensorflow as tf
 import torch
 import numpy as np
 import joblib
-import h5py
 import json
-from alibi.explainers import ALE, plot_ale
+from alibi.explainers import plot_ale
 import math
 import matplotlib.pyplot as plt
 from io import BytesIO
 from PIL import Image
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
-import requests
+from utils.ale_store import ale_explanation
 import traceback
 
 class Ale(Resource):
@@ -50,7 +50,7 @@ class Ale(Resource):
 
             ## loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file)
+                dataframe = load_data(data_file)
             else:
                 return "The training data file was not provided.", BAD_REQUEST
 
@@ -66,29 +66,12 @@ class Ale(Resource):
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
       
@@ -96,11 +79,11 @@ class Ale(Resource):
             kwargsData2 = dict(features=None)
             if "features_to_show" in params_json and params_json["features_to_show"]:
                 features = json.loads(params_json["features_to_show"]) if isinstance(params_json["features_to_show"],str) else params_json["features_to_show"]
-                kwargsData2["features"]=[dataframe.columns.get_loc(c) for c in features if c in dataframe]
+                kwargsData2["features"]=[feature_names.index(c) for c in features if c in feature_names]
 
-
-            proba_ale_lr = ALE(predic_func, **{k: v for k, v in kwargsData.items()})
-            proba_exp_lr = proba_ale_lr.explain(dataframe.drop([target_name], axis=1, inplace=False).to_numpy(),**{k: v for k, v in kwargsData2.items()})
+            #the ALE of each feature is computed once per model and shared with IREX
+            proba_exp_lr = ale_explanation(predic_func, dataframe.drop([target_name], axis=1, inplace=False).to_numpy(), feature_names, output_names,
+                                           features=kwargsData2["features"], model_file=model_file, data_file=data_file, url=url, backend=backend)
         
         
             if(kwargsData2["features"]!=None):
@@ -164,7 +147,7 @@ class Ale(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             feature_names=list(dataframe.columns)
@@ -6,13 +6,12 @@ import torch
 import pandas as pd
 import numpy as np
 import joblib
-import h5py
 import json
-from alibi.explainers import AnchorTabular
-from getmodelfiles import get_model_files
-import requests
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.dataframe_processing import normalize_dataframe
+from utils.anchors_tabular import load_anchor_explainer, explain_anchor, ANCHORS_SAMPLING_THREADS
 import traceback
 
 class Anchors(Resource):
@@ -52,7 +51,7 @@ class Anchors(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -61,7 +60,7 @@ class Anchors(Resource):
             backend = model_info["backend"] 
             target_name=model_info["attributes"]["target_names"][0]
             features=model_info["attributes"]["features"]
-            dataframe.drop([target_name], axis=1, inplace=True)
+            dataframe=dataframe.drop([target_name], axis=1)
             feature_names=list(dataframe.columns)
 
             categorical_names={}
@@ -72,29 +71,12 @@ class Anchors(Resource):
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.", BAD_REQUEST
 
@@ -104,6 +86,12 @@ class Anchors(Resource):
             kwargsData2 = dict(threshold=0.95)
             if "threshold" in params_json:
                 kwargsData2["threshold"] = float(params_json["threshold"])
+            if "batch_size" in params_json:
+                kwargsData2["batch_size"] = int(params_json["batch_size"])
+            if "coverage_samples" in params_json:
+                kwargsData2["coverage_samples"] = int(params_json["coverage_samples"])
+            if "sampling_threads" in params_json:
+                kwargsData2["threads"] = max(int(params_json["sampling_threads"]),1)
 
             #normalize instance
             df_inst=pd.DataFrame([instance.values()],columns=instance.keys())
@@ -112,23 +100,27 @@ class Anchors(Resource):
             df_inst=df_inst[feature_names]
             norm_instance=normalize_dataframe(df_inst,model_info).to_numpy()
 
-            # Create data
-            explainer = AnchorTabular(predic_func, **{k: v for k, v in kwargsData.items()})
-
-            explainer.fit(dataframe.to_numpy(), disc_perc=(25, 50, 75))
+            #the explainer is fitted once per model and training data
+            explainer = load_anchor_explainer(predic_func, dataframe.to_numpy(), kwargsData, model_file=model_file, data_file=data_file, url=url)
         
-            explanation = explainer.explain(norm_instance, **{k: v for k, v in kwargsData2.items()})
+            explanation, counter = explain_anchor(explainer, norm_instance, **{k: v for k, v in kwargsData2.items()})
             print(explanation.anchor)
             if explanation.anchor:
                 ret = dict(anchor=(' AND '.join(explanation.anchor)),precision=explanation.precision, coverage=explanation.coverage)
             else:
                 ret = dict(anchor=(' AND '.join(explanation.anchor)),precision=explanation.precision[0], coverage=explanation.coverage)
             exp_json=json.loads(json.dumps(ret))
-            return {"type":"dict","explanation":exp_json,"explanation_llm":exp_json}
+            sampling={"model_calls":counter.calls,"predicted_samples":counter.samples,
+                      "coverage_samples":int(explanation.meta["params"]["coverage_samples"])}
+            return {"type":"dict","explanation":exp_json,"explanation_llm":exp_json,"sampling":sampling}
 
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #alibi samples with the global random generator, so the anchors cannot be reproduced
+        return False
+
     def get(self,id=None):
         return {
         "_method_description": "Anchors provide local explanations in the form of simple boolean rules with a precision score and a "
@@ -148,10 +140,32 @@ class Anchors(Resource):
                     "default": 0.95,
                     "range":[0,1],
                     "required":False
+                    },
+                "batch_size": {
+                    "description": "Number of perturbed samples predicted by the model at once to estimate the precision of a candidate anchor. Default is 100.",
+                    "type":"int",
+                    "default": 100,
+                    "range":None,
+                    "required":False
+                    },
+                "coverage_samples": {
+                    "description": "Number of samples drawn to estimate the coverage of the anchors. These samples are not predicted by the model. Default is 10000.",
+                    "type":"int",
+                    "default": 10000,
+                    "range":None,
+                    "required":False
+                    },
+                "sampling_threads": {
+                    "description": "Number of threads sampling and predicting the candidate anchors of each round of the search in parallel. Default is "+str(ANCHORS_SAMPLING_THREADS)+".",
+                    "type":"int",
+                    "default": ANCHORS_SAMPLING_THREADS,
+                    "range":None,
+                    "required":False
                     }
                 },
         "output_description":{
-                "anchor_json": "A JSON object with the boolean rule (anchor) that was found, and values for its precision and coverage (scope in which that rules applies to similar instances)."
+                "anchor_json": "A JSON object with the boolean rule (anchor) that was found, and values for its precision and coverage (scope in which that rules applies to similar instances).",
+                "sampling": "The number of calls made to the model and of samples predicted during the search, and the number of samples used to estimate the coverage."
                },
 
             "meta":{
@@ -4,11 +4,11 @@ from flask_restful import Resource
 import joblib
 import json
 import pandas as pd
-from explainerdashboard import ClassifierExplainer
 from explainerdashboard.dashboard_components.classifier_components import ConfusionMatrixComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
+from utils.dashboard_explainers import dashboard_explainer
 import traceback
 
 class ConfusionMatrix(Resource):
@@ -41,7 +41,7 @@ class ConfusionMatrix(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -56,19 +56,17 @@ class ConfusionMatrix(Resource):
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "This explainer only supports scikit-learn-based models",BAD_REQUEST
             else:
                 return "Model file was not uploaded.",BAD_REQUEST
 
-            if model_task in ontologyConstants.CLASSIFICATION_URIS:
-                explainer = ClassifierExplainer(model, dataframe.drop([target_name], axis=1, inplace=False), dataframe[target_name],labels=output_names)
-            else:
+            if model_task not in ontologyConstants.CLASSIFICATION_URIS:
                 return "AI task not supported. This explainer only supports scikit-learn-based classifiers.",BAD_REQUEST
 
             #getting params from request
@@ -79,9 +77,10 @@ class ConfusionMatrix(Resource):
                 except Exception as e:
                     return "Could not convert to cuttoff to float: " + str(e),BAD_REQUEST
 
-            exp=ConfusionMatrixComponent(explainer,cutoff=cutoff,binary=False)
-            exp_json=json.loads(pd.DataFrame(explainer.confusion_matrix(cutoff, binary=False), columns=["Predicted " + s for s in output_names], index=["Actual " + s for s in output_names]).to_json(orient="index"))
-            exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
+            with dashboard_explainer(model,dataframe,model_info,model_file,data_file) as explainer:
+                exp=ConfusionMatrixComponent(explainer,cutoff=cutoff,binary=False)
+                exp_json=json.loads(pd.DataFrame(explainer.confusion_matrix(cutoff, binary=False), columns=["Predicted " + s for s in output_names], index=["Actual " + s for s in output_names]).to_json(orient="index"))
+                exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
 
             response={"type":"html","explanation":exp_html,"explanation_llm":exp_json}
             return response
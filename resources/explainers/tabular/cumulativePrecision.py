@@ -2,11 +2,11 @@ from http.client import BAD_REQUEST
 from flask_restful import Resource
 import joblib
 import json
-from explainerdashboard import ClassifierExplainer
 from explainerdashboard.dashboard_components.classifier_components import CumulativePrecisionComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
+from utils.dashboard_explainers import dashboard_explainer
 import traceback
 
 class CumulativePrecision(Resource):
@@ -41,27 +41,27 @@ class CumulativePrecision(Resource):
 
         #loading data
         if data_file!=None:
-            dataframe = joblib.load(data_file) ##error handling?
+            dataframe = load_data(data_file) ##error handling?
         else:
             return "The training data file was not provided.",BAD_REQUEST
 
         #loading model (.pkl file)
         if model_file!=None:
             if backend in ontologyConstants.SKLEARN_URIS:
-                model = joblib.load(model_file)
+                model = load_model(model_file, backend)
             elif backend in ontologyConstants.XGBOOST_URIS:
-                model = joblib.load(model_file)
+                model = load_model(model_file, backend)
             elif backend in ontologyConstants.LIGHTGBM_URIS:
-                model = joblib.load(model_file)
+                model = load_model(model_file, backend)
             else:
                 return "This explainer only supports scikit-learn-based models",BAD_REQUEST
         else:
             return "Model file was not uploaded.",BAD_REQUEST
 
-        return self.explain(model,model_info,dataframe,params_json)
+        return self.explain(model,model_info,dataframe,params_json,model_file,data_file)
 
 
-    def explain(self,model,model_info,data,params_json):
+    def explain(self,model,model_info,data,params_json,model_file=None,data_file=None):
         try:
             #getting params from model info
             target_name=model_info["attributes"]["target_names"][0]
@@ -75,9 +75,9 @@ class CumulativePrecision(Resource):
                 except Exception as e:
                     return "Could not convert to label to string: " + str(e),BAD_REQUEST
 
-            explainer = ClassifierExplainer(model, data.drop([target_name], axis=1, inplace=False), data[target_name],labels=output_names)
-            exp=CumulativePrecisionComponent(explainer,pos_label=label)
-            exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
+            with dashboard_explainer(model,data,model_info,model_file,data_file) as explainer:
+                exp=CumulativePrecisionComponent(explainer,pos_label=label)
+                exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
 
             response={"type":"html","explanation":exp_html,"explanation_llm":exp_html}
             return response
@@ -1,16 +1,16 @@
 from http.client import BAD_REQUEST
 from flask_restful import Resource
 import tensorflow as tf
-import h5py
 import json
 import dice_ml
 import pandas as pd
 import joblib
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from flask import request
 from utils import ontologyConstants
 from utils.dataframe_processing import denormalize_dataframe
 from utils.dataframe_processing import normalize_dataframe
+from utils.dice_explainers import load_dice, gradient_explainer, generate_counterfactuals
 import traceback
 
 class DicePrivate(Resource):
@@ -46,7 +46,7 @@ class DicePrivate(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) 
+                dataframe = load_data(data_file) 
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -86,8 +86,7 @@ class DicePrivate(Resource):
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
                     back="TF2"
-                    model=h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                     if(backend==ontologyConstants.TENSORFLOW_URIS[0]):
                         back="TF1"
                 else:
@@ -100,31 +99,40 @@ class DicePrivate(Resource):
             desired_class=0
             if(len(features[outcome_name]["values_raw"])==2): #binary classification
                 desired_class="opposite"
-            kwargsData2 = dict(desired_class=desired_class,total_CFs=3)
-            if "num_cfs" in params_json:
-               kwargsData2["total_CFs"] = int(params_json["num_cfs"])
             if "desired_class" in params_json:
                 if params_json["desired_class"]!="opposite":
                     if params_json["desired_class"] in output_names:
                         desired_class = output_names.index(params_json["desired_class"])
+            kwargsData2 = dict(desired_class=desired_class,total_CFs=3)
+            if "num_cfs" in params_json:
+               kwargsData2["total_CFs"] = int(params_json["num_cfs"])
+            if "min_iter" in params_json:
+               kwargsData2["min_iter"] = int(params_json["min_iter"])
+            if "max_iter" in params_json:
+               kwargsData2["max_iter"] = int(params_json["max_iter"])
+            if "learning_rate" in params_json:
+               kwargsData2["learning_rate"] = float(params_json["learning_rate"])
             if "features_to_vary" in params_json and params_json["features_to_vary"]:
                kwargsData2["features_to_vary"] = params_json["features_to_vary"] if params_json["features_to_vary"]=="all" else json.loads(params_json["features_to_vary"])
 
-            # Create data
-            d = dice_ml.Data(**{k: v for k, v in kwargsData.items() if v is not None})
-  
-            # Create model
-            m = dice_ml.Model(model=model, backend=back)
-
-            # Create CFs generator using random
             method="random"
             if "method" in params_json:
                method = params_json["method"]
-            exp = dice_ml.Dice(d, m, method=method)
 
-       
+            # Create CFs generator (data, model and explainer are prepared once per model and settings). TF2 models
+            # optimize all the counterfactuals together with a compiled loss and optimizer step
+            def make_explainer():
+                d = dice_ml.Data(**{k: v for k, v in kwargsData.items() if v is not None})
+                m = dice_ml.Model(model=model, backend=back)
+                if back=="TF2":
+                    return gradient_explainer(d, m)
+                return dice_ml.Dice(d, m, method=method)
+
+            exp = load_dice(make_explainer, model_file, None, dict(kwargsData,backend=back,method=method))
+
             # Generate counterfactuals
-            e1 = exp.generate_counterfactuals(norm_instance, **{k: v for k, v in kwargsData2.items() if v is not None})
+            stats=[]
+            e1 = generate_counterfactuals(exp, norm_instance, False, stats, **{k: v for k, v in kwargsData2.items() if v is not None})
 
             #saving
             str_html=''
@@ -154,7 +162,7 @@ class DicePrivate(Resource):
 
             
         
-            response={"type":"html","explanation":str_html,"explanation_llm":json.loads(e1.to_json())}
+            response={"type":"html","explanation":str_html,"explanation_llm":json.loads(e1.to_json()),"optimization":stats[0] if stats else None}
             return response
 
         except:
@@ -198,10 +206,32 @@ class DicePrivate(Resource):
                     "default": "random",
                     "range":["random","genetic"],
                     "required":False
+                    },
+                "min_iter": {
+                    "description": "Minimum number of iterations of the optimization. Lower values reduce the latency, at the expense of counterfactuals further from the instance or less diverse.",
+                    "type":"int",
+                    "default": 500,
+                    "range":None,
+                    "required":False
+                    },
+                "max_iter": {
+                    "description": "Maximum number of iterations of the optimization. The optimization stops earlier once the loss converges and all the counterfactuals are valid.",
+                    "type":"int",
+                    "default": 5000,
+                    "range":None,
+                    "required":False
+                    },
+                "learning_rate": {
+                    "description": "Learning rate of the optimizer.",
+                    "type":"float",
+                    "default": 0.05,
+                    "range":None,
+                    "required":False
                     }
         },
         "output_description":{
-                "html_table": "An html page containing a table with the original instance compared against a table with the generated couterfactuals."
+                "html_table": "An html page containing a table with the original instance compared against a table with the generated couterfactuals. "
+                              "The response also includes the number of iterations run, whether the optimization converged, and its time (optimization_time) and total time (wall_time) in seconds."
                },
         "meta":{
                 "modelAccess":"File",
@@ -218,7 +248,7 @@ class DicePrivate(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
@@ -4,14 +4,14 @@ import tensorflow as tf
 import torch
 import pandas as pd
 import joblib
-import h5py
 import json
 import dice_ml
 import numpy as np
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from flask import request
 from utils import ontologyConstants
 from utils.dataframe_processing import normalize_dataframe,denormalize_dataframe
+from utils.dice_explainers import load_dice, kd_explainer, generate_counterfactuals
 import traceback
 
 class DicePublic(Resource):
@@ -47,7 +47,7 @@ class DicePublic(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) 
+                dataframe = load_data(data_file) 
             else:
                 return"The training data file was not provided.",BAD_REQUEST
 
@@ -63,8 +63,9 @@ class DicePublic(Resource):
                 feature_names.remove(target)
 
 
-            #normalize instance
-            df_inst=pd.DataFrame([instance.values()],columns=instance.keys())
+            #normalize instances
+            instances=instance if isinstance(instance,list) else [instance]
+            df_inst=pd.DataFrame(instances)
             for target_name in target_names:    
                 if target_name in df_inst.columns:
                     df_inst.drop([target_name], axis=1, inplace=True)
@@ -76,7 +77,7 @@ class DicePublic(Resource):
                 if features[feature]["data_type"]=="numerical":
                     cont_features.append(feature)
                 else:
-                    dataframe[feature]=dataframe[feature].astype("int")
+                    dataframe=dataframe.astype({feature:"int"})
                     norm_instance[feature]=norm_instance[feature].astype("int")
 
             ## loading model
@@ -85,16 +86,15 @@ class DicePublic(Resource):
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
                     back="TF2"
-                    model=h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                     if(backend==ontologyConstants.TENSORFLOW_URIS[0]):
                         back="TF1"
                 elif backend in ontologyConstants.SKLEARN_URIS:
                     back="sklearn"
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.PYTORCH_URIS:
                     back="PYT"
-                    model = torch.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "The backend is not supported: " + backend,BAD_REQUEST
             else:
@@ -110,35 +110,34 @@ class DicePublic(Resource):
             desired_class=0
             if(len(output_names)==2): #binary classification
                 desired_class="opposite"
-            kwargsData2 = dict(desired_class=desired_class,total_CFs=3)
-            if "num_cfs" in params_json:
-               kwargsData2["total_CFs"] = int(params_json["num_cfs"])
             if "desired_class" in params_json:
                 if params_json["desired_class"]!="opposite":
                     if params_json["desired_class"] in output_names:
                         desired_class = output_names.index(params_json["desired_class"])
+            kwargsData2 = dict(desired_class=desired_class,total_CFs=3)
+            if "num_cfs" in params_json:
+               kwargsData2["total_CFs"] = int(params_json["num_cfs"])
             if "features_to_vary" in params_json and params_json["features_to_vary"]:
                kwargsData2["features_to_vary"] = params_json["features_to_vary"] if params_json["features_to_vary"]=="all" else json.loads(params_json["features_to_vary"])
 
-            # Create data
-            d = dice_ml.Data(dataframe=dataframe, **{k: v for k, v in kwargsData.items() if v is not None})
-
-            # Create model
-            m = dice_ml.Model(model=model, backend=back)
-
-            # Create CFs generator
             method="random"
             if "method" in params_json:
                method = params_json["method"]
-            exp = dice_ml.Dice(d, m, method=method)
+            if method=="kdtrees":
+                method="kdtree"
 
+            # Create CFs generator (data, model and explainer are prepared once per model and settings)
+            def make_explainer():
+                d = dice_ml.Data(dataframe=dataframe, **{k: v for k, v in kwargsData.items() if v is not None})
+                m = dice_ml.Model(model=model, backend=back)
+                if method=="kdtree" and back=="sklearn":
+                    return kd_explainer(d, m)
+                return dice_ml.Dice(d, m, method=method)
 
-       
-            # Generate counterfactuals
-            if backend in ontologyConstants.SKLEARN_URIS:
-                e1 = exp.generate_counterfactuals(query_instances=norm_instance, **{k: v for k, v in kwargsData2.items() if v is not None})
-            else:
-                e1 = exp.generate_counterfactuals(norm_instance, **{k: v for k, v in kwargsData2.items() if v is not None})
+            exp = load_dice(make_explainer, model_file, data_file, dict(kwargsData,backend=back,method=method))
+
+            # Generate counterfactuals. The sklearn explainers take all the instances in a single call
+            e1 = generate_counterfactuals(exp, norm_instance, back=="sklearn", **{k: v for k, v in kwargsData2.items() if v is not None})
         
             #saving
             str_html=''
@@ -173,6 +172,10 @@ class DicePublic(Resource):
         except:
             return traceback.format_exc(), 500
 
+    def cacheable(self, params_json):
+        #the random and genetic methods sample with the global random generators, only the KD tree search can be reproduced
+        return params_json.get("method") in ("kdtree","kdtrees")
+
     def get(self,id=None):
        
         base_dict={
@@ -180,7 +183,7 @@ class DicePublic(Resource):
                            "the 'id' string, the 'instance', and the 'params' dictionary (optional) containing the configuration parameters of the explainer."
                            " These arguments are described below.",
         "id": "Identifier of the ML model that was stored locally.",
-        "instance": "Array representing a row with the feature values of an instance without including the target class.",
+        "instance": "Array representing a row with the feature values of an instance without including the target class. A list of instances can also be given, in which case the counterfactuals of all of them are generated at once.",
         "params": { 
                 "desired_class": {
                     "description": "String representing the desired counterfactual class. Defaults to class 0 for multiclass problems and to opposite class for binary class problems. You may also use the string 'opposite' for binary classification",
@@ -207,7 +210,7 @@ class DicePublic(Resource):
                     "description": "The method used for counterfactual generation. The supported methods for private data are: 'random' (random sampling) and 'genetic' (genetic algorithms). Defaults to 'random'.",
                     "type":"string",
                     "default": "random",
-                    "range":["random","genetic","kdtrees"],
+                    "range":["random","genetic","kdtree"],
                     "required":False
                     },
                 "permitted_range":{
@@ -236,7 +239,7 @@ class DicePublic(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
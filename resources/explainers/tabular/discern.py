@@ -3,10 +3,8 @@ from flask_restful import Resource
 import json
 import pandas as pd
 import numpy as np
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 import joblib
-import h5py
-from html2image import Html2Image
 from flask import request
 from discern import discern_tabular
 import tensorflow as tf
@@ -52,7 +50,7 @@ class DisCERN(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) 
+                dataframe = load_data(data_file) 
             else:
                 raise Exception("The training data file was not provided.")
 
@@ -75,10 +73,9 @@ class DisCERN(Resource):
             model=None
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "This method currently supports Tensoflow and scikit-learn classification models only.",BAD_REQUEST
             else:
@@ -206,7 +203,7 @@ class DisCERN(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
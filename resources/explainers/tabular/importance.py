@@ -3,15 +3,15 @@ from flask_restful import Resource
 import tensorflow as tf
 import torch
 import joblib
-import h5py
 import json
 import dalex as dx
 from flask import request
 from PIL import Image
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
+from utils.permutation_importance import variable_importance, IMPORTANCE_B, IMPORTANCE_N, IMPORTANCE_PROCESSES
 import traceback
 
 class Importance(Resource):
@@ -45,7 +45,7 @@ class Importance(Resource):
 
             ## loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file)
+                dataframe = load_data(data_file)
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -69,12 +69,11 @@ class Importance(Resource):
             ## loading model
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    model=tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    model = torch.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "The model backend is not supported: " + backend,BAD_REQUEST
             else:
@@ -84,9 +83,17 @@ class Importance(Resource):
             kwargsData = dict()
             if "variables" in params_json and params_json["variables"]:
                 kwargsData["variables"] = json.loads(params_json["variables"]) if isinstance(params_json["variables"],str) else params_json["variables"]
-       
-            explainer = dx.Explainer(model, dataframe.drop(target_names, axis=1, inplace=False), dataframe.loc[:, target_names],model_type=model_task)
-            parts = explainer.model_parts(**{k: v for k, v in kwargsData.items()})
+            if "B" in params_json:
+                kwargsData["B"] = max(int(params_json["B"]),1)
+            if "N" in params_json:
+                kwargsData["N"] = int(params_json["N"]) if params_json["N"] and int(params_json["N"])>0 else None
+            if "processes" in params_json:
+                kwargsData["processes"] = max(int(params_json["processes"]),1)
+
+            #the loss after each permutation round is saved per model, so repeated requests and requests for a subset
+            #of the variables do not call the model
+            make_explainer = lambda: dx.Explainer(model, dataframe.drop(target_names, axis=1, inplace=False), dataframe.loc[:, target_names],model_type=model_task)
+            parts = variable_importance(make_explainer, model_task, model_file=model_file, data_file=data_file, backend=backend, **{k: v for k, v in kwargsData.items()})
             fig=parts.plot(show=False)
         
             #saving
@@ -117,6 +124,27 @@ class Importance(Resource):
                     "default": None,
                     "range":None,
                     "required":False
+                    },
+                "B": {
+                    "description": "Number of permutation rounds. The importance of a feature is the average loss over the rounds. Defaults to "+str(IMPORTANCE_B)+".",
+                    "type":"int",
+                    "default": IMPORTANCE_B,
+                    "range":None,
+                    "required":False
+                    },
+                "N": {
+                    "description": "Number of rows of the training data sampled in each round. Use 0 to use all the rows. Defaults to "+str(IMPORTANCE_N)+".",
+                    "type":"int",
+                    "default": IMPORTANCE_N,
+                    "range":None,
+                    "required":False
+                    },
+                "processes": {
+                    "description": "Number of processes computing the permutation rounds in parallel. Defaults to "+str(IMPORTANCE_PROCESSES)+".",
+                    "type":"int",
+                    "default": IMPORTANCE_PROCESSES,
+                    "range":None,
+                    "required":False
                     }
                 },
         "output_description":{
@@ -137,7 +165,7 @@ class Importance(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             feature_names=list(dataframe.columns)
@@ -5,18 +5,17 @@ import tensorflow as tf
 import torch
 import numpy as np
 import joblib
-import h5py
 import json
-import requests
-from alibi.explainers import ALE
 import matplotlib.pyplot as plt
 import seaborn as sns
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from io import BytesIO
 from PIL import Image
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
+from utils.ale_store import ale_explanation
 import traceback
 
 
@@ -49,7 +48,7 @@ class IREX(Resource):
 
             ## loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             
             else:
                 return "The training data file was not provided.",BAD_REQUEST
@@ -66,34 +65,17 @@ class IREX(Resource):
             feature_names.remove(target_name)
             kwargsData = dict(feature_names=feature_names,target_names=output_names)
 
-            dataframe.drop([target_name], axis=1, inplace=True)
+            dataframe=dataframe.drop([target_name], axis=1)
 
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
       
@@ -110,8 +92,9 @@ class IREX(Resource):
                 classes_to_show = [output_names.index(c) for c in params_json["classes_to_show"]]
 
 
-            proba_ale_lr = ALE(predic_func, **{k: v for k, v in kwargsData.items()})
-            proba_exp_lr = proba_ale_lr.explain(dataframe.to_numpy())
+            #the ALE of each feature is computed once per model and shared with the ALE explainer
+            proba_exp_lr = ale_explanation(predic_func, dataframe.to_numpy(), feature_names, output_names,
+                                           model_file=model_file, data_file=data_file, url=url, backend=backend)
 
             anomalies=[]
             for i in range(len(proba_exp_lr.ale_values)):
@@ -2,11 +2,11 @@ from http.client import BAD_REQUEST
 from flask_restful import Resource
 import joblib
 import json
-from explainerdashboard import ClassifierExplainer
 from explainerdashboard.dashboard_components.classifier_components import LiftCurveComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
+from utils.dashboard_explainers import dashboard_explainer
 import traceback
 
 
@@ -40,7 +40,7 @@ class LiftCurve(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -55,19 +55,17 @@ class LiftCurve(Resource):
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "This explainer only supports scikit-learn-based models",BAD_REQUEST
             else:
                 return "Model file was not uploaded.",BAD_REQUEST
 
-            if model_task in ontologyConstants.CLASSIFICATION_URIS:
-                explainer = ClassifierExplainer(model, dataframe.drop([target_name], axis=1, inplace=False), dataframe[target_name],labels=output_names)
-            else:
+            if model_task not in ontologyConstants.CLASSIFICATION_URIS:
                 return "AI task not supported. This explainer only supports scikit-learn-based classifiers.",BAD_REQUEST
 
             #getting params from request
@@ -84,17 +82,14 @@ class LiftCurve(Resource):
                 except Exception as e:
                     return "Could not convert to label to string: " + str(e),BAD_REQUEST
 
-        
-            if model_task in ontologyConstants.CLASSIFICATION_URIS:
-                explainer = ClassifierExplainer(model, dataframe.drop([target_name], axis=1, inplace=False), dataframe[target_name],labels=output_names)
-            else:
-                return "AI task not supported. This explainer only supports scikit-learn-based classifiers.",BAD_REQUEST
-            if label is None:
-                label=output_names[explainer.pos_label]
-            exp=LiftCurveComponent(explainer,title ="Lift Curve for Class " + str(label),pos_label=label,cutoff=cutoff)
-            exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
+            with dashboard_explainer(model,dataframe,model_info,model_file,data_file) as explainer:
+                if label is None:
+                    label=output_names[explainer.pos_label]
+                exp=LiftCurveComponent(explainer,title ="Lift Curve for Class " + str(label),pos_label=label,cutoff=cutoff)
+                exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
+                exp_json=json.loads(explainer.get_liftcurve_df().to_json(orient="index"))
 
-            response={"type":"html","explanation":exp_html,"explanation_llm":json.loads(explainer.get_liftcurve_df().to_json(orient="index"))}
+            response={"type":"html","explanation":exp_html,"explanation_llm":exp_json}
             return response
 
         except:
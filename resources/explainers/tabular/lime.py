@@ -6,17 +6,15 @@ import torch
 import pandas as pd
 import numpy as np
 import joblib
-import h5py
 import json
-import lime.lime_tabular
 import os
-from PIL import Image
-from getmodelfiles import get_model_files
-import requests
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.dataframe_processing import normalize_dataframe
-from utils.base64 import PIL_to_base64
-from html2image import Html2Image
+from utils.base64 import png_to_base64
+from utils.html_render import render_html
+from utils.lime_tabular import load_lime_explainer, with_seed, explain_instances
 import traceback
 
 class Lime(Resource):
@@ -55,7 +53,7 @@ class Lime(Resource):
 
             ## loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
         
@@ -90,36 +88,19 @@ class Lime(Resource):
                     categorical_features.append(i)
                     categorical_names.update({i:[ str(x) for x in features[feature]["values_raw"]]})
 
-            dataframe.drop([target_name], axis=1, inplace=True)
+            dataframe=dataframe.drop([target_name], axis=1)
 
             kwargsData = dict(mode=model_task, feature_names=feature_names, categorical_features=categorical_features,categorical_names=categorical_names, class_names=class_names)
 
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
@@ -135,17 +116,30 @@ class Lime(Resource):
                     kwargsData2["top_labels"]=None
             if "num_features" in params_json:
                 kwargsData2["num_features"] = int(params_json["num_features"])
+            seed=None
+            if "seed" in params_json and params_json["seed"] is not None:
+                seed=int(params_json["seed"])
 
-            #normalize instance
-            df_inst=pd.DataFrame([instance.values()],columns=instance.keys())
+            #normalize instances
+            instances=instance if isinstance(instance,list) else [instance]
+            df_inst=pd.DataFrame(instances)
             if target_name in df_inst.columns:
                 df_inst.drop([target_name], axis=1, inplace=True)
             df_inst=df_inst[feature_names]
-            norm_instance=normalize_dataframe(df_inst,model_info).to_numpy()[0]
+            norm_instances=normalize_dataframe(df_inst,model_info).to_numpy()
 
-            explainer = lime.lime_tabular.LimeTabularExplainer(dataframe.to_numpy(),
-                                                              **{k: v for k, v in kwargsData.items() if v is not None})
-            explanation = explainer.explain_instance(norm_instance, predic_func, **{k: v for k, v in kwargsData2.items() if v is not None}) 
+            #the explainer is fitted once per data file, and each request gets its own copy seeded with the given seed
+            explainer = load_lime_explainer(data_file,dataframe.to_numpy(),{k: v for k, v in kwargsData.items() if v is not None})
+            kwargsData2={k: v for k, v in kwargsData2.items() if v is not None}
+            if len(norm_instances)==1:
+                explanations = [with_seed(explainer,seed).explain_instance(norm_instances[0], predic_func, **kwargsData2)]
+            else:
+                #the i-th instance uses seed+i, and the perturbations of all the instances are predicted with a single call
+                if seed is None:
+                    seeds=np.random.randint(0,2**31-len(norm_instances),size=len(norm_instances)).tolist()
+                else:
+                    seeds=[seed+i for i in range(len(norm_instances))]
+                explanations = explain_instances(explainer, norm_instances, predic_func, seeds, **kwargsData2)
 
         
             #formatting json explanation
@@ -159,30 +153,14 @@ class Lime(Resource):
 
             ##saving
 
-            hti = Html2Image()
-            # hti.output_path= os.getcwd()
-            hti.output_path= "/tmp"
-            size=(10, 4)
-            css="body {background: white;}"
+            size=None
             if "png_height" in params_json and "png_width" in params_json:
-                size=(int(params_json["png_width"])/100,int(params_json["png_height"])/100)
-                print("1")
-                print(explanation.as_html())
-                hti.screenshot(html_str=explanation.as_html(),css_str=css, save_as="temp.png", size=size)  
-                print("2")
-                print(explanation.as_html())
-            else:
-                print("3")
-                print(explanation.as_html())
-                hti.screenshot(html_str=explanation.as_html(),css_str=css, save_as="temp.png",size=(1300,350))
-                print("4")
-                print(explanation.as_html())
-
-            im=Image.open("/tmp/temp.png")
-            b64Image=PIL_to_base64(im)
-            # os.remove("temp.png")
-
-            response={"type":"image","explanation":b64Image,"explanation_llm":json.loads(json.dumps(dict(explanation.as_list(explanation.available_labels()[0]))))}
+                size=(int(params_json["png_width"]),int(params_json["png_height"]))
+            responses=[]
+            for explanation in explanations:
+                b64Image=png_to_base64(render_html(explanation.as_html(),size=size))
+                responses.append({"type":"image","explanation":b64Image,"explanation_llm":json.loads(json.dumps(dict(explanation.as_list(explanation.available_labels()[0]))))})
+            response=responses if isinstance(instance,list) else responses[0]
             return response
 
         except:
@@ -197,7 +175,7 @@ class Lime(Resource):
                            "the 'id', the 'instance', the 'url'(optional),  and the 'params' dictionary (optiohnal) with the configuration parameters of the method. "
                            "These arguments are described below.",
         "id": "Identifier of the ML model that was stored locally.",
-        "instance": "Array representing a row with the feature values of an instance not including the target class.",
+        "instance": "Array representing a row with the feature values of an instance not including the target class. A list of instances can also be given, in which case a list with the explanation of each instance is returned.",
         "url": "External URL of the prediction function. Ignored if a model file was uploaded to the server. "
                "This url must be able to handle a POST request receiving a (multi-dimensional) array of N data points as inputs (instances represented as arrays). It must return a array of N outputs (predictions for each instance).",
         "params": { 
@@ -235,6 +213,13 @@ class Lime(Resource):
                         "default": 400,
                         "range":None,
                         "required":False
+                    },
+                    "seed": {
+                        "description": "Integer used as seed for the perturbations of the instance. Requests with the same seed get the same explanation, which is then served from the cache. When a list of instances is given, the i-th instance uses seed+i. Random if not provided.",
+                        "type":"int",
+                        "default": None,
+                        "range":None,
+                        "required":False
                     }
             },
         "output_description":{
@@ -256,7 +241,7 @@ class Lime(Resource):
             except:
                 return base_dict
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             feature_names=list(dataframe.columns)
@@ -4,16 +4,14 @@ import tensorflow as tf
 import torch
 import pandas as pd
 import joblib
-import h5py
 import json
 import numpy as np
-import requests
 from nice import NICE
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.dataframe_processing import normalize_dataframe,denormalize_dataframe
-import requests
 from flask import request
 import traceback
 
@@ -53,7 +51,7 @@ class Nice(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) 
+                dataframe = load_data(data_file) 
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -78,29 +76,12 @@ class Nice(Resource):
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
@@ -204,7 +185,7 @@ class Nice(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
@@ -2,7 +2,7 @@ from http.client import BAD_REQUEST
 from flask_restful import Resource
 import json
 import pandas as pd
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 import joblib
 from pertCF.PertCF import PertCF
 from flask import request
@@ -47,7 +47,7 @@ class Pertcf(Resource):
 
         #loading data
         if data_file!=None:
-            data = joblib.load(data_file) 
+            data = load_data(data_file) 
         else:
             return "The training data file was not provided.",BAD_REQUEST
 
@@ -55,7 +55,7 @@ class Pertcf(Resource):
         model=None
         if model_file!=None:
             if backend in ontologyConstants.SKLEARN_URIS:
-                model = joblib.load(model_file)
+                model = load_model(model_file, backend)
             else:
                 return "This method currently supports scikit-learn classification models only.",BAD_REQUEST
         else:
@@ -214,7 +214,7 @@ class Pertcf(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             feature_names=list(dataframe.columns)
@@ -2,11 +2,11 @@ from http.client import BAD_REQUEST
 from flask_restful import Resource
 import joblib
 import json
-from explainerdashboard import RegressionExplainer
 from explainerdashboard.dashboard_components.regression_components import PredictedVsActualComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
+from utils.dashboard_explainers import dashboard_explainer
 import traceback
 
 
@@ -39,7 +39,7 @@ class RegressionPredictedVsActual(Resource):
 
         #loading data
         if data_file!=None:
-            dataframe = joblib.load(data_file) ##error handling?
+            dataframe = load_data(data_file) ##error handling?
 
         else:
             return "The training data file was not provided.",BAD_REQUEST
@@ -47,27 +47,24 @@ class RegressionPredictedVsActual(Resource):
         #loading model (.pkl file)
         if model_file!=None:
             if backend in ontologyConstants.SKLEARN_URIS:
-                model = joblib.load(model_file)
+                model = load_model(model_file, backend)
             elif backend in ontologyConstants.XGBOOST_URIS:
-                model = joblib.load(model_file)
+                model = load_model(model_file, backend)
             elif backend in ontologyConstants.LIGHTGBM_URIS:
-                model = joblib.load(model_file)
+                model = load_model(model_file, backend)
             else:
                 return "This explainer only supports scikit-learn-based models.",BAD_REQUEST
         else:
             return "Model file was not uploaded.",BAD_REQUEST
 
-        return self.explain(model,model_info,dataframe)
+        return self.explain(model,model_info,dataframe,model_file,data_file)
 
 
-    def explain(self,model,model_info,data):
+    def explain(self,model,model_info,data,model_file=None,data_file=None):
         try:
-            #getting params from model info
-            target_name=model_info["attributes"]["target_names"][0]
-
-            explainer = RegressionExplainer(model, data.drop([target_name], axis=1, inplace=False), data[target_name],target=target_name)
-            exp=PredictedVsActualComponent(explainer)
-            exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
+            with dashboard_explainer(model,data,model_info,model_file,data_file) as explainer:
+                exp=PredictedVsActualComponent(explainer)
+                exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
 
             response={"type":"html","explanation":exp_html,"explanation_llm":exp_html}
             return response
@@ -2,11 +2,11 @@ from http.client import BAD_REQUEST
 from flask_restful import Resource
 import joblib
 import json
-from explainerdashboard import ClassifierExplainer
 from explainerdashboard.dashboard_components.classifier_components import RocAucComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
+from utils.dashboard_explainers import dashboard_explainer
 import traceback
 
 
@@ -47,18 +47,18 @@ class ROCAUC(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "This explainer only supports scikit-learn-based models",BAD_REQUEST
             else:
@@ -81,15 +81,14 @@ class ROCAUC(Resource):
                     return "Could not convert to label to string: " + str(e),BAD_REQUEST
 
         
-            if model_task in ontologyConstants.CLASSIFICATION_URIS:
-                explainer = ClassifierExplainer(model, dataframe.drop([target_name], axis=1, inplace=False), dataframe[target_name],labels=output_names)
-            else:
+            if model_task not in ontologyConstants.CLASSIFICATION_URIS:
                 return "AI task not supported. This explainer only supports scikit-learn-based classifiers.",BAD_REQUEST
-            if label is None:
-                label=output_names[explainer.pos_label]
-            exp=RocAucComponent(explainer,title ="ROC AUC Plot for Class " + str(label),pos_label=label,cutoff=cutoff)
-            exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
-            exp_json=explainer.roc_auc_curve()
+            with dashboard_explainer(model,dataframe,model_info,model_file,data_file) as explainer:
+                if label is None:
+                    label=output_names[explainer.pos_label]
+                exp=RocAucComponent(explainer,title ="ROC AUC Plot for Class " + str(label),pos_label=label,cutoff=cutoff)
+                exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
+                exp_json=explainer.roc_auc_curve()
             exp_json["fpr"]=exp_json["fpr"].tolist()
             exp_json["tpr"]=exp_json["tpr"].tolist()
             exp_json["thresholds"]=exp_json["thresholds"].tolist()
@@ -3,13 +3,12 @@ import matplotlib.pyplot as plt
 import tensorflow as tf
 import numpy as np
 import joblib
-import h5py
 import json
 import shap
 import pandas as pd
 from flask_restful import Resource
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from io import BytesIO
 from PIL import Image
 from utils import ontologyConstants
@@ -44,7 +43,7 @@ class ShapDeepGlobal(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -53,7 +52,7 @@ class ShapDeepGlobal(Resource):
             backend = model_info["backend"]
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
-            dataframe.drop([target_name], axis=1, inplace=True)
+            dataframe=dataframe.drop([target_name], axis=1)
             feature_names=list(dataframe.columns)
         
             #getting params from request
@@ -68,8 +67,7 @@ class ShapDeepGlobal(Resource):
             #loading model (.h5 file)
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    model=tf.keras.models.load_model(model)
+                    model = load_model(model_file, backend)
                 else:
                     return "The model backend is not supported: " + backend,BAD_REQUEST
             else:
@@ -2,11 +2,11 @@ from http.client import BAD_REQUEST
 from flask_restful import Resource
 import joblib
 import json
-from explainerdashboard import ClassifierExplainer, RegressionExplainer
 from explainerdashboard.dashboard_components.shap_components import ShapDependenceComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
+from utils.dashboard_explainers import dashboard_explainer
 import traceback
 
 
@@ -41,7 +41,7 @@ class ShapDependence(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -56,21 +56,17 @@ class ShapDependence(Resource):
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "This explainer only supports scikit-learn-based models",BAD_REQUEST
             else:
                 return "Model file was not uploaded.",BAD_REQUEST
 
-            if model_task in ontologyConstants.CLASSIFICATION_URIS:
-                explainer = ClassifierExplainer(model, dataframe.drop([target_name], axis=1, inplace=False), dataframe[target_name])
-            elif model_task in ontologyConstants.REGRESSION_URIS:
-                explainer = RegressionExplainer(model, dataframe.drop([target_name], axis=1, inplace=False), dataframe[target_name])
-            else:
+            if model_task not in ontologyConstants.CLASSIFICATION_URIS and model_task not in ontologyConstants.REGRESSION_URIS:
                 return "AI task not supported. This explainer only supports scikit-learn-based classifiers or regressors.",BAD_REQUEST
 
             #getting params from request
@@ -85,8 +81,9 @@ class ShapDependence(Resource):
                 if feat in features:
                     interaction_feature=feat
 
-            exp=ShapDependenceComponent(explainer,col=feature,color_col=interaction_feature)
-            exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
+            with dashboard_explainer(model,dataframe,model_info,model_file,data_file) as explainer:
+                exp=ShapDependenceComponent(explainer,col=feature,color_col=interaction_feature)
+                exp_html=exp.to_html().replace('\n', ' ').replace("\"","'")
 
             response={"type":"html","explanation":exp_html,"explanation_llm":exp_html}
             return response
@@ -136,7 +133,7 @@ class ShapDependence(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             feature_names=list(dataframe.columns)
@@ -1,21 +1,23 @@
 from http.client import BAD_REQUEST
+import time
 import matplotlib.pyplot as plt
 import tensorflow as tf
 import numpy as np
 import torch
 import joblib
-import h5py
 import json
 import shap
-import requests
 import pandas as pd
 from flask_restful import Resource
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from io import BytesIO
 from PIL import Image
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
+from utils.kernel_shap import load_background, sample_rows, kernel_shap_values, BACKGROUND_METHODS, KERNEL_SHAP_BACKGROUND_SIZE, KERNEL_SHAP_SAMPLE_SIZE
+from utils.jobs import report_progress
 import traceback
 
 class ShapKernelGlobal(Resource):
@@ -49,7 +51,7 @@ class ShapKernelGlobal(Resource):
         
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -58,7 +60,11 @@ class ShapKernelGlobal(Resource):
             backend = model_info["backend"]
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
-            dataframe.drop([target_name], axis=1, inplace=True)
+            #classification datasets are sampled by class
+            strata=None
+            if model_info["model_task"] in ontologyConstants.CLASSIFICATION_URIS:
+                strata=dataframe[target_name].to_numpy()
+            dataframe=dataframe.drop([target_name], axis=1)
             feature_names=list(dataframe.columns)
             kwargsData = dict(feature_names=feature_names, output_names=output_names)
         
@@ -70,39 +76,46 @@ class ShapKernelGlobal(Resource):
                     index=output_names.index(target_class)
                 except:
                     pass
+            background_size=KERNEL_SHAP_BACKGROUND_SIZE
+            if "background_size" in params_json:
+                try:
+                    background_size=int(params_json["background_size"])
+                except Exception as e:
+                    return "Could not convert background_size to integer: " + str(e),BAD_REQUEST
+            background_method="kmeans"
+            if "background_method" in params_json:
+                background_method=str(params_json["background_method"]).lower()
+                if background_method not in BACKGROUND_METHODS:
+                    return "The background_method must be one of " + str(BACKGROUND_METHODS) + ".",BAD_REQUEST
+            sample_size=KERNEL_SHAP_SAMPLE_SIZE
+            if "sample_size" in params_json:
+                try:
+                    sample_size=int(params_json["sample_size"])
+                except Exception as e:
+                    return "Could not convert sample_size to integer: " + str(e),BAD_REQUEST
 
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                    predictor=("model",model_file.name,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
+                predictor=("url",url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
-            #creating explanation
-            explainer = shap.KernelExplainer(predic_func, dataframe,**{k: v for k, v in kwargsData.items()})
-            shap_values = explainer.shap_values(dataframe)
+            #creating explanation. The background is summarized and a sample of the training data is explained in parallel chunks
+            start=time.time()
+            background, background_rows = load_background(data_file,dataframe.to_numpy(),background_size,background_method,strata)
+            training_rows=len(dataframe)
+            rows=sample_rows(training_rows,sample_size,strata)
+            dataframe=dataframe.iloc[rows]
+            shap_values, _ = kernel_shap_values(predic_func,background,dataframe.to_numpy(),predictor=predictor,kwargs=kwargsData,progress=report_progress)
+            wall_time=round(time.time()-start,3)
      
             if(len(np.array(shap_values).shape)==3 and index!=None): #multiclass shape: (#_of_classes, #_of_instances,#_of_features)
                 shap_values=shap_values[index]
@@ -123,7 +136,9 @@ class ShapKernelGlobal(Resource):
             plt.close()
         
             #Insert code for image uploading and getting url
-            response={"type":"image","explanation":b64Image,"explanation_llm":json.loads(pd.DataFrame(shap_values, columns=feature_names).to_json(orient="index"))}
+            response={"type":"image","explanation":b64Image,"explanation_llm":json.loads(pd.DataFrame(shap_values, columns=feature_names, index=dataframe.index).to_json(orient="index")),
+                      "sample_sizes":{"background":background_rows,"explained":len(rows),"training":training_rows},
+                      "wall_time":wall_time}
 
             return response
         except:
@@ -146,6 +161,27 @@ class ShapKernelGlobal(Resource):
                     "default": None,
                     "range":None,
                     "required":False
+                    },
+                "background_size": {
+                    "description":"Number of rows of the background data used to compute the Shapley values. The training data is summarized to this number of rows. Larger values are more accurate but slower.",
+                    "type":"int",
+                    "default": KERNEL_SHAP_BACKGROUND_SIZE,
+                    "range":None,
+                    "required":False
+                    },
+                "background_method": {
+                    "description":"Method used to summarize the background data: 'kmeans' uses the centres of k-means clusters and 'sample' a random sample of the training data, stratified by class for classifiers.",
+                    "type":"string",
+                    "default": "kmeans",
+                    "range":BACKGROUND_METHODS,
+                    "required":False
+                    },
+                "sample_size": {
+                    "description":"Number of instances of the training data that are explained, sampled at random (stratified by class for classifiers). The whole training data is explained if it has fewer instances.",
+                    "type":"int",
+                    "default": KERNEL_SHAP_SAMPLE_SIZE,
+                    "range":None,
+                    "required":False
                     }
                 },
         "output_description":{
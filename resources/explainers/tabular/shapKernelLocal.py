@@ -5,20 +5,45 @@ import torch
 import pandas as pd
 import numpy as np
 import joblib
-import h5py
 import json
 import shap
 from flask import request
 import matplotlib.pyplot as plt
 from PIL import Image
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
 from utils.dataframe_processing import normalize_dataframe
-import requests
+from utils.kernel_shap import load_background, KERNEL_SHAP_BACKGROUND_SIZE
 import traceback
 
+
+def plot_shap_values(plot_type, expected_value, shap_values, features, feature_names, target_name):
+    plt.switch_backend('agg')
+    if plot_type=="bar":
+        shap.plots._bar.bar_legacy(shap_values,features=features,feature_names=feature_names,show=False)
+    elif plot_type=="decision":
+        shap.decision_plot(expected_value,shap_values=shap_values,features=features,feature_names=feature_names)
+    elif plot_type=="force":
+        shap.plots._force.force(expected_value,shap_values=shap_values,features=features,feature_names=feature_names,out_names=target_name,matplotlib=True,show=False)
+    else:
+        if plot_type==None:
+            print("No plot type was specified. Defaulting to waterfall plot.")
+        elif plot_type!="waterfall":
+            print("No plot with the specified name was found. Defaulting to waterfall plot.")
+        shap.plots._waterfall.waterfall_legacy(expected_value,shap_values=shap_values,features=features,feature_names=feature_names,show=False)
+
+    ##saving
+    img_buf = BytesIO()
+    plt.savefig(img_buf,bbox_inches="tight")
+    im = Image.open(img_buf)
+    b64Image=PIL_to_base64(im)
+    plt.close()
+    return b64Image
+
+
 class ShapKernelLocal(Resource):
 
     def __init__(self,model_folder,upload_folder):
@@ -56,7 +81,7 @@ class ShapKernelLocal(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -65,7 +90,7 @@ class ShapKernelLocal(Resource):
             backend = model_info["backend"]
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
-            dataframe.drop([target_name], axis=1, inplace=True)
+            dataframe=dataframe.drop([target_name], axis=1)
             feature_names=list(dataframe.columns)
             kwargsData = dict(feature_names=feature_names, output_names=output_names)
        
@@ -80,83 +105,50 @@ class ShapKernelLocal(Resource):
             plot_type=None
             if "plot_type" in params_json:
                 plot_type=params_json["plot_type"]
+            background_size=KERNEL_SHAP_BACKGROUND_SIZE
+            if "background_size" in params_json:
+                try:
+                    background_size=int(params_json["background_size"])
+                except Exception as e:
+                    return "Could not convert background_size to integer: " + str(e),BAD_REQUEST
 
         
         
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
-            #normalize instance
-            df_inst=pd.DataFrame([instance.values()],columns=instance.keys())
+            #normalize instances. A list of instances is explained with a single call to shap_values
+            instances=instance if isinstance(instance,list) else [instance]
+            df_inst=pd.DataFrame(instances)
             if target_name in df_inst.columns:
                 df_inst.drop([target_name], axis=1, inplace=True)
             df_inst=df_inst[feature_names]
-            norm_instance=normalize_dataframe(df_inst,model_info).to_numpy()[0]
+            norm_instances=normalize_dataframe(df_inst,model_info).to_numpy()
 
-            # Create data
-            explainer = shap.KernelExplainer(predic_func, dataframe,**{k: v for k, v in kwargsData.items()})
-            shap_values = explainer.shap_values(np.expand_dims(norm_instance,axis=0))
-        
-            if(len(np.array(shap_values).shape)!=1):
-                explainer.expected_value=explainer.expected_value[index]
-                shap_values=shap_values[index]
-            
-            #plotting
-            plt.switch_backend('agg')
-            if plot_type=="bar":
-                shap.plots._bar.bar_legacy(shap_values[0],features=np.array(list(df_inst.to_dict("records")[0].values())),feature_names=kwargsData["feature_names"],show=False)
-            elif plot_type=="decision":
-                shap.decision_plot(explainer.expected_value,shap_values=shap_values[0],features=np.array(list(df_inst.to_dict("records")[0].values())),feature_names=kwargsData["feature_names"])
-            elif plot_type=="force":
-                    shap.plots._force.force(explainer.expected_value,shap_values=shap_values[0],features=np.array(list(df_inst.to_dict("records")[0].values())),feature_names=kwargsData["feature_names"],out_names=target_name,matplotlib=True,show=False)
-            else:
-                if plot_type==None:
-                    print("No plot type was specified. Defaulting to waterfall plot.")
-                elif plot_type!="waterfall":
-                    print("No plot with the specified name was found. Defaulting to waterfall plot.")
-                shap.plots._waterfall.waterfall_legacy(explainer.expected_value,shap_values=shap_values[0],features=np.array(list(df_inst.to_dict("records")[0].values())),feature_names=kwargsData["feature_names"],show=False)
-       
-            #saving force plot to html (DEPRECATED)
-            #additive_exp = shap.force_plot(explainer.expected_value, shap_values,features=np.array(instance),feature_names=kwargsData["feature_names"],out_names=out_names,show=False)
-        
-            #formatting json output
-            #shap_values = [x.tolist() for x in shap_values]
-            #ret=json.loads(json.dumps(shap_values))
+            #the training data is summarized once per model
+            background, _ = load_background(data_file,dataframe.to_numpy(),background_size)
+            explainer = shap.KernelExplainer(predic_func, background,**{k: v for k, v in kwargsData.items()})
+            shap_values = explainer.shap_values(norm_instances)
 
-            ##saving
-            img_buf = BytesIO()
-            plt.savefig(img_buf,bbox_inches="tight")
-            im = Image.open(img_buf)
-            b64Image=PIL_to_base64(im)
-            plt.close()
+            expected_value=explainer.expected_value
+            if isinstance(shap_values,list): #one array per class
+                expected_value=expected_value[index]
+                shap_values=shap_values[index]
 
-            response={"type":"image","explanation":b64Image,"explanation_llm":json.loads(pd.DataFrame(shap_values, columns=feature_names).to_json(orient="index"))}
+            responses=[]
+            for i in range(len(instances)):
+                b64Image=plot_shap_values(plot_type,expected_value,shap_values[i],df_inst.iloc[i].to_numpy(),feature_names,target_name)
+                responses.append({"type":"image","explanation":b64Image,"explanation_llm":json.loads(pd.DataFrame(shap_values[i:i+1], columns=feature_names).to_json(orient="index"))})
+            response=responses if isinstance(instance,list) else responses[0]
 
             return response
         except:
@@ -169,7 +161,7 @@ class ShapKernelLocal(Resource):
                            "the 'id', the 'instance', the 'url',  and the 'params' JSON with the configuration parameters of the method. "
                            "These arguments are described below.",
         "id": "Identifier of the ML model that was stored locally.",
-        "instance": "Array with the feature values of an instance without including the target class.",
+        "instance": "Array with the feature values of an instance without including the target class. A list of instances can also be given, in which case a list with the explanation of each instance is returned.",
         "url": "External URL of the prediction function. Ignored if a model file was uploaded to the server. "
                "This url must be able to handle a POST request receiving a (multi-dimensional) array of N data points as inputs (instances represented as arrays). It must return a array of N outputs (predictions for each instance).",
         "params": { 
@@ -186,6 +178,13 @@ class ShapKernelLocal(Resource):
                     "default": "waterfall",
                     "range":['waterfall','decision','force','bar'],
                     "required":False
+                    },
+                "background_size": {
+                    "description":"Number of rows of the background data used to compute the Shapley values. The training data is summarized to this number of rows with k-means. Larger values are more accurate but slower.",
+                    "type":"int",
+                    "default": KERNEL_SHAP_BACKGROUND_SIZE,
+                    "range":None,
+                    "required":False
                     }
                 },
 
@@ -9,9 +9,11 @@ from flask_restful import Resource
 from flask import request
 from PIL import Image
 from io import BytesIO
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
+from utils.tree_shap import tree_shap_values, tree_explainer, summary_rows, shap_aggregates
+from utils.jobs import report_progress
 import traceback
 
 class ShapTreeGlobal(Resource):
@@ -42,7 +44,7 @@ class ShapTreeGlobal(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -51,7 +53,7 @@ class ShapTreeGlobal(Resource):
             backend = model_info["backend"]
             target_name=model_info["attributes"]["target_names"][0]
             output_names=model_info["attributes"]["features"][target_name]["values_raw"]
-            dataframe.drop([target_name], axis=1, inplace=True)
+            dataframe=dataframe.drop([target_name], axis=1)
             feature_names=list(dataframe.columns)
             kwargsData = dict(feature_names=feature_names, output_names=output_names)
 
@@ -63,15 +65,18 @@ class ShapTreeGlobal(Resource):
                     index=output_names.index(target_class)
                 except:
                     pass
+            incremental=True
+            if "incremental" in params_json:
+                incremental=str(params_json["incremental"]).lower() not in ("false","0","no")
 
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "The model backend is not supported: " + backend,BAD_REQUEST
             else:
@@ -79,16 +84,19 @@ class ShapTreeGlobal(Resource):
 
 
 
-            #creating explanation
-            explainer = shap.Explainer(model,**{k: v for k, v in kwargsData.items()})
-            shap_values = explainer.shap_values(dataframe)
-           
-            if(len(np.array(shap_values).shape)==3): #multiclass shape: (#_of_classes, #_of_instances,#_of_features)
-                shap_values=shap_values[index]
+            #creating explanation. The values of the whole dataset are computed once and stored with the data
+            values, _ = tree_shap_values(model_file,data_file,dataframe,lambda: tree_explainer(model,backend,**{k: v for k, v in kwargsData.items()}),
+                                         incremental=incremental,progress=report_progress)
+
+            if values.shape[1]>1: #multiclass shape: (#_of_instances, #_of_classes, #_of_features)
+                shap_values=values[:,index,:]
+            else:
+                shap_values=values[:,0,:]
 
             #plotting
+            rows=summary_rows(len(shap_values))
             plt.switch_backend('agg')
-            shap.summary_plot(shap_values,features=dataframe,feature_names=explainer.feature_names,class_names=explainer.output_names)
+            shap.summary_plot(np.asarray(shap_values[rows]),features=dataframe.iloc[rows],feature_names=feature_names,class_names=output_names)
         
        
             #formatting json output
@@ -102,7 +110,7 @@ class ShapTreeGlobal(Resource):
             b64Image=PIL_to_base64(im)
             plt.close()
             #Insert code for image uploading and getting url
-            response={"type":"image","explanation":b64Image,"explanation_llm":json.loads(pd.DataFrame(shap_values, columns=feature_names).to_json(orient="index"))}
+            response={"type":"image","explanation":b64Image,"explanation_llm":shap_aggregates(shap_values,feature_names)}
 
             return response
         except:
@@ -122,6 +130,13 @@ class ShapTreeGlobal(Resource):
                     "default": None,
                     "range":None,
                     "required":False
+                    },
+                "incremental": {
+                    "description":"If true and rows were appended to the training data since the values were stored, only the new rows are explained. Otherwise, the values of the whole dataset are computed again.",
+                    "type":"boolean",
+                    "default": True,
+                    "range":[True,False],
+                    "required":False
                     }
                 },
         "output_description":{
@@ -7,11 +7,12 @@ import json
 import shap
 from flask import request
 import matplotlib.pyplot as plt
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from io import BytesIO
 from PIL import Image
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
+from utils.tree_shap import tree_explainer
 from utils.dataframe_processing import normalize_dataframe
 import traceback
 
@@ -49,7 +50,7 @@ class ShapTreeLocal(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -77,11 +78,11 @@ class ShapTreeLocal(Resource):
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "The model backend is not supported: " + backend,BAD_REQUEST
             else:
@@ -102,8 +103,8 @@ class ShapTreeLocal(Resource):
                 print(feature_names)
                 return "Could not normalize instance.",BAD_REQUEST
 
-            # Create explanation
-            explainer = shap.Explainer(model,**{k: v for k, v in kwargsData.items()})
+            # Create explanation. XGBoost and LightGBM models compute the contributions natively
+            explainer = tree_explainer(model,backend,**{k: v for k, v in kwargsData.items()})
             shap_values = explainer.shap_values(norm_instance)
 
             if(len(np.array(shap_values).shape)==3):
@@ -4,13 +4,13 @@ import joblib
 import json
 import math
 import matplotlib.pyplot as plt
-from sklearn.inspection import PartialDependenceDisplay
 from io import BytesIO
 from PIL import Image
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
+from utils.pdp_ice import load_curves, output_index, plot_ice, GRID_RESOLUTION, PDP_ICE_SAMPLE_ROWS, ICE_LINES
 import traceback
 
 
@@ -55,11 +55,11 @@ class SklearnICE(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
-            dataframe.drop(target_names,axis=1,inplace=True)
+            dataframe=dataframe.drop(target_names,axis=1)
 
             categorical_features=[]
             for feature in dataframe.columns:
@@ -73,11 +73,11 @@ class SklearnICE(Resource):
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "This explainer only supports scikit-learn-based models",BAD_REQUEST
             else:
@@ -97,19 +97,42 @@ class SklearnICE(Resource):
                 except:
                     pass
 
+            grid_resolution=GRID_RESOLUTION
+            if "grid_resolution" in params_json:
+                grid_resolution=int(params_json["grid_resolution"])
+            sample_size=PDP_ICE_SAMPLE_ROWS
+            if "sample_size" in params_json:
+                sample_size=int(params_json["sample_size"])
+            ice_lines=ICE_LINES
+            if "ice_lines" in params_json:
+                ice_lines=int(params_json["ice_lines"])
+            centered=False
+            if "centered" in params_json:
+                centered=str(params_json["centered"]).lower() in ("true","1","yes")
+
             if(len(output_names)>2 and target is None): #multiclass
                 target=1
 
             if(features is None):
                 features=[i for i in range(len(dataframe.columns))] #defaults to all features
 
-            fig, ax = plt.subplots(figsize=(18,math.ceil(len(features)/3)*6))
             features=[f for f in features if not categorical_features[f]]
 
             if(not features):
                 return {"type":"text","explanation":"ICE can only be plotted for continuous features and none were found."}
 
-            plot=PartialDependenceDisplay.from_estimator(model,dataframe,features,categorical_features=categorical_features,feature_names=dataframe.columns,kind="both",ax=ax,target=target)
+            #the curves of each feature are computed once per model, with a single prediction per chunk of the sampled instances
+            n_rows=math.ceil(len(features)/3)
+            fig, axes = plt.subplots(n_rows,min(3,len(features)),figsize=(18,n_rows*6),squeeze=False)
+            pd_results=[]
+            for ax, feature in zip(axes.flat,features):
+                grid, curves = load_curves(model,len(output_names)>0,dataframe,feature,categorical_features[feature],model_file=model_file,
+                                           data_file=data_file,grid_resolution=grid_resolution,sample_size=sample_size)
+                result=plot_ice(ax,grid,curves[output_index(curves,target)],dataframe.columns[feature],lines=ice_lines,centered=centered)
+                result["feature"]=dataframe.columns[feature]
+                pd_results.append(result)
+            for ax in axes.flat[len(features):]:
+                ax.set_visible(False)
 
             def parse_dict(x):
                 if hasattr(x, "tolist"): 
@@ -122,7 +145,7 @@ class SklearnICE(Resource):
             im = Image.open(img_buf)
             b64Image=PIL_to_base64(im)
 
-            response={"type":"html","explanation":b64Image,"explanation_llm":json.loads(json.dumps(plot.pd_results, default=parse_dict))}
+            response={"type":"html","explanation":b64Image,"explanation_llm":json.loads(json.dumps(pd_results, default=parse_dict))}
             return response
 
         except:
@@ -142,6 +165,34 @@ class SklearnICE(Resource):
                         "range":None,
                         "required":False
                         },
+                    "grid_resolution": {
+                        "description":"Number of equally spaced points of the grid of continuous features. Features with fewer unique values use them as the grid. Defaults to 100.",
+                        "type":"int",
+                        "default": GRID_RESOLUTION,
+                        "range":None,
+                        "required":False
+                        },
+                    "sample_size": {
+                        "description":"Number of training instances, sampled at random, whose predictions are averaged. Defaults to "+str(PDP_ICE_SAMPLE_ROWS)+".",
+                        "type":"int",
+                        "default": PDP_ICE_SAMPLE_ROWS,
+                        "range":None,
+                        "required":False
+                        },
+                    "ice_lines": {
+                        "description":"Maximum number of individual curves drawn. The plot also shows the 5-95 and 25-75 percentile bands of the curves of all the sampled instances. Defaults to 50.",
+                        "type":"int",
+                        "default": ICE_LINES,
+                        "range":None,
+                        "required":False
+                        },
+                    "centered": {
+                        "description":"If true, each curve is shifted to start at 0, so the bands show how the effect of the feature differs between instances. Defaults to false.",
+                        "type":"boolean",
+                        "default": False,
+                        "range":[True,False],
+                        "required":False
+                        },
         "output_description":{
                 "ICE_plot": "Shows the dependence between the target function and an input feature of interest. However, unlike a PDP, which shows the average effect of the input feature, an ICE plot visualizes the dependence of the prediction on a feature for each sample separately with one line per sample."
          },
@@ -163,7 +214,7 @@ class SklearnICE(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             feature_names=list(dataframe.columns)
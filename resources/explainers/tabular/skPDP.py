@@ -4,13 +4,13 @@ import joblib
 import json
 import math
 import matplotlib.pyplot as plt
-from sklearn.inspection import PartialDependenceDisplay
 from io import BytesIO
 from PIL import Image
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
+from utils.pdp_ice import load_curves, output_index, plot_pdp, GRID_RESOLUTION, PDP_ICE_SAMPLE_ROWS
 import traceback
 
 
@@ -55,11 +55,11 @@ class SklearnPDP(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = joblib.load(data_file) ##error handling?
+                dataframe = load_data(data_file) ##error handling?
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
-            dataframe.drop(target_names,axis=1,inplace=True)
+            dataframe=dataframe.drop(target_names,axis=1)
 
             categorical_features=[]
             for feature in dataframe.columns:
@@ -73,11 +73,11 @@ class SklearnPDP(Resource):
             #loading model (.pkl file)
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.XGBOOST_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 elif backend in ontologyConstants.LIGHTGBM_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
                 else:
                     return "This explainer only supports scikit-learn-based models",BAD_REQUEST
             else:
@@ -97,14 +97,31 @@ class SklearnPDP(Resource):
                 except:
                     pass
 
+            grid_resolution=GRID_RESOLUTION
+            if "grid_resolution" in params_json:
+                grid_resolution=int(params_json["grid_resolution"])
+            sample_size=PDP_ICE_SAMPLE_ROWS
+            if "sample_size" in params_json:
+                sample_size=int(params_json["sample_size"])
+
             if(len(output_names)>2 and target is None): #multiclass
                 target=1
 
             if(features is None):
                 features=[i for i in range(len(dataframe.columns))] #defaults to all features
 
-            fig, ax = plt.subplots(figsize=(18,math.ceil(len(features)/3)*6))
-            plot=PartialDependenceDisplay.from_estimator(model,dataframe,features,categorical_features=categorical_features,feature_names=dataframe.columns,kind="average",ax=ax,target=target)
+            #the curves of each feature are computed once per model, with a single prediction per chunk of the sampled instances
+            n_rows=math.ceil(len(features)/3)
+            fig, axes = plt.subplots(n_rows,min(3,len(features)),figsize=(18,n_rows*6),squeeze=False)
+            pd_results=[]
+            for ax, feature in zip(axes.flat,features):
+                grid, curves = load_curves(model,len(output_names)>0,dataframe,feature,categorical_features[feature],model_file=model_file,
+                                           data_file=data_file,grid_resolution=grid_resolution,sample_size=sample_size)
+                result=plot_pdp(ax,grid,curves[output_index(curves,target)],categorical_features[feature],dataframe.columns[feature])
+                result["feature"]=dataframe.columns[feature]
+                pd_results.append(result)
+            for ax in axes.flat[len(features):]:
+                ax.set_visible(False)
 
             def parse_dict(x):
                 if hasattr(x, "tolist"):  # numpy arrays have this
@@ -116,7 +133,7 @@ class SklearnPDP(Resource):
             im = Image.open(img_buf)
             b64Image=PIL_to_base64(im)
 
-            response={"type":"html","explanation":b64Image,"explanation_llm":json.loads(json.dumps(plot.pd_results, default=parse_dict))}
+            response={"type":"html","explanation":b64Image,"explanation_llm":json.loads(json.dumps(pd_results, default=parse_dict))}
             return response
         except:
             return traceback.format_exc(), 500
@@ -135,6 +152,20 @@ class SklearnPDP(Resource):
                         "range":None,
                         "required":False
                         },
+                    "grid_resolution": {
+                        "description":"Number of equally spaced points of the grid of continuous features. Features with fewer unique values use them as the grid. Defaults to 100.",
+                        "type":"int",
+                        "default": GRID_RESOLUTION,
+                        "range":None,
+                        "required":False
+                        },
+                    "sample_size": {
+                        "description":"Number of training instances, sampled at random, whose predictions are averaged. Defaults to "+str(PDP_ICE_SAMPLE_ROWS)+".",
+                        "type":"int",
+                        "default": PDP_ICE_SAMPLE_ROWS,
+                        "range":None,
+                        "required":False
+                        },
         "output_description":{
                 "partial_dependence_plot": "Show the dependence between the target response and a set of input features of interest, marginalizing over the values of all other input features (the 'complement' features). Intuitively, we can interpret the partial dependence as the expected target response as a function of the input features of interest."
          },
@@ -156,7 +187,7 @@ class SklearnPDP(Resource):
                 return base_dict
 
 
-            dataframe = joblib.load(data_file)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_name=model_info["attributes"]["target_names"][0]
             feature_names=list(dataframe.columns)
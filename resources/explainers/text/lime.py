@@ -5,17 +5,15 @@ import tensorflow as tf
 import torch
 import numpy as np
 import joblib
-import h5py
 import json
 import lime.lime_text
 import os
-from html2image import Html2Image
-from getmodelfiles import get_model_files
+from utils.html_render import render_html
+from getmodelfiles import get_model_files, load_predict_func
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
-from utils.base64 import PIL_to_base64
+from utils.base64 import png_to_base64
 from utils.validation import validate_params
-from PIL import Image
-import requests
 import traceback
 
 class LimeText(Resource):
@@ -65,35 +63,18 @@ class LimeText(Resource):
                 output_names=None
 
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
         
      
             # Create explainer
-            explainer = lime.lime_text.LimeTextExplainer(class_names=output_names)
+            explainer = lime.lime_text.LimeTextExplainer(class_names=output_names,random_state=params_json["seed"])
             kwargsData2 = dict(labels=None, top_labels=1, num_features=None)
 
             if params_json["top_classes"] and output_names: #if classification
@@ -115,19 +96,10 @@ class LimeText(Resource):
             #ret=json.loads(json.dumps(ret))
 
             #saving
-            hti = Html2Image()
-            hti.output_path= os.getcwd()
-
-            css="body {background: white;}"
-            if params_json["png_height"] and params_json["png_height"] in params_json:
+            size=(1920,1080)
+            if params_json["png_height"] and params_json["png_width"]:
                 size=(params_json["png_width"],params_json["png_height"])
-                hti.screenshot(html_str=explanation.as_html(), css_str=css, save_as="temp.png", size=size)   
-            else:
-                hti.screenshot(html_str=explanation.as_html(),css_str=css, save_as="temp.png")
-
-            im=Image.open("temp.png")
-            b64Image=PIL_to_base64(im)
-            os.remove("temp.png")
+            b64Image=png_to_base64(render_html(explanation.as_html(),size=size))
 
             response={"type":"image","explanation":b64Image,"explanation_llm":json.loads(json.dumps(dict(explanation.as_list(explanation.available_labels()[0]))))}
             return response
@@ -180,6 +152,13 @@ class LimeText(Resource):
                     "default": None,
                     "range":[100,4096],
                     "required":False
+                    },
+                "seed":{
+                    "description": "Integer used as seed for the perturbations of the text. Requests with the same seed get the same explanation, which is then served from the cache. Random if not provided.",
+                    "type":"int",
+                    "default": None,
+                    "range":None,
+                    "required":False
                     }
                 },
         "output_description":{
@@ -5,7 +5,7 @@ from flask_restful import Resource
 from flask import request
 import json
 import joblib
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from NLPClassifierExplainer.NLPClassificationExplainer import NLPClassificationExplainer
 from string import Template
 from utils import ontologyConstants
@@ -186,7 +186,7 @@ class NLPClassifierExpl(Resource):
 
             #loading data
             if data_file!=None:
-                tmp = joblib.load(data_file) ##error handling?
+                tmp = load_data(data_file) ##error handling?
                 source= tmp[feature_names[0]].values # tmp is a dataframe, turn it into a list of str
             else:
                 source = None
@@ -194,7 +194,7 @@ class NLPClassifierExpl(Resource):
             #load model
             if model_file!=None:
                 if backend in ontologyConstants.SKLEARN_URIS:
-                    model = joblib.load(model_file)
+                    model = load_model(model_file, backend)
             else:
                 return "The model file was not provided.",BAD_REQUEST
 
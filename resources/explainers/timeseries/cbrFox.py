@@ -6,7 +6,6 @@ import torch
 import numpy as np
 import pandas as pd
 import joblib
-import h5py
 import json
 from scipy import signal
 import matplotlib.pyplot as plt
@@ -14,11 +13,11 @@ from io import BytesIO
 from PIL import Image
 from statsmodels.nonparametric.smoothers_lowess import lowess
 from saveinfo import save_file_info
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.dataframe_processing import split_sequences, normalize_dataframe
 from utils.base64 import PIL_to_base64
-import requests
 import traceback
 
 
@@ -60,7 +59,7 @@ class CBRFox(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = pd.read_csv(data_file,header=0)
+                dataframe = load_data(data_file)
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -79,7 +78,7 @@ class CBRFox(Resource):
                     break 
             
             if time_feature is not None:
-                dataframe.drop([time_feature], axis=1,inplace=True)
+                dataframe=dataframe.drop([time_feature], axis=1)
                 feature_names.remove(time_feature)
 
             #denormalizing instance
@@ -95,29 +94,12 @@ class CBRFox(Resource):
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
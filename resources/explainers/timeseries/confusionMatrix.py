@@ -4,14 +4,13 @@ import joblib
 import json
 import tensorflow as tf
 import torch
-import requests
-import h5py
 import numpy as np
 import pandas as pd
 from explainerdashboard import ClassifierExplainer
 from explainerdashboard.dashboard_components.classifier_components import ConfusionMatrixComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 import traceback
 
@@ -49,7 +48,7 @@ class TSConfusionMatrix(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = pd.read_csv(data_file,header=0)
+                dataframe = load_data(data_file)
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -66,28 +65,25 @@ class TSConfusionMatrix(Resource):
             predic_func=None
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
+                    mlp = load_model(model_file, backend)
                     try:
                         predic_func=mlp.predict_proba
                     except:
                         predic_func=mlp.predict
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 else:
                     try:
-                        mlp = joblib.load(model_file)
+                        mlp = load_model(model_file, backend)
                         predic_func=mlp.predict
                     except Exception as e:
                         return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
@@ -4,14 +4,13 @@ from flask import request
 import tensorflow as tf
 import pandas as pd
 import numpy as np
-import h5py
 import json
 import plotly.express as px
 from tensorflow import keras
 from io import BytesIO
 from PIL import Image
 from sklearn.neighbors import NearestNeighbors
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
 from utils import ontologyConstants
 from utils.dataframe_processing import split_sequences, normalize_dataframe
 from utils.base64 import PIL_to_base64
@@ -53,7 +52,7 @@ class IGenCBR(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = pd.read_csv(data_file,header=0)
+                dataframe = load_data(data_file)
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -73,7 +72,7 @@ class IGenCBR(Resource):
             
 
             if time_feature is not None:
-                dataframe.drop([time_feature], axis=1,inplace=True)
+                dataframe=dataframe.drop([time_feature], axis=1)
                 feature_names.remove(time_feature)
 
             input_features=[]
@@ -92,9 +91,8 @@ class IGenCBR(Resource):
             #loading model
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    model = tf.keras.models.load_model(model,compile=False)
-                    model.compile()
+                    #the model is shared with other requests and only used to predict, so it is not compiled
+                    model = load_model(model_file, backend)
                 else:
                     return "This method currently supports Tensoflow models only.",BAD_REQUEST
             else:
@@ -327,7 +325,7 @@ class IGenCBR(Resource):
             except:
                 return base_dict
 
-            dataframe = pd.read_csv(data_file,header=0)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_names=model_info["attributes"]["target_names"]
             features=model_info["attributes"]["features"]
@@ -340,7 +338,7 @@ class IGenCBR(Resource):
                     break 
 
             if time_feature is not None:
-                dataframe.drop([time_feature], axis=1,inplace=True)
+                dataframe=dataframe.drop([time_feature], axis=1)
                 feature_names.remove(time_feature)
         
             for target in target_names:
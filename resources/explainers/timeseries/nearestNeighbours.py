@@ -7,12 +7,11 @@ import json
 import tensorflow as tf
 import torch
 import plotly.express as px
-import h5py
 import json
 import joblib
-import requests
 from tslearn.neighbors import KNeighborsTimeSeries
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_predict_func, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 import traceback
 
@@ -56,7 +55,7 @@ class TSNearestNeighbours(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = pd.read_csv(data_file,header=0)
+                dataframe = load_data(data_file)
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -76,29 +75,12 @@ class TSNearestNeighbours(Resource):
             ## getting predict function
             predic_func=None
             if model_file!=None:
-                if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
-                    predic_func=mlp
-                elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
-                    try:
-                        predic_func=mlp.predict_proba
-                    except:
-                        predic_func=mlp.predict
-                elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
-                    predic_func=mlp.predict
-                else:
-                    try:
-                        mlp = joblib.load(model_file)
-                        predic_func=mlp.predict
-                    except Exception as e:
-                        return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
+                try:
+                    predic_func=load_predict_func(model_file,backend)
+                except Exception as e:
+                    return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
             #check univariate
@@ -194,13 +176,13 @@ class TSNearestNeighbours(Resource):
             except:
                 return base_dict
 
-            dataframe = pd.read_csv(data_file,header=0)
+            dataframe = load_data(data_file)
             model_info=json.load(model_info_file)
             target_names=model_info["attributes"]["target_names"]
             features=list(model_info["attributes"]["features"].keys())
             for target in target_names:
                 features.remove(target)
-            dataframe.drop(target_names,axis=1,inplace=True)
+            dataframe=dataframe.drop(target_names,axis=1)
 
 
             base_dict["params"]["n_neighbours"]["range"]=[1,dataframe.shape[0]]
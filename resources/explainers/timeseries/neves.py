@@ -5,14 +5,13 @@ import tensorflow as tf
 import torch
 import pandas as pd
 import numpy as np
-import h5py
 import json
 import joblib
-import requests
 import matplotlib.pyplot as plt
 from io import BytesIO
 from PIL import Image
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 from utils.base64 import PIL_to_base64
 import traceback
@@ -58,7 +57,7 @@ class Neves(Resource):
 
             #loading data
             if data_file!=None:
-                dataframe = pd.read_csv(data_file,header=0)
+                dataframe = load_data(data_file)
             else:
                 return "The training data file was not provided.",BAD_REQUEST
 
@@ -69,7 +68,7 @@ class Neves(Resource):
             features=list(model_info["attributes"]["features"].keys())
             for target in target_names:
                 features.remove(target)
-            dataframe.drop(target_names,axis=1,inplace=True)
+            dataframe=dataframe.drop(target_names,axis=1)
             feature=features[0]
 
 
@@ -91,29 +90,26 @@ class Neves(Resource):
             predic_func=None
             if model_file!=None:
                 if backend in ontologyConstants.TENSORFLOW_URIS:
-                    model=h5py.File(model_file, 'w')
-                    mlp = tf.keras.models.load_model(model)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp
                 elif backend in ontologyConstants.SKLEARN_URIS:
-                    mlp = joblib.load(model_file)
+                    mlp = load_model(model_file, backend)
                     try:
                         predic_func=mlp.predict_proba
                     except:
                         predic_func=mlp.predict
                         model_type="class"
                 elif backend in ontologyConstants.PYTORCH_URIS:
-                    mlp = torch.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 else:
                     try:
-                        mlp = joblib.load(model_file)
+                        mlp = load_model(model_file, backend)
                         predic_func=mlp.predict
                     except Exception as e:
                         return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
             elif url!=None:
-                def predict(X):
-                    return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-                predic_func=predict
+                predic_func=remote_predict_func(url)
             else:
                 return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
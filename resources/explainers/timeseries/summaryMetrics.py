@@ -6,13 +6,12 @@ import numpy as np
 import pandas as pd
 import tensorflow as tf
 import torch
-import requests
-import h5py
 from explainerdashboard import ClassifierExplainer, RegressionExplainer
 from explainerdashboard.dashboard_components.regression_components import RegressionModelSummaryComponent
 from explainerdashboard.dashboard_components.classifier_components import ClassifierModelSummaryComponent
 from flask import request
-from getmodelfiles import get_model_files
+from getmodelfiles import get_model_files, load_model, load_data
+from utils.remote_predict import remote_predict_func
 from utils import ontologyConstants
 import traceback
 
@@ -51,7 +50,7 @@ class TSSummaryMetrics(Resource):
 
         #loading data
         if data_file!=None:
-            dataframe = pd.read_csv(data_file,header=0)
+            dataframe = load_data(data_file)
         else:
             return "The training data file was not provided.",BAD_REQUEST
 
@@ -59,28 +58,25 @@ class TSSummaryMetrics(Resource):
         predic_func=None
         if model_file!=None:
             if backend in ontologyConstants.TENSORFLOW_URIS:
-                model=h5py.File(model_file, 'w')
-                mlp = tf.keras.models.load_model(model)
+                mlp = load_model(model_file, backend)
                 predic_func=mlp.predict
             elif backend in ontologyConstants.SKLEARN_URIS:
-                mlp = joblib.load(model_file)
+                mlp = load_model(model_file, backend)
                 try:
                     predic_func=mlp.predict_proba
                 except:
                     predic_func=mlp.predict
             elif backend in ontologyConstants.PYTORCH_URIS:
-                mlp = torch.load(model_file)
+                mlp = load_model(model_file, backend)
                 predic_func=mlp.predict
             else:
                 try:
-                    mlp = joblib.load(model_file)
+                    mlp = load_model(model_file, backend)
                     predic_func=mlp.predict
                 except Exception as e:
                     return "Could not extract prediction function from model: " + str(e),BAD_REQUEST
         elif url!=None:
-            def predict(X):
-                return np.array(json.loads(requests.post(url, data=dict(inputs=str(X.tolist()))).text))
-            predic_func=predict
+            predic_func=remote_predict_func(url)
         else:
             return "Either a stored model or a valid URL for the prediction function must be provided.",BAD_REQUEST
 
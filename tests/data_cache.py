@@ -0,0 +1,66 @@
+import os
+import tempfile
+import joblib
+import numpy as np
+import pandas as pd
+from getmodelfiles import load_data
+
+#the cached training data must not change whatever the explainers do with their copy: each operation either works
+#on the copy or raises because the shared values are read-only. Run it with the pandas version pinned in requirements.txt
+folder = tempfile.mkdtemp()
+path = os.path.join(folder, "x_data.csv")
+pd.DataFrame({"a": [1.0, 2.0, np.nan], "b": [3.0, 4.0, 5.0], "c": ["x", "y", "z"], "t": [0, 1, 0]}).to_csv(path, index=False)
+expected = pd.read_csv(path)
+
+
+def replace_column(df):
+    df["a"] = df["a"] * 10
+
+
+def add_column(df):
+    df["n"] = 1
+
+
+def set_value(df):
+    df.loc[0, "b"] = 99.0
+
+
+def write_into_values(df):
+    df[["a", "b"]].values[0, 0] = 7.0
+
+
+def copy_and_set_value(df):
+    df = df.copy()
+    df.loc[0, "b"] = 99.0
+
+
+operations = {
+    "drop inplace": lambda df: df.drop(["t"], axis=1, inplace=True),
+    "replace column": replace_column,
+    "add column": add_column,
+    "set value": set_value,
+    "fillna inplace": lambda df: df.fillna(0, inplace=True),
+    "write into values": write_into_values,
+    "astype": lambda df: df.astype({"a": "float32"}),
+    "sort": lambda df: df.sort_values("a"),
+    "copy and set value": copy_and_set_value,
+}
+for name, operation in operations.items():
+    df = load_data(path)
+    try:
+        operation(df)
+        result = "ok"
+    except ValueError as e:
+        assert "read-only" in str(e), str(e)
+        result = "read-only"
+    print(pd.__version__, name, result)
+    assert load_data(path).equals(expected), name
+
+array_path = os.path.join(folder, "y_data.pkl")
+joblib.dump(np.arange(6.0).reshape(3, 2), array_path)
+array = load_data(array_path)
+assert not array.flags.writeable
+array = array.copy()
+array[0, 0] = 7.0
+assert load_data(array_path)[0, 0] == 0.0
+print(pd.__version__, "arrays ok")
@@ -0,0 +1,68 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import dice_ml
+from utils.dice_explainers import gradient_explainer
+
+max_iter = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+tf.get_logger().setLevel("ERROR")
+tf.random.set_seed(0)
+rng = np.random.default_rng(0)
+X = rng.random((2000, 3)).astype(np.float32)
+levels = rng.integers(0, 3, 2000)
+y = ((X[:, 0] + X[:, 1] + 0.3 * (levels == 2)) > 1.1).astype(np.float32)
+encoded = np.eye(3, dtype=np.float32)[levels]
+
+model = tf.keras.Sequential([tf.keras.layers.Dense(16, activation="relu"), tf.keras.layers.Dense(1, activation="sigmoid")])
+model.compile("adam", "binary_crossentropy")
+model.fit(np.hstack([X, encoded]), y, epochs=20, verbose=0)
+
+d = dice_ml.Data(features={"a": [0, 1], "b": [0, 1], "c": [0, 1], "k": ["0", "1", "2"]}, outcome_name="y")
+m = dice_ml.Model(model=model, backend="TF2")
+query = pd.DataFrame({"a": [0.2], "b": [0.3], "c": [0.5], "k": ["0"]})
+
+#loss of the same candidates with the loss of DiceTensorFlow2 and with the compiled step
+for total_CFs, yloss_type, diversity_loss_type in [(1, "hinge_loss", "dpp_style:inverse_dist"), (3, "hinge_loss", "dpp_style:inverse_dist"),
+                                                   (4, "l2_loss", "avg_dist"), (2, "log_loss", "dpp_style:exponential_dist")]:
+    stock = dice_ml.Dice(d, m)
+    batched = gradient_explainer(d, m)
+    x1 = tf.constant(d.get_ohe_min_max_normalized_data(query).values, dtype=tf.float32)
+    for explainer in [stock, batched]:
+        explainer.do_cf_initializations(total_CFs, "DiverseCF", "all")
+        explainer.do_loss_initializations(yloss_type, diversity_loss_type, "inverse_mad")
+        explainer.update_hyperparameters(0.5, 1.0, 0.1)
+    stock.x1 = x1
+    stock.target_cf_class = np.array([[1.0]], dtype=np.float32)
+    np.random.seed(0)
+    stock.initialize_CFs(x1.numpy(), False)
+    cfs = tf.concat(stock.cfs, 0)
+    step = batched._step(yloss_type, diversity_loss_type if total_CFs > 1 else None, "tensorflow:adam")
+    _, _, _, loss = step(cfs, tf.zeros_like(cfs), tf.zeros_like(cfs), tf.constant(1.0), x1, tf.constant(stock.target_cf_class),
+                         batched.feature_weights_list, batched.freezer, tf.constant(batched.hyperparameters, dtype=tf.float32), tf.constant(0.05))
+    print("loss", total_CFs, yloss_type, diversity_loss_type, "stock:", float(stock.compute_loss()), "batched:", float(loss))
+    assert np.allclose(float(stock.compute_loss()), float(loss), rtol=1e-5, atol=1e-6)
+
+#whole search, from the same initialization near the query instance
+configurations = [
+    dict(total_CFs=3),
+    dict(total_CFs=1),
+    dict(total_CFs=4, yloss_type="l2_loss", diversity_loss_type="avg_dist"),
+    dict(total_CFs=2, optimizer="tensorflow:rmsprop", yloss_type="log_loss"),
+    dict(total_CFs=3, project_iter=50),
+]
+for kwargs in configurations:
+    results = []
+    for explainer in [dice_ml.Dice(d, m), gradient_explainer(d, m)]:
+        start = time.time()
+        explanation = explainer.generate_counterfactuals(query, desired_class="opposite", max_iter=max_iter, **kwargs)
+        results.append((time.time() - start, explainer.max_iterations_run, np.concatenate(explainer.final_cfs),
+                        explanation.cf_examples_list[0].final_cfs_df))
+    (stock_time, stock_iterations, stock_cfs, stock_df), (batched_time, batched_iterations, batched_cfs, batched_df) = results
+    #near the convergence threshold, float differences between the eager and the compiled loss can stop one of them
+    #a few iterations earlier, so the iterations and counterfactuals are printed rather than asserted
+    print(kwargs, "stock:", round(stock_time, 2), "s", stock_iterations, "iterations batched:", round(batched_time, 2), "s",
+          batched_iterations, "iterations speedup:", round(stock_time / batched_time, 1),
+          "max abs difference of the counterfactuals:", np.abs(stock_cfs - batched_cfs).max(),
+          "same valid counterfactuals:", stock_df.round(3).equals(batched_df.round(3)))
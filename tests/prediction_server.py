@@ -0,0 +1,45 @@
+import sys
+import json
+import numpy as np
+from flask import Flask, request, Response
+from utils.remote_predict import NPY_MIMETYPE, encode_npy, decode_npy
+
+#Stand-in for the external prediction servers used with the 'url' parameter.
+#It accepts the JSON 'inputs' form field and, if binary=True, npy bodies, answering in npy when the client accepts it
+
+
+def create_app(predict, binary=True):
+    app = Flask(__name__)
+    app.config["calls"] = []
+
+    @app.route("/Predict", methods=["POST"])
+    def post_predict():
+        if request.content_type == NPY_MIMETYPE:
+            if not binary:
+                return "Unsupported content type", 415
+            inputs = decode_npy(request.get_data())
+        else:
+            inputs = np.array(json.loads(request.form["inputs"]))
+        app.config["calls"].append((request.content_type, len(inputs)))
+        outputs = np.asarray(predict(inputs))
+        if binary and NPY_MIMETYPE in request.headers.get("Accept", ""):
+            return Response(encode_npy(outputs), mimetype=NPY_MIMETYPE)
+        return Response(json.dumps(outputs.tolist()), mimetype="application/json")
+
+    return app
+
+
+def linear_softmax(inputs):
+    #deterministic two-class classifier over the sum of the features
+    scores = np.asarray(inputs, dtype=float).reshape(len(inputs), -1).sum(axis=1)
+    probs = 1 / (1 + np.exp(-scores))
+    return np.stack([1 - probs, probs], axis=1)
+
+
+if __name__ == '__main__':
+    predict = linear_softmax
+    if len(sys.argv) > 1:
+        import joblib
+        model = joblib.load(sys.argv[1])
+        predict = model.predict_proba if hasattr(model, "predict_proba") else model.predict
+    create_app(predict).run(host="0.0.0.0", port=5001)
@@ -0,0 +1,22 @@
+import threading
+import numpy as np
+from werkzeug.serving import make_server
+from tests.prediction_server import create_app, linear_softmax
+from utils.remote_predict import remote_predict_func
+
+X = np.random.rand(2500, 8)
+expected = linear_softmax(X)
+
+for binary in [False, True]:
+    app = create_app(linear_softmax, binary=binary)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:" + str(server.server_port) + "/Predict"
+
+    predict = remote_predict_func(url, chunk_size=1000, workers=2)
+    first = predict(X)
+    second = predict(X)
+    server.shutdown()
+
+    print("binary server:", binary, "calls:", app.config["calls"])
+    print("max abs error:", np.abs(first - expected).max(), np.abs(second - expected).max())
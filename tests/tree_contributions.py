@@ -0,0 +1,49 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+import shap
+import xgboost
+import lightgbm
+from utils import ontologyConstants
+from utils.tree_shap import NativeTreeExplainer, as_outputs
+
+rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+rng = np.random.default_rng(0)
+X = pd.DataFrame(rng.normal(size=(rows, 20)), columns=["f" + str(i) for i in range(20)])
+y_binary = (X["f0"] + X["f1"] * X["f2"] > 0).astype(int)
+y_multi = np.digitize(X["f0"] + X["f3"], [-1, 1])
+y_reg = X["f0"] * 2 + X["f4"] ** 2
+
+models = [
+    ("xgboost binary", xgboost.XGBClassifier(n_estimators=100, max_depth=6).fit(X, y_binary), ontologyConstants.XGBOOST_URIS[0]),
+    ("xgboost multiclass", xgboost.XGBClassifier(n_estimators=100, max_depth=6).fit(X, y_multi), ontologyConstants.XGBOOST_URIS[0]),
+    ("xgboost regression", xgboost.XGBRegressor(n_estimators=100, max_depth=6).fit(X, y_reg), ontologyConstants.XGBOOST_URIS[0]),
+    ("lightgbm binary", lightgbm.LGBMClassifier(n_estimators=100, verbose=-1).fit(X, y_binary), ontologyConstants.LIGHTGBM_URIS[0]),
+    ("lightgbm multiclass", lightgbm.LGBMClassifier(n_estimators=100, verbose=-1).fit(X, y_multi), ontologyConstants.LIGHTGBM_URIS[0]),
+    ("lightgbm regression", lightgbm.LGBMRegressor(n_estimators=100, verbose=-1).fit(X, y_reg), ontologyConstants.LIGHTGBM_URIS[0]),
+]
+
+for name, model, backend in models:
+    start = time.time()
+    shap_explainer = shap.TreeExplainer(model)
+    reference = as_outputs(shap_explainer.shap_values(X))
+    shap_time = time.time() - start
+
+    start = time.time()
+    native_explainer = NativeTreeExplainer(model, backend)
+    native = as_outputs(native_explainer.shap_values(X))
+    native_time = time.time() - start
+
+    reference_expected = np.atleast_1d(shap_explainer.expected_value)
+    native_expected = np.atleast_1d(native_explainer.expected_value)
+    #shap 0.41 gives LightGBM binary classifiers a negated first output, and their layout changes between versions of
+    #shap, so only their last output is compared. All the outputs of the other models are
+    if name == "lightgbm binary":
+        reference, native = reference[:, -1:], native[:, -1:]
+        reference_expected, native_expected = reference_expected[-1:], native_expected[-1:]
+    error = np.abs(native - reference).max()
+    print(name, "shap:", round(shap_time, 2), "s native:", round(native_time, 2), "s speedup:", round(shap_time / native_time, 1),
+          "max abs error:", error, "expected values:", reference_expected, native_expected)
+    assert native.shape == reference.shape and np.allclose(native, reference, atol=1e-4)
+    assert np.allclose(native_expected, reference_expected, atol=1e-4)
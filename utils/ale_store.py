@@ -0,0 +1,212 @@
+import os
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+from utils.cache import LRUCache, env_number, file_fingerprint, DERIVED_SUFFIX
+from utils.image_store import derived_key
+from utils.kernel_shap import predictor_func
+
+#ALE curves of each feature, computed once per model and training data and shared by the ALE and IREX explainers.
+#The curves of stored models are also saved in the .store folder of the data, so they survive a restart
+ALE_RESULTS=LRUCache("ale_results",max_items=int(env_number("ALE_CACHE_MAX_ITEMS",16)))
+ALE_PROCESSES=int(env_number("ALE_PROCESSES",min(os.cpu_count() or 1,4)))
+#maximum number of rows predicted with a single call to the model. The two ends of the intervals of several features
+#are predicted together as long as they fit
+ALE_BATCH_ROWS=int(env_number("ALE_BATCH_ROWS",200000))
+
+#same settings as the default alibi ALE explainer
+MIN_BIN_POINTS=4
+LOW_RESOLUTION_THRESHOLD=10
+EXTRAPOLATE_CONSTANT_PERC=10.
+EXTRAPOLATE_CONSTANT_MIN=0.1
+
+
+def _path(f):
+    return f if isinstance(f,str) else f.name
+
+
+def _grid(values):
+    from alibi.explainers.ale import adaptive_grid
+    uniques=np.unique(values)
+    if len(uniques)<=LOW_RESOLUTION_THRESHOLD:
+        fvals=uniques
+    else:
+        fvals, _ = adaptive_grid(values,MIN_BIN_POINTS)
+    #constant features get an interval around their value
+    if len(fvals)==1:
+        delta=max(fvals*EXTRAPOLATE_CONSTANT_PERC/100,EXTRAPOLATE_CONSTANT_MIN)
+        fvals=np.hstack((fvals-delta,fvals+delta))
+    return fvals
+
+
+def _accumulate(p_deltas, indices, interval_n):
+    #same as alibi's ale_num once the predictions at both ends of the intervals are known
+    import pandas as pd
+    concat=np.column_stack((p_deltas,indices))
+    df=pd.DataFrame(concat)
+    avg_p_deltas=df.groupby(df.shape[1]-1).mean().values
+    accum_p_deltas=np.cumsum(avg_p_deltas,axis=0)
+    zeros=np.zeros((1,accum_p_deltas.shape[1]))
+    accum_p_deltas=np.insert(accum_p_deltas,0,zeros,axis=0)
+    ale0=(0.5*(accum_p_deltas[:-1,:]+accum_p_deltas[1:,:])*interval_n[1:,np.newaxis]).sum(axis=0)
+    ale0=ale0/interval_n.sum()
+    return accum_p_deltas-ale0, ale0
+
+
+def ale_features(predic_func, X, features):
+    #ALE curves of the given feature indices, predicting the lower and upper ends of the intervals of all of them
+    #with a single call to the model
+    from alibi.explainers.ale import get_quantiles
+    n=len(X)
+    grids=[]
+    z=np.concatenate([X]*(2*len(features)))
+    for j, feature in enumerate(features):
+        fvals=_grid(X[:,feature])
+        indices=np.searchsorted(fvals,X[:,feature],side="left")
+        indices[indices==0]=1
+        z[2*j*n:(2*j+1)*n,feature]=fvals[indices-1]
+        z[(2*j+1)*n:(2*j+2)*n,feature]=fvals[indices]
+        grids.append((fvals,indices))
+    predictions=np.asarray(predic_func(z))
+
+    results={}
+    for j, feature in enumerate(features):
+        fvals, indices = grids[j]
+        p_deltas=predictions[(2*j+1)*n:(2*j+2)*n]-predictions[2*j*n:(2*j+1)*n]
+        ale, ale0 = _accumulate(p_deltas,indices,np.bincount(indices))
+        results[feature]={"feature_values":fvals,"ale_values":ale,"ale0":ale0,
+                          "feature_deciles":get_quantiles(X[:,feature],num_quantiles=11)}
+    return results
+
+
+_worker={}
+
+
+def _init_worker(predictor, X):
+    _worker["predict"]=predictor_func(predictor)
+    _worker["X"]=X
+
+
+def _worker_features(features):
+    return ale_features(_worker["predict"],_worker["X"],features)
+
+
+def compute_ale(predic_func, X, features, predictor=None, processes=ALE_PROCESSES, progress=None):
+    #ALE curves of the given features, in batches of features. With a predictor (see predictor_func) and several
+    #processes the batches are computed by a pool of processes. Asynchronous jobs already run in daemonic processes,
+    #which cannot have children, so they use threads instead
+    per_batch=max(1,int(ALE_BATCH_ROWS//max(2*len(X),1)))
+    batches=[features[i:i+per_batch] for i in range(0,len(features),per_batch)]
+    processes=max(min(int(processes),len(batches)),1)
+    results={}
+
+    def done(batch_results):
+        results.update(batch_results)
+        if progress is not None:
+            progress(len(results)/float(len(features)))
+
+    if processes==1:
+        for batch in batches:
+            done(ale_features(predic_func,X,batch))
+    elif predictor is not None and not multiprocessing.current_process().daemon:
+        context=multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes,mp_context=context,initializer=_init_worker,initargs=(predictor,X)) as executor:
+            for future in as_completed([executor.submit(_worker_features,batch) for batch in batches]):
+                done(future.result())
+    else:
+        with ThreadPoolExecutor(max_workers=processes) as executor:
+            for future in as_completed([executor.submit(ale_features,predic_func,X,batch) for batch in batches]):
+                done(future.result())
+    return results
+
+
+class ALEStore:
+    #ALE curves of the features of one model and training data, by feature name
+
+    def __init__(self, path=None, meta=None):
+        self.path=path
+        self.meta=meta
+        self.features={}
+        self.constant_value=None
+        self.lock=threading.Lock()
+        saved=self._read()
+        if saved is not None:
+            self.constant_value=saved["constant_value"]
+            self.features={name: {k: np.array(v) for k, v in result.items()} for name, result in saved["features"].items()}
+
+    def _read(self):
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as f:
+                saved=json.load(f)
+        except (OSError, ValueError):
+            return None
+        return saved if saved.get("meta")==self.meta else None
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path),exist_ok=True)
+        tmp_path=self.path+"."+str(os.getpid())+".tmp"
+        with open(tmp_path,"w") as f:
+            json.dump({"meta":self.meta,"constant_value":self.constant_value,
+                       "features":{name: {k: v.tolist() for k, v in result.items()} for name, result in self.features.items()}},f)
+        os.replace(tmp_path,self.path)
+
+
+def _jsonable(value):
+    return json.loads(json.dumps(value))
+
+
+def load_ale_store(data_file, feature_names, model_file=None, url=None):
+    data_path=_path(data_file)
+    data_fp=file_fingerprint(data_path)
+    if model_file is not None:
+        model_key=file_fingerprint(_path(model_file))
+        meta=_jsonable({"model":model_key,"data":data_fp,"features":feature_names})
+        path=os.path.join(data_path+DERIVED_SUFFIX,"ale",derived_key(os.path.abspath(_path(model_file)),feature_names)+".json")
+    else:
+        #the model behind a url may change, so its curves are only kept in memory
+        model_key=("url",url)
+        meta=None
+        path=None
+    key=(model_key,data_fp,tuple(feature_names))
+    if model_file is not None and key not in ALE_RESULTS:
+        #curves of older versions of the model or data files
+        ALE_RESULTS.invalidate(lambda k: k[0][0]==model_key[0] and k[1][0]==data_fp[0] and (k[0]!=model_key or k[1]!=data_fp))
+    return ALE_RESULTS.get_or_load(key,lambda: ALEStore(path,meta))
+
+
+def ale_explanation(predic_func, X, feature_names, target_names=None, features=None, model_file=None, data_file=None,
+                    url=None, backend=None, processes=ALE_PROCESSES, progress=None):
+    #alibi Explanation with the ALE curves of the features (indices of the columns of X, all of them by default).
+    #Only the features missing from the store of the model are computed
+    from alibi.explainers import ALE
+    features=list(range(X.shape[1])) if not features else list(features)
+    store=load_ale_store(data_file,list(feature_names),model_file,url) if data_file is not None else ALEStore()
+    with store.lock:
+        missing=[f for f in features if feature_names[f] not in store.features]
+        if missing:
+            predictor=("model",_path(model_file),backend) if model_file is not None else ("url",url) if url is not None else None
+            print("Computing the ALE of " + str(len(missing)) + " features")
+            for feature, result in compute_ale(predic_func,X,missing,predictor,processes,progress).items():
+                store.features[feature_names[feature]]=result
+        if store.constant_value is None:
+            store.constant_value=float(np.asarray(predic_func(X)).mean())
+        if missing:
+            store.save()
+        results=[store.features[feature_names[f]] for f in features]
+        constant_value=store.constant_value
+
+    if target_names is None:
+        target_names=["c_" + str(i) for i in range(results[0]["ale_values"].shape[1])]
+    explainer=ALE(predic_func,feature_names=list(feature_names),target_names=list(target_names))
+    explainer.meta["params"].update(min_bin_points=MIN_BIN_POINTS)
+    explainer.target_names=np.array(target_names)
+    return explainer._build_explanation(ale_values=[r["ale_values"] for r in results],ale0=[r["ale0"] for r in results],
+                                        constant_value=constant_value,feature_values=[r["feature_values"] for r in results],
+                                        feature_deciles=[r["feature_deciles"] for r in results],
+                                        feature_names=np.array(feature_names)[features])
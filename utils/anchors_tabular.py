@@ -0,0 +1,105 @@
+import copy
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import LRUCache, env_number, file_fingerprint
+
+#fitted AnchorTabular objects, one per model (or url) and training data. Fitting discretizes the training data and
+#builds the lookups of the sampler, which do not depend on the instance being explained
+ANCHOR_EXPLAINERS=LRUCache("anchor_tabular_explainers",max_items=int(env_number("ANCHORS_CACHE_MAX_ITEMS",16)))
+#number of threads drawing the samples of the candidate anchors of each round of the search
+ANCHORS_SAMPLING_THREADS=int(env_number("ANCHORS_SAMPLING_THREADS",1))
+
+DISC_PERC=(25,50,75)
+
+
+def _path(f):
+    return f if isinstance(f,str) else f.name
+
+
+def load_anchor_explainer(predic_func, train_data, kwargs, model_file=None, data_file=None, url=None):
+    #train_data is the numpy array of the training data without the target
+    from alibi.explainers import AnchorTabular
+
+    def fit():
+        explainer=AnchorTabular(predic_func,**kwargs)
+        explainer.fit(train_data,disc_perc=DISC_PERC)
+        return explainer
+
+    if data_file is None or (model_file is None and url is None):
+        return fit()
+    model_key=file_fingerprint(_path(model_file)) if model_file is not None else ("url",url)
+    key=(model_key,file_fingerprint(_path(data_file)),json.dumps(kwargs,sort_keys=True,default=str))
+    if model_file is not None and key not in ANCHOR_EXPLAINERS:
+        #explainers of older versions of the model file
+        ANCHOR_EXPLAINERS.invalidate(lambda k: k[0][0]==model_key[0] and k[0]!=model_key)
+    return ANCHOR_EXPLAINERS.get_or_load(key,fit)
+
+
+class CountingPredictor:
+    #counts the calls to the model and the number of instances predicted during a search
+
+    def __init__(self, predictor):
+        self.predictor=predictor
+        self.calls=0
+        self.samples=0
+        self.lock=threading.Lock()
+
+    def __call__(self, X):
+        with self.lock:
+            self.calls+=1
+            self.samples+=len(X)
+        return self.predictor(X)
+
+
+def _parallel_beam(samplers, executor, **kwargs):
+    from alibi.explainers.anchors.anchor_base import AnchorBaseBeam
+
+    class ParallelAnchorBaseBeam(AnchorBaseBeam):
+        #the candidate anchors of a round are sampled (and predicted) by a pool of threads. The state of the
+        #search is still updated in order, by the calling thread
+
+        def draw_samples(self, anchors, batch_size):
+            for anchor in anchors:
+                if anchor not in self.state['t_order']:
+                    self.state['t_order'][anchor]=list(anchor)
+            futures=[executor.submit(self.sample_fcn,(i,tuple(self.state['t_order'][anchor])),num_samples=batch_size)
+                     for i, anchor in enumerate(anchors)]
+            sample_stats, pos, total = [], (), ()
+            for future, anchor in zip(futures,anchors):
+                covered_true, covered_false, labels, *additionals, _ = future.result()
+                sample_stats.append(self.update_state(covered_true,covered_false,labels,additionals,anchor))
+                pos, total = list(zip(*sample_stats))
+            return pos, total
+
+    return ParallelAnchorBaseBeam(samplers=samplers,**kwargs)
+
+
+def explain_anchor(explainer, X, threshold=0.95, batch_size=100, coverage_samples=10000, threads=ANCHORS_SAMPLING_THREADS):
+    #explains X with a copy of the cached explainer and of its sampler, so the state set for the instance is not shared
+    #with concurrent requests. Returns the explanation and the CountingPredictor used by the search
+    explainer=copy.copy(explainer)
+    sampler=copy.copy(explainer.samplers[0])
+    sampler.cat_lookup, sampler.ord_lookup, sampler.enc2feat_idx = {}, {}, {}
+    counter=CountingPredictor(sampler.predictor)
+    sampler.predictor=counter
+    explainer.samplers=[sampler]
+
+    if threads<=1:
+        return explainer.explain(X,threshold=threshold,batch_size=batch_size,coverage_samples=coverage_samples), counter
+
+    #same steps as AnchorTabular.explain, with the parallel beam search
+    params=dict(threshold=threshold,delta=0.1,tau=0.15,batch_size=batch_size,coverage_samples=coverage_samples,beam_size=1,
+                stop_on_first=False,max_anchor_size=None,min_samples_start=100,n_covered_ex=10,binary_cache_size=10000,
+                cache_margin=1000,verbose=False,verbose_every=1,kwargs={})
+    sampler.set_instance_label(X)
+    sampler.set_n_covered(params["n_covered_ex"])
+    explainer.instance_label=sampler.instance_label
+    explainer._build_sampling_lookups(X)
+    with ThreadPoolExecutor(max_workers=int(threads)) as executor:
+        mab=_parallel_beam(explainer.samplers,executor,sample_cache_size=params["binary_cache_size"],cache_margin=params["cache_margin"])
+        result=mab.anchor_beam(delta=params["delta"],epsilon=params["tau"],desired_confidence=threshold,beam_size=params["beam_size"],
+                               min_samples_start=params["min_samples_start"],max_anchor_size=params["max_anchor_size"],
+                               batch_size=batch_size,coverage_samples=coverage_samples,verbose=False,verbose_every=1)
+    explainer.mab=mab
+    return explainer._build_explanation(X,result,explainer.instance_label,params), counter
@@ -20,4 +20,7 @@ def PIL_to_base64(image):
     buffered = BytesIO()
     image.save(buffered, format="PNG")
     img_str = base64.b64encode(buffered.getvalue())
-    return img_str.decode("utf-8")
\ No newline at end of file
+    return img_str.decode("utf-8")
+
+def png_to_base64(png):
+    return base64.b64encode(png).decode("utf-8")
@@ -0,0 +1,65 @@
+import time
+import numpy as np
+from utils.cache import LRUCache, current_rss_mb, env_number
+from utils.image_store import derived_array, derived_key
+
+PREDICT_BATCH_SIZE=int(env_number("PREDICT_BATCH_SIZE",32))
+PREDICT_MAX_BATCH_SIZE=int(env_number("PREDICT_MAX_BATCH_SIZE",1024))
+#the batch size stops growing when the server process reaches this memory (in MB)
+PREDICT_MAX_RSS_MB=env_number("PREDICT_MAX_RSS_MB")
+
+PREDICTIONS=LRUCache("dataset_predictions",max_items=int(env_number("PREDICTIONS_CACHE_MAX_ITEMS",16)))
+
+
+def is_out_of_memory(error):
+    #TensorFlow raises ResourceExhaustedError and PyTorch a RuntimeError mentioning 'out of memory'
+    return (isinstance(error,MemoryError) or type(error).__name__=="ResourceExhaustedError"
+            or "out of memory" in str(error).lower())
+
+
+def predict_in_batches(predic_func, count, get_inputs, batch_size=PREDICT_BATCH_SIZE, max_batch_size=PREDICT_MAX_BATCH_SIZE, max_rss_mb=PREDICT_MAX_RSS_MB):
+    #predictions for count inputs, where get_inputs returns the inputs of the given positions. The batch size doubles
+    #after each batch while the memory of the process is below max_rss_mb, and halves (for the rest of the inputs)
+    #when the model runs out of memory
+    outputs=[]
+    start=0
+    while start<count:
+        end=min(start+batch_size,count)
+        try:
+            outputs.append(np.asarray(predic_func(get_inputs(np.arange(start,end)))))
+        except Exception as e:
+            if batch_size==1 or not is_out_of_memory(e):
+                raise
+            batch_size=max(batch_size//2,1)
+            #the batch size that ran out of memory is not tried again
+            max_batch_size=batch_size
+            print("Out of memory while predicting, the batch size is reduced to " + str(batch_size))
+            continue
+        start=end
+        rss=current_rss_mb()
+        if batch_size<max_batch_size and (max_rss_mb is None or rss is None or rss<max_rss_mb):
+            batch_size=min(batch_size*2,max_batch_size)
+    return np.concatenate(outputs) if outputs else np.empty((0,))
+
+
+def dataset_predictions(model_key, predic_func, dataset, output_names):
+    #predictions of the model for every training image, and the class of each image. They are computed once per model
+    #and dataset, class by class, and saved with the dataset, so every explainer using them shares a single pass
+    preds=[]
+    actual=[]
+    for class_key in dataset.class_keys():
+        count=dataset.count(class_key)
+        folder=dataset.derived_folder+"/predictions"
+        key=derived_key(model_key,dataset.fingerprint,class_key)
+
+        def compute(class_key=class_key, count=count):
+            start=time.time()
+            result=predict_in_batches(predic_func,count,lambda idx: dataset.images(class_key,idx))
+            print("Predicted " + str(count) + " images in " + str(round(time.time()-start,2)) + "s")
+            return result
+
+        preds.append(PREDICTIONS.get_or_load(folder+"/"+key,lambda: derived_array(folder,key,compute,count=count)))
+        actual.append(np.full(count,dataset.class_index(class_key,output_names)))
+    if not preds:
+        raise Exception("No data found.")
+    return np.concatenate(preds), np.concatenate(actual)
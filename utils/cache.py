@@ -0,0 +1,151 @@
+import os
+import gc
+import hashlib
+import threading
+from collections import OrderedDict
+
+#folders with data derived from the uploaded files (decoded images, embeddings...). They are rebuilt from those files,
+#so they are not part of the fingerprint of the model folder
+DERIVED_SUFFIX=".store"
+
+
+def file_fingerprint(path):
+    #files are identified by path, modification time and size, so overwriting an uploaded file invalidates its entries
+    if path is None:
+        return None
+    if os.path.isdir(path):
+        entries=[]
+        for root, dirs, files in os.walk(path):
+            dirs[:]=[d for d in dirs if not d.endswith(DERIVED_SUFFIX)]
+            for f in files:
+                st=os.stat(os.path.join(root,f))
+                entries.append((os.path.relpath(os.path.join(root,f),path),st.st_mtime_ns,st.st_size))
+        return (os.path.abspath(path),hashlib.md5(repr(sorted(entries)).encode()).hexdigest())
+    st=os.stat(path)
+    return (os.path.abspath(path),st.st_mtime_ns,st.st_size)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages=int(f.read().split()[1])
+        return pages*os.sysconf("SC_PAGE_SIZE")/(1024*1024)
+    except Exception:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss/(1024*1024)
+    except Exception:
+        return None
+
+
+def env_number(name, default=None):
+    value=os.environ.get(name)
+    if value is None or value=="":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print("Ignoring invalid value for " + name + ": " + value)
+        return default
+
+
+#every cache created in the process, so their counters can be reported together
+CACHES=[]
+
+
+def cache_stats():
+    return [c.stats() for c in CACHES]
+
+
+class LRUCache:
+
+    def __init__(self, name, max_items=None, max_rss_mb=None):
+        self.name=name
+        self.max_items=max_items
+        self.max_rss_mb=max_rss_mb
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self._entries=OrderedDict()
+        self._lock=threading.RLock()
+        self._key_locks={}
+        CACHES.append(self)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits+=1
+                return self._entries[key]
+            self.misses+=1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key]=value
+            self._entries.move_to_end(key)
+            self._evict()
+        return value
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits+=1
+                return self._entries[key]
+            key_lock=self._key_locks.setdefault(key,threading.Lock())
+
+        #only one thread loads a given key, the others wait for it and reuse the result
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits+=1
+                    return self._entries[key]
+                self.misses+=1
+            try:
+                value=loader()
+                return self.put(key,value)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key,None)
+
+    def invalidate(self, match=None):
+        #removes every entry, or the entries whose key satisfies match(key)
+        with self._lock:
+            keys=[k for k in self._entries if match is None or match(k)]
+            for k in keys:
+                del self._entries[k]
+        if keys:
+            gc.collect()
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {"name":self.name,"entries":len(self._entries),"hits":self.hits,
+                    "misses":self.misses,"evictions":self.evictions,
+                    "max_items":self.max_items,"max_rss_mb":self.max_rss_mb}
+
+    def _evict(self):
+        if self.max_items is not None:
+            while len(self._entries)>max(int(self.max_items),1):
+                self._entries.popitem(last=False)
+                self.evictions+=1
+        if self.max_rss_mb is not None:
+            #the most recent entry is always kept, even if it alone exceeds the budget
+            while len(self._entries)>1:
+                rss=current_rss_mb()
+                if rss is None or rss<=self.max_rss_mb:
+                    break
+                self._entries.popitem(last=False)
+                self.evictions+=1
+                gc.collect()
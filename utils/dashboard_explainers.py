@@ -0,0 +1,77 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from utils import ontologyConstants
+from utils.cache import LRUCache, env_number, file_fingerprint
+
+#ClassifierExplainer/RegressionExplainer objects of explainerdashboard, one per model and training data, shared by the
+#tabular metric and SHAP endpoints. Predictions are computed when the explainer is built, and the properties computed
+#later on (e.g. SHAP values) are kept by the explainer, so they are computed once per model
+DASHBOARD_EXPLAINERS=LRUCache("dashboard_explainers",max_items=int(env_number("DASHBOARD_CACHE_MAX_ITEMS",4)),max_rss_mb=env_number("DASHBOARD_CACHE_MAX_RSS_MB"))
+
+
+class PreparedExplainer:
+
+    def __init__(self, explainer):
+        self.explainer=explainer
+        #components change and read the state of the explainer (e.g. pos_label), so they are rendered one at a time
+        self.lock=threading.RLock()
+
+
+def _path(f):
+    return f if isinstance(f,str) else f.name
+
+
+def _settings(model_info):
+    target_name=model_info["attributes"]["target_names"][0]
+    try:
+        output_names=model_info["attributes"]["features"][target_name]["values_raw"]
+    except (KeyError, TypeError):
+        output_names=None
+    return target_name, output_names, model_info["model_task"]
+
+
+def _prepare(model, data, model_info):
+    from explainerdashboard import ClassifierExplainer, RegressionExplainer
+    target_name, output_names, model_task = _settings(model_info)
+    start=time.time()
+    X=data.drop([target_name],axis=1,inplace=False)
+    y=data[target_name]
+    if model_task in ontologyConstants.CLASSIFICATION_URIS:
+        explainer=ClassifierExplainer(model,X,y,labels=output_names,target=target_name)
+        properties=["preds","pred_probas_raw","pred_percentiles_raw"]
+    elif model_task in ontologyConstants.REGRESSION_URIS:
+        explainer=RegressionExplainer(model,X,y,target=target_name)
+        properties=["preds","residuals"]
+    else:
+        raise Exception("AI task not supported. This explainer only supports scikit-learn-based classifiers or regressors.")
+    for p in properties:
+        try:
+            getattr(explainer,p)
+        except Exception:
+            pass
+    print("Prepared the dashboard explainer in " + str(round(time.time()-start,2)) + "s")
+    return PreparedExplainer(explainer)
+
+
+@contextmanager
+def dashboard_explainer(model, data, model_info, model_file=None, data_file=None):
+    #yields the explainer of the model, built the first time. Without the model and data files the explainer
+    #cannot be identified, so a new one is built. An explainer is replaced when its model or data file changes
+    if model_file is None or data_file is None:
+        prepared=_prepare(model,data,model_info)
+    else:
+        model_fp=file_fingerprint(_path(model_file))
+        key=(model_fp,file_fingerprint(_path(data_file)),json.dumps(_settings(model_info)))
+        if key not in DASHBOARD_EXPLAINERS:
+            DASHBOARD_EXPLAINERS.invalidate(lambda k: k[0][0]==model_fp[0] and k!=key)
+        prepared=DASHBOARD_EXPLAINERS.get_or_load(key,lambda: _prepare(model,data,model_info))
+    with prepared.lock:
+        explainer=prepared.explainer
+        pos_label=getattr(explainer,"pos_label",None)
+        try:
+            yield explainer
+        finally:
+            if pos_label is not None and explainer.pos_label!=pos_label:
+                explainer.pos_label=pos_label
@@ -0,0 +1,325 @@
+import json
+import random
+import threading
+import timeit
+import numpy as np
+from utils.cache import LRUCache, env_number, file_fingerprint
+
+#DiCE explainers (with their data and model interfaces), one per model, training data and settings. The explainers
+#keep the state of the instance being explained, so each one explains one request at a time
+DICE_EXPLAINERS=LRUCache("dice_explainers",max_items=int(env_number("DICE_CACHE_MAX_ITEMS",8)))
+
+
+class PreparedDice:
+
+    def __init__(self, explainer):
+        self.explainer=explainer
+        self.lock=threading.Lock()
+
+
+def _path(f):
+    return f if isinstance(f,str) else f.name
+
+
+def kd_explainer(data_interface, model_interface):
+    #DiceKD predicts the whole training data and builds the KD-tree of the desired class for every query instance.
+    #This one does it once per desired class (or range)
+    from dice_ml.explainer_interfaces.dice_KD import DiceKD
+
+    class CachedDiceKD(DiceKD):
+
+        def build_KD_tree(self, data_df_copy, desired_range, desired_class, predicted_outcome_name):
+            if not hasattr(self,"_kd_trees"):
+                self._kd_trees={}
+            key=(tuple(desired_range) if desired_range is not None else None,float(desired_class) if desired_class is not None else None)
+            if key not in self._kd_trees:
+                self._kd_trees[key]=super().build_KD_tree(data_df_copy,desired_range,desired_class,predicted_outcome_name)
+            else:
+                data_df_copy[predicted_outcome_name]=self._kd_trees[key][2]
+            return self._kd_trees[key]
+
+    return CachedDiceKD(data_interface,model_interface)
+
+
+def gradient_explainer(data_interface, model_interface):
+    #DiceTensorFlow2 optimizes each candidate counterfactual as its own variable, building the loss eagerly with a model
+    #call per candidate in every iteration. This one optimizes the total_CFs candidates as a single (total_CFs, features)
+    #tensor, with a loss and optimizer step compiled once per explainer and loss settings (with a fixed input signature,
+    #so the number of candidates does not retrace it)
+    import tensorflow as tf
+    from dice_ml.explainer_interfaces.dice_tensorflow2 import DiceTensorFlow2
+
+    class BatchedDiceTensorFlow2(DiceTensorFlow2):
+
+        def __init__(self, data_interface, model_interface):
+            super().__init__(data_interface,model_interface)
+            self._steps={}
+            self._predict=tf.function(lambda x: self.model.get_output(x),input_signature=[tf.TensorSpec([None,self.minx.shape[1]],tf.float32)])
+
+        def _generate_counterfactuals(self, query_instance, total_CFs, **kwargs):
+            #abstract in ExplainerBase. DiceTensorFlow2 overrides generate_counterfactuals, which does all the work
+            return self.generate_counterfactuals(query_instance,total_CFs,**kwargs)
+
+        def predict_fn(self, input_instance):
+            predictions=self._predict(tf.convert_to_tensor(input_instance,dtype=tf.float32)).numpy()
+            return np.asarray(predictions[:,(self.num_output_nodes-1):],dtype=np.float32)
+
+        def _build_step(self, yloss_type, diversity_loss_type, optimizer):
+            opt_method=optimizer.split(":")[1]
+            if opt_method not in ("adam","rmsprop"):
+                raise ValueError("Unsupported optimizer: " + optimizer)
+            n=self.minx.shape[1]
+            minx=tf.constant(self.minx,dtype=tf.float32)
+            maxx=tf.constant(self.maxx,dtype=tf.float32)
+            categorical=[(v[0],v[-1]+1) for v in self.encoded_categorical_feature_indexes]
+            node=self.num_output_nodes-1
+            model=self.model
+
+            #same loss as DiceTensorFlow2.compute_loss, for all the candidates at once
+            def loss_fn(cfs, x1, target, feature_weights, hyperparameters):
+                k=tf.cast(tf.shape(cfs)[0],tf.float32)
+                output=model.get_output(cfs)[:,node:node+1]
+                if yloss_type=="l2_loss":
+                    yloss=tf.square(output-target)
+                else:
+                    logits=tf.math.log(tf.abs(output-0.000001)/(1-tf.abs(output-0.000001)))
+                    if yloss_type=="log_loss":
+                        yloss=tf.nn.sigmoid_cross_entropy_with_logits(labels=tf.broadcast_to(target,tf.shape(logits)),logits=logits)
+                    else:
+                        yloss=tf.nn.relu(1.0-(2.0*target-1.0)*logits)
+                proximity=tf.reduce_sum(tf.abs(cfs-x1)*feature_weights)/(n*k)
+                diversity=0.0
+                if diversity_loss_type is not None:
+                    dist=tf.reduce_sum(tf.abs(cfs[:,tf.newaxis,:]-cfs[tf.newaxis,:,:])*feature_weights,axis=2)
+                    if diversity_loss_type=="dpp_style:inverse_dist":
+                        diversity=tf.linalg.det(1.0/(1.0+dist)+0.0001*tf.eye(tf.shape(cfs)[0]))
+                    elif diversity_loss_type=="dpp_style:exponential_dist":
+                        diversity=tf.linalg.det(tf.exp(-dist))
+                    elif diversity_loss_type=="avg_dist":
+                        diversity=1.0-((tf.reduce_sum(1.0/(1.0+dist))-k)/2.0)/(k*(k-1.0)/2.0)
+                regularization=0.0
+                for start, end in categorical:
+                    regularization+=tf.reduce_sum(tf.square(tf.reduce_sum(cfs[:,start:end],axis=1)-1.0))
+                return tf.reduce_mean(yloss)+hyperparameters[0]*proximity-hyperparameters[1]*diversity+hyperparameters[2]*regularization
+
+            #one iteration: gradients of the features to vary, the update of tf.compat.v1 Adam (or RMSProp) and the
+            #projection to the ranges of the features
+            @tf.function(input_signature=[tf.TensorSpec([None,n],tf.float32),tf.TensorSpec([None,n],tf.float32),
+                                          tf.TensorSpec([None,n],tf.float32),tf.TensorSpec([],tf.float32),
+                                          tf.TensorSpec([1,n],tf.float32),tf.TensorSpec([1,1],tf.float32),
+                                          tf.TensorSpec([1,n],tf.float32),tf.TensorSpec([n],tf.float32),
+                                          tf.TensorSpec([3],tf.float32),tf.TensorSpec([],tf.float32)])
+            def step(cfs, m, v, t, x1, target, feature_weights, freezer, hyperparameters, learning_rate):
+                with tf.GradientTape() as tape:
+                    tape.watch(cfs)
+                    loss=loss_fn(cfs,x1,target,feature_weights,hyperparameters)
+                grads=tape.gradient(loss,cfs)*freezer
+                if opt_method=="adam":
+                    m=0.9*m+0.1*grads
+                    v=0.999*v+0.001*tf.square(grads)
+                    rate=learning_rate*tf.sqrt(1.0-tf.pow(0.999,t))/(1.0-tf.pow(0.9,t))
+                    cfs=cfs-rate*m/(tf.sqrt(v)+1e-8)
+                else:
+                    v=0.9*v+0.1*tf.square(grads)
+                    cfs=cfs-learning_rate*grads/tf.sqrt(v+1e-10)
+                return tf.minimum(tf.maximum(cfs,minx),maxx), m, v, loss
+
+            return step
+
+        def _step(self, yloss_type, diversity_loss_type, optimizer):
+            key=(yloss_type,diversity_loss_type,optimizer)
+            if key not in self._steps:
+                self._steps[key]=self._build_step(*key)
+            return self._steps[key]
+
+        def _initial_cfs(self, query_instance, near):
+            k, n = self.total_CFs, self.minx.shape[1]
+            if near:
+                init=query_instance[0]+0.01*np.arange(k)[:,np.newaxis]
+            else:
+                init=np.random.uniform(self.minx[0],self.maxx[0],size=(k,n))
+            vary=np.isin(np.arange(n),self.feat_to_vary_idxs)
+            return tf.constant(np.where(vary,init,query_instance[0]),dtype=tf.float32)
+
+        def _round_off(self, cfs):
+            #same projection as DiceTensorFlow2.round_off_cfs, for all the candidates at once
+            cfs=np.array(cfs,dtype=np.float32)
+            for i, v in enumerate(self.encoded_continuous_feature_indexes):
+                span=self.cont_maxx[i]-self.cont_minx[i]
+                original=np.round(cfs[:,v].astype(np.float64)*span+self.cont_minx[i],self.cont_precisions[i])
+                cfs[:,v]=(original-self.cont_minx[i])/span
+            for v in self.encoded_categorical_feature_indexes:
+                block=cfs[:,v[0]:v[-1]+1]
+                if self.tie_random:
+                    levels=[random.choice(np.flatnonzero(row==row.max())) for row in block]
+                else:
+                    levels=block.argmax(axis=1)
+                onehot=np.zeros_like(block)
+                onehot[np.arange(len(block)),levels]=1.0
+                cfs[:,v[0]:v[-1]+1]=onehot
+            return cfs
+
+        def _valid(self, predictions):
+            if self.target_cf_class==0:
+                return bool(np.all(predictions<=self.stopping_threshold))
+            if self.target_cf_class==1:
+                return bool(np.all(predictions>=self.stopping_threshold))
+            return False
+
+        def find_counterfactuals(self, query_instance, desired_class, optimizer, learning_rate, min_iter,
+                                 max_iter, project_iter, loss_diff_thres, loss_converge_maxiter, verbose,
+                                 init_near_query_instance, tie_random, stopping_threshold, posthoc_sparsity_param,
+                                 posthoc_sparsity_algorithm):
+            query_instance=self.data_interface.get_ohe_min_max_normalized_data(query_instance).values
+            x1=tf.constant(query_instance,dtype=tf.float32)
+            test_pred=self.predict_fn(query_instance)[0][0]
+            if desired_class=="opposite":
+                desired_class=1.0-round(test_pred)
+            self.target_cf_class=np.array([[desired_class]],dtype=np.float32)
+            target=tf.constant(self.target_cf_class)
+
+            self.stopping_threshold=stopping_threshold
+            if self.target_cf_class==0 and self.stopping_threshold>0.5:
+                self.stopping_threshold=0.25
+            elif self.target_cf_class==1 and self.stopping_threshold<0.5:
+                self.stopping_threshold=0.75
+            self.tie_random=tie_random
+            self.converged=False
+
+            k=self.total_CFs
+            step=self._step(self.yloss_type,self.diversity_loss_type if k>1 else None,optimizer)
+            hyperparameters=tf.constant(self.hyperparameters,dtype=tf.float32)
+            rate=tf.constant(learning_rate,dtype=tf.float32)
+            rmsprop=optimizer.split(":")[1]=="rmsprop"
+
+            start_time=timeit.default_timer()
+            loop_find_CFs=self.total_random_inits if self.total_random_inits>0 else 1
+            self.final_cfs=[]
+            self.best_backup_cfs=[0]*max(k,loop_find_CFs)
+            self.best_backup_cfs_preds=[0]*max(k,loop_find_CFs)
+            self.min_dist_from_threshold=[100]*loop_find_CFs
+
+            for loop_ix in range(loop_find_CFs):
+                cfs=self._initial_cfs(query_instance,init_near_query_instance and self.total_random_inits==0)
+                m=tf.zeros_like(cfs)
+                v=tf.ones_like(cfs) if rmsprop else tf.zeros_like(cfs)
+                iterations=0
+                loss_diff=1.0
+                prev_loss=0.0
+                converge_iter=0
+                while True:
+                    #same stopping conditions as DiceTensorFlow2.stop_loop, including its intermediate projection
+                    #every project_iter iterations
+                    if project_iter>0 and iterations>0 and iterations%project_iter==0:
+                        cfs=tf.constant(self._round_off(cfs.numpy()))
+                    if iterations>=min_iter:
+                        if iterations>=max_iter:
+                            break
+                        if loss_diff<=loss_diff_thres:
+                            converge_iter+=1
+                            if converge_iter>=loss_converge_maxiter and self._valid(self.predict_fn(self._round_off(cfs.numpy()))):
+                                self.converged=True
+                                break
+                        else:
+                            converge_iter=0
+
+                    cfs, m, v, loss_value = step(cfs,m,v,tf.constant(iterations+1.0),x1,target,self.feature_weights_list,
+                                                 self.freezer,hyperparameters,rate)
+                    loss_value=float(loss_value)
+                    if verbose and iterations%50==0:
+                        print('step %d,  loss=%g' % (iterations+1, loss_value))
+                    loss_diff=abs(loss_value-prev_loss)
+                    prev_loss=loss_value
+                    iterations+=1
+
+                    #backing up the candidates if they are all valid, predicting them with a single call
+                    rounded=self._round_off(cfs.numpy())
+                    preds=self.predict_fn(rounded)
+                    if self._valid(preds):
+                        avg_preds_dist=np.mean(np.abs(preds[:,0]-self.stopping_threshold))
+                        if avg_preds_dist<self.min_dist_from_threshold[loop_ix]:
+                            self.min_dist_from_threshold[loop_ix]=avg_preds_dist
+                            for ix in range(k):
+                                self.best_backup_cfs[loop_ix+ix]=rounded[ix:ix+1]
+                                self.best_backup_cfs_preds[loop_ix+ix]=preds[ix:ix+1]
+
+                rounded=self._round_off(cfs.numpy())
+                self.final_cfs.extend(rounded[j:j+1] for j in range(k))
+                self.max_iterations_run=iterations
+
+            self.elapsed=timeit.default_timer()-start_time
+            preds=self.predict_fn(np.concatenate(self.final_cfs))
+            self.cfs_preds=[preds[i:i+1] for i in range(len(preds))]
+
+            #update final_cfs from backed up CFs if valid CFs are not found
+            if not self._valid(preds):
+                for loop_ix in range(loop_find_CFs):
+                    if self.min_dist_from_threshold[loop_ix]!=100:
+                        for ix in range(k):
+                            self.final_cfs[loop_ix+ix]=self.best_backup_cfs[loop_ix+ix]
+                            self.cfs_preds[loop_ix+ix]=self.best_backup_cfs_preds[loop_ix+ix]
+
+            cfs=np.concatenate(self.final_cfs)
+            final_cfs_df=self.data_interface.get_inverse_ohe_min_max_normalized_data(cfs)
+            final_cfs_df[self.data_interface.outcome_name]=np.round(np.concatenate(self.cfs_preds).flatten().astype(np.float64),3)
+            test_instance_df=self.data_interface.get_inverse_ohe_min_max_normalized_data(query_instance)
+            test_instance_df[self.data_interface.outcome_name]=np.array(np.round(test_pred,3))
+
+            #post-hoc operation on continuous features to enhance sparsity - only for public data
+            final_cfs_df_sparse=None
+            if posthoc_sparsity_param is not None and posthoc_sparsity_param>0 and 'data_df' in self.data_interface.__dict__:
+                final_cfs_df_sparse=self.do_posthoc_sparsity_enhancement(final_cfs_df.copy(),test_instance_df,
+                                                                         posthoc_sparsity_param,posthoc_sparsity_algorithm)
+
+            #as in DiceTensorFlow2, when some are not valid the counterfactuals must be strictly beyond the threshold
+            if self._valid(np.concatenate(self.cfs_preds)):
+                valid_ix=list(range(len(self.cfs_preds)))
+            elif self.target_cf_class==0:
+                valid_ix=[ix for ix, pred in enumerate(self.cfs_preds) if pred[0][0]<self.stopping_threshold]
+            elif self.target_cf_class==1:
+                valid_ix=[ix for ix, pred in enumerate(self.cfs_preds) if pred[0][0]>self.stopping_threshold]
+            else:
+                valid_ix=[]
+            self.total_CFs_found=len(valid_ix)
+            print("%d of %d counterfactuals found in %d iterations, %.2f sec" % (self.total_CFs_found,len(self.cfs_preds),self.max_iterations_run,self.elapsed))
+            if final_cfs_df_sparse is not None:
+                final_cfs_df_sparse=final_cfs_df_sparse.iloc[valid_ix].reset_index(drop=True)
+            return final_cfs_df.iloc[valid_ix].reset_index(drop=True), test_instance_df, final_cfs_df_sparse
+
+    return BatchedDiceTensorFlow2(data_interface,model_interface)
+
+
+def load_dice(make_explainer, model_file=None, data_file=None, settings=None):
+    #make_explainer builds the explainer, and is only called the first time. Without the model file the explainer
+    #cannot be identified, so a new one is built
+    if model_file is None:
+        return PreparedDice(make_explainer())
+    model_fp=file_fingerprint(_path(model_file))
+    data_fp=file_fingerprint(_path(data_file)) if data_file is not None else None
+    key=(model_fp,data_fp,json.dumps(settings,sort_keys=True,default=str))
+    if key not in DICE_EXPLAINERS:
+        DICE_EXPLAINERS.invalidate(lambda k: k[0][0]==model_fp[0] and k[0]!=model_fp)
+    return DICE_EXPLAINERS.get_or_load(key,lambda: PreparedDice(make_explainer()))
+
+
+def optimization_stats(explainer, wall_time):
+    #iterations and time of the optimization of the gradient-based explainers for the last instance
+    return {"iterations":int(explainer.max_iterations_run),"converged":bool(explainer.converged),
+            "optimization_time":round(float(explainer.elapsed),3),"wall_time":round(wall_time,3)}
+
+
+def generate_counterfactuals(prepared, query_instances, batch=True, stats=None, **kwargs):
+    #counterfactuals of all the rows of the query_instances dataframe. The model-agnostic explainers take all of them
+    #in a single call; the gradient-based ones (TensorFlow and PyTorch) explain one instance per call, and the
+    #optimization_stats of each instance are appended to stats
+    from dice_ml.counterfactual_explanations import CounterfactualExplanations
+    with prepared.lock:
+        if batch:
+            return prepared.explainer.generate_counterfactuals(query_instances=query_instances,**kwargs)
+        examples=[]
+        for i in range(len(query_instances)):
+            start_time=timeit.default_timer()
+            examples.extend(prepared.explainer.generate_counterfactuals(query_instances[i:i+1],**kwargs).cf_examples_list)
+            if stats is not None and hasattr(prepared.explainer,"max_iterations_run"):
+                stats.append(optimization_stats(prepared.explainer,timeit.default_timer()-start_time))
+        return CounterfactualExplanations(cf_examples_list=examples)
@@ -0,0 +1,55 @@
+import os
+import time
+import numpy as np
+from utils.cache import LRUCache, env_number
+from utils.image_store import derived_array
+
+EMBEDDING_BATCH_SIZE=int(env_number("EMBEDDING_BATCH_SIZE",256))
+
+#indexes loaded in memory, identified by the path of their embeddings file
+INDEXES=LRUCache("embedding_indexes",max_items=int(env_number("EMBEDDING_INDEX_MAX_ITEMS",16)),max_rss_mb=env_number("EMBEDDING_INDEX_MAX_RSS_MB"))
+
+
+class EmbeddingIndex:
+    #exact nearest neighbours by euclidean distance. The squared norms of the embeddings are precomputed,
+    #so a query is a single matrix-vector product
+
+    def __init__(self, embeddings):
+        self.embeddings=np.ascontiguousarray(embeddings,dtype=np.float32)
+        self.norms=np.einsum("ij,ij->i",self.embeddings,self.embeddings)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def query(self, query, k, rows=None):
+        #returns the positions of the k nearest embeddings (restricted to rows if given) and their distances, nearest first
+        query=np.asarray(query,dtype=np.float32).reshape(-1)
+        embeddings, norms = (self.embeddings, self.norms) if rows is None else (self.embeddings[rows], self.norms[rows])
+        distances=norms-2*embeddings.dot(query)+query.dot(query)
+        np.maximum(distances,0,out=distances)
+        k=min(int(k),len(distances))
+        top=np.argpartition(distances,k-1)[:k] if k<len(distances) else np.arange(len(distances))
+        top=top[np.argsort(distances[top],kind="stable")]
+        positions=top if rows is None else np.asarray(rows)[top]
+        return positions, np.sqrt(distances[top])
+
+
+def encode_in_batches(count, get_images, encoder, batch_size=EMBEDDING_BATCH_SIZE):
+    #get_images receives the positions of a batch, so only batch_size images are in memory at a time
+    chunks=[]
+    for start in range(0,count,batch_size):
+        idx=np.arange(start,min(start+batch_size,count))
+        chunks.append(np.asarray(encoder(get_images(idx)),dtype=np.float32).reshape(len(idx),-1))
+    return np.concatenate(chunks)
+
+
+def load_embedding_index(folder, key, count, get_images, encoder, batch_size=EMBEDDING_BATCH_SIZE):
+    #returns the index of the embeddings saved in folder/<key>.npy, encoding the images and saving them the first time
+
+    def encode():
+        start=time.time()
+        embeddings=encode_in_batches(count,get_images,encoder,batch_size)
+        print("Encoded " + str(count) + " images in " + str(round(time.time()-start,2)) + "s")
+        return embeddings
+
+    return INDEXES.get_or_load(os.path.join(folder,key),lambda: EmbeddingIndex(derived_array(folder,key,encode,count=count)))
@@ -0,0 +1,162 @@
+import os
+import time
+import queue
+import shutil
+import tempfile
+import threading
+import importlib.util
+from concurrent.futures import Future
+from utils.cache import env_number, CACHES
+
+HTML_RENDER_WORKERS=int(env_number("HTML_RENDER_WORKERS",2))
+HTML_RENDER_TIMEOUT=env_number("HTML_RENDER_TIMEOUT",60)
+HTML_RENDER_BROWSER=os.environ.get("HTML_RENDER_BROWSER")
+
+DEFAULT_SIZE=(1300,350)
+
+
+def _browser_executables():
+    #the browser installed by playwright matches its version, so it is tried before the ones found in the PATH
+    if HTML_RENDER_BROWSER:
+        return [HTML_RENDER_BROWSER]
+    paths=[None]
+    for name in ("chromium","chromium-browser","google-chrome","chrome"):
+        path=shutil.which(name)
+        if path is not None:
+            paths.append(path)
+    return paths
+
+
+class _BrowserUnavailable(Exception):
+    #playwright could not be started or no browser could be launched
+    pass
+
+
+def _with_css(html, css):
+    if not css:
+        return html
+    return "<style>" + css + "</style>" + html
+
+
+class _BrowserWorker(threading.Thread):
+    #keeps one headless browser open and renders the pages of the shared queue in new tabs.
+    #Playwright objects can only be used by the thread that created them, so each browser has its own thread
+
+    def __init__(self, tasks):
+        super().__init__(daemon=True)
+        self.tasks=tasks
+        self.browser=None
+
+    def _launch(self, playwright):
+        args=["--no-sandbox","--disable-dev-shm-usage"]
+        errors=[]
+        for path in _browser_executables():
+            try:
+                return playwright.chromium.launch(executable_path=path,args=args)
+            except Exception as e:
+                errors.append(str(path) + ": " + str(e))
+        raise _BrowserUnavailable("\n".join(errors))
+
+    def run(self):
+        try:
+            from playwright.sync_api import sync_playwright
+            playwright=sync_playwright().start()
+            error=None
+        except Exception as e:
+            error=_BrowserUnavailable(str(e))
+        while True:
+            html, size, future = self.tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            try:
+                if self.browser is None or not self.browser.is_connected():
+                    self.browser=self._launch(playwright)
+            except _BrowserUnavailable as e:
+                future.set_exception(e)
+                continue
+            try:
+                page=self.browser.new_page(viewport={"width":int(size[0]),"height":int(size[1])})
+                try:
+                    page.set_content(html,wait_until="load",timeout=HTML_RENDER_TIMEOUT*1000)
+                    future.set_result(page.screenshot(type="png"))
+                finally:
+                    page.close()
+            except Exception as e:
+                future.set_exception(e)
+
+
+class HtmlRenderer:
+    #renders HTML pages to PNG images with a pool of headless browsers started on the first request and kept open.
+    #If playwright is not installed, or the browsers cannot be started, each page is rendered with Html2Image in its own temporary folder
+
+    def __init__(self, workers=HTML_RENDER_WORKERS, timeout=HTML_RENDER_TIMEOUT):
+        self.workers=max(int(workers),1)
+        self.timeout=timeout
+        self.pooled=importlib.util.find_spec("playwright") is not None
+        self.renders=0
+        self.total_time=0.0
+        self._tasks=queue.Queue()
+        self._pool=[]
+        self._lock=threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if not self._pool:
+                self._pool=[_BrowserWorker(self._tasks) for _ in range(self.workers)]
+                for worker in self._pool:
+                    worker.start()
+
+    def _render_pooled(self, html, size):
+        self._start()
+        future=Future()
+        self._tasks.put((html,size,future))
+        return future.result(timeout=self.timeout)
+
+    def _render_html2image(self, html, size):
+        from html2image import Html2Image
+        output_path=tempfile.mkdtemp(prefix="render_")
+        try:
+            hti=Html2Image(output_path=output_path)
+            hti.screenshot(html_str=html,save_as="explanation.png",size=size)
+            with open(os.path.join(output_path,"explanation.png"),"rb") as f:
+                return f.read()
+        finally:
+            shutil.rmtree(output_path,ignore_errors=True)
+
+    def render(self, html, css="body {background: white;}", size=None):
+        #returns the bytes of the PNG screenshot of the page. size is (width, height) in pixels
+        size=tuple(int(s) for s in size) if size else DEFAULT_SIZE
+        html=_with_css(html,css)
+        start=time.time()
+        png=None
+        if self.pooled:
+            try:
+                png=self._render_pooled(html,size)
+            except _BrowserUnavailable as e:
+                print("The HTML rendering pool is unusable, Html2Image is used instead: " + str(e))
+                self.pooled=False
+        if png is None:
+            png=self._render_html2image(html,size)
+        elapsed=time.time()-start
+        with self._lock:
+            self.renders+=1
+            self.total_time+=elapsed
+        print("Rendered HTML to PNG in " + str(round(elapsed,3)) + "s" + ("" if self.pooled else " (Html2Image)"))
+        return png
+
+    def stats(self):
+        with self._lock:
+            return {"name":"html_render","pooled":self.pooled,"workers":len(self._pool),"renders":self.renders,
+                    "mean_time":round(self.total_time/self.renders,3) if self.renders else None}
+
+
+HTML_RENDERER=HtmlRenderer()
+#the size of the pool and the render times are reported by /CacheStats with the caches
+CACHES.append(HTML_RENDERER)
+
+
+def render_html(html, css="body {background: white;}", size=None):
+    return HTML_RENDERER.render(html,css=css,size=size)
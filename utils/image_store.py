@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import hashlib
+import shutil
+import threading
+import numpy as np
+from utils.cache import LRUCache, file_fingerprint, DERIVED_SUFFIX
+
+#image datasets stored as folders (<id>_data/<class>/<image files>) are decoded once into one .npy shard per class,
+#saved next to the folder in <id>_data.store together with an index.json. The shards keep the dtype of the decoded images
+#(e.g. uint16 for 16-bit PNGs) and are memory-mapped, so the explainers only read the rows they use
+STORE_SUFFIX=DERIVED_SUFFIX
+INDEX_FILE="index.json"
+#stores written with another version are built again
+STORE_VERSION=2
+
+_STORES=LRUCache("image_stores",max_items=32)
+_ingest_lock=threading.Lock()
+
+
+def _source_fingerprint(data_folder):
+    #adding or removing images changes the modification time of their class folder
+    entries=[]
+    for name in sorted(os.listdir(data_folder)):
+        path=os.path.join(data_folder,name)
+        if os.path.isdir(path):
+            entries.append([name,os.stat(path).st_mtime_ns])
+    return entries
+
+
+def _decode_folder(folder):
+    from PIL import Image
+    images=[]
+    for f in sorted(os.listdir(folder)):
+        with Image.open(os.path.join(folder,f)) as im:
+            images.append(np.array(im))
+    if not images:
+        return None
+    shapes=set(im.shape for im in images)
+    if len(shapes)>1:
+        raise Exception("The images of the folder '" + folder + "' do not have the same shape: " + str(sorted(shapes)))
+    return np.stack(images)
+
+
+def ingest_image_folder(data_folder, store_folder=None):
+    #decodes every class folder into <class>.npy and writes the index. The store is built in a temporary folder
+    #and then moved, so a reader never sees a half written store
+    data_folder=os.path.normpath(data_folder)
+    store_folder=store_folder or data_folder+STORE_SUFFIX
+    tmp_folder=store_folder+".tmp" + str(os.getpid())
+    shutil.rmtree(tmp_folder,ignore_errors=True)
+    os.makedirs(tmp_folder)
+    index={"version":STORE_VERSION,"source":_source_fingerprint(data_folder),"classes":{}}
+    try:
+        for i, (class_name, _) in enumerate(index["source"]):
+            images=_decode_folder(os.path.join(data_folder,class_name))
+            if images is None:
+                continue
+            shard="class_" + str(i) + ".npy"
+            np.save(os.path.join(tmp_folder,shard),images,allow_pickle=False)
+            index["classes"][class_name]={"file":shard,"count":int(images.shape[0]),"shape":list(images.shape[1:]),
+                                          "dtype":str(images.dtype)}
+        shapes=set(tuple(c["shape"]) for c in index["classes"].values())
+        if len(shapes)>1:
+            raise Exception("The images of the dataset do not have the same shape: " + str(sorted(shapes)))
+        dtypes=set(c["dtype"] for c in index["classes"].values())
+        if len(dtypes)>1:
+            raise Exception("The images of the dataset do not have the same pixel type: " + str(sorted(dtypes)))
+        with open(os.path.join(tmp_folder,INDEX_FILE),"w") as f:
+            json.dump(index,f)
+        shutil.rmtree(store_folder,ignore_errors=True)
+        os.replace(tmp_folder,store_folder)
+    finally:
+        shutil.rmtree(tmp_folder,ignore_errors=True)
+    return store_folder
+
+
+class ImageStore:
+
+    def __init__(self, store_folder, index):
+        self.store_folder=store_folder
+        self.index=index
+        self.class_names=list(index["classes"].keys())
+        self._shards={}
+
+    def count(self, class_name):
+        return self.index["classes"][class_name]["count"]
+
+    def shard(self, class_name):
+        #memory-mapped array with all the images of the class
+        if class_name not in self._shards:
+            path=os.path.join(self.store_folder,self.index["classes"][class_name]["file"])
+            self._shards[class_name]=np.load(path,mmap_mode="r")
+        return self._shards[class_name]
+
+    def read(self, classes=None, sample=None, rng=None):
+        #returns the images of the given classes (all by default) and, for each image, the position of its class in classes.
+        #If sample is given, that number of images is drawn at random (with replacement), and only those rows are read
+        classes=self.class_names if classes is None else [c for c in classes]
+        for c in classes:
+            if c not in self.index["classes"]:
+                raise Exception("No images of class '" + str(c) + "' were found.")
+        counts=np.array([self.count(c) for c in classes],dtype=np.int64)
+        offsets=np.concatenate([[0],np.cumsum(counts)])
+        total=int(offsets[-1])
+        if total==0:
+            raise Exception("No data found.")
+        if sample is None:
+            idx=np.arange(total)
+        else:
+            rng=rng if rng is not None else np.random.default_rng()
+            idx=rng.integers(total,size=min(int(sample),total))
+        labels=np.searchsorted(offsets,idx,side="right")-1
+        shape=tuple(self.index["classes"][classes[0]]["shape"])
+        dtype=np.dtype(self.index["classes"][classes[0]]["dtype"])
+        images=np.empty((len(idx),)+shape,dtype=dtype)
+        for i, c in enumerate(classes):
+            mask=labels==i
+            if mask.any():
+                rows=idx[mask]-offsets[i]
+                order=np.argsort(rows)
+                #rows are read in file order from the memory map
+                selected=np.empty((len(rows),)+shape,dtype=dtype)
+                selected[order]=self.shard(c)[rows[order]]
+                images[mask]=selected
+        return images, labels
+
+
+def _load_index(store_folder):
+    try:
+        with open(os.path.join(store_folder,INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_image_store(data_folder):
+    #returns the ImageStore of an image folder, building it first if it does not exist or the folder changed
+    data_folder=os.path.normpath(data_folder)
+    store_folder=data_folder+STORE_SUFFIX
+    source=_source_fingerprint(data_folder)
+    key=(store_folder,json.dumps(source))
+    store=_STORES.get(key)
+    if store is not None:
+        return store
+    with _ingest_lock:
+        index=_load_index(store_folder)
+        if index is None or index.get("version")!=STORE_VERSION or index["source"]!=source:
+            print("Building the image store of " + data_folder)
+            ingest_image_folder(data_folder,store_folder)
+            index=_load_index(store_folder)
+    _STORES.invalidate(lambda k: k[0]==store_folder)
+    store=ImageStore(store_folder,index)
+    _STORES.put(key,store)
+    return store
+
+
+def derived_key(*parts):
+    return hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+
+def derived_array(folder, key, compute, count=None, mmap_mode=None):
+    #array computed from a dataset (e.g. embeddings), saved as folder/<key>.npy the first time.
+    #A saved array with a different number of rows than count is computed again
+    path=os.path.join(folder,key+".npy")
+    if os.path.exists(path):
+        try:
+            array=np.load(path,mmap_mode=mmap_mode,allow_pickle=False)
+            if count is None or len(array)==count:
+                return array
+        except (OSError, ValueError):
+            pass
+    array=compute()
+    os.makedirs(folder,exist_ok=True)
+    tmp_path=path+"."+str(os.getpid())+".tmp.npy"
+    np.save(tmp_path,array,allow_pickle=False)
+    os.replace(tmp_path,path)
+    return array
+
+
+class ImageDataset:
+    #training images of a model, stored as an image folder or as a csv file, read by class.
+    #Classes are identified by name in folders and by label in csv files. Images are returned ready for the model:
+    #images of folders are normalised and rows of csv files are reshaped
+
+    def __init__(self, data_file, model_info):
+        self.model_info=model_info
+        self.shape=tuple(model_info["attributes"]["features"]["image"]["shape"])
+        if isinstance(data_file,str) and os.path.isdir(data_file):
+            self.path=os.path.normpath(data_file)
+            self.store=open_image_store(self.path)
+            self.fingerprint=self.store.index["source"]
+        else:
+            self.path=os.path.normpath(data_file if isinstance(data_file,str) else data_file.name)
+            self.store=None
+            self.fingerprint=file_fingerprint(self.path)
+            self._csv_classes={}
+        #folder for the data derived from the dataset, e.g. embeddings
+        self.derived_folder=self.path+STORE_SUFFIX
+
+    def class_key(self, label_raw, label):
+        return label_raw if self.store is not None else label
+
+    def class_keys(self):
+        if self.store is not None:
+            return list(self.store.class_names)
+        from getmodelfiles import load_image_csv
+        return [float(label) for label in np.unique(load_image_csv(self.path)[1])]
+
+    def class_index(self, class_key, output_names):
+        #position of the class in the output of the model
+        return output_names.index(class_key) if self.store is not None else int(class_key)
+
+    def _csv_class(self, class_key):
+        if class_key not in self._csv_classes:
+            from getmodelfiles import load_image_csv
+            self._csv_classes[class_key]=load_image_csv(self.path,label=class_key)[0]
+        return self._csv_classes[class_key]
+
+    def count(self, class_key):
+        if self.store is not None:
+            return self.store.count(class_key) if class_key in self.store.class_names else 0
+        return len(self._csv_class(class_key))
+
+    def images(self, class_key, idx):
+        idx=np.asarray(idx,dtype=np.int64)
+        if self.store is not None:
+            from utils.img_processing import normalise_image_batch
+            return normalise_image_batch(self.store.shard(class_key)[idx],self.model_info)
+        return self._csv_class(class_key)[idx].reshape((len(idx),)+self.shape)
+
+
+if __name__=="__main__":
+    #python -m utils.image_store <model folder>/<id>/<id>_data [...] builds the stores before the first request
+    for folder in sys.argv[1:]:
+        print(ingest_image_folder(folder))
@@ -0,0 +1,177 @@
+import time
+import uuid
+import queue
+import threading
+import traceback
+import multiprocessing
+from http.client import NOT_FOUND
+from flask_restful import Resource
+from utils.cache import env_number
+
+JOB_WORKERS=int(env_number("JOB_WORKERS",2))
+JOB_QUEUE_MAX=int(env_number("JOB_QUEUE_MAX",16))
+JOB_TIMEOUT=env_number("JOB_TIMEOUT",3600)
+JOB_RESULT_TTL=env_number("JOB_RESULT_TTL",3600)
+
+#set inside the worker processes while a job is running, so that explainers can report their progress
+_current_job={}
+
+
+class QueueFull(Exception):
+    pass
+
+
+def report_progress(progress, message=None):
+    #progress is a number between 0 and 1. Does nothing when the explainer is not running as an asynchronous job
+    if "id" in _current_job:
+        try:
+            _current_job["events"].put((_current_job["id"],_current_job["worker"],"progress",(float(progress),message)))
+        except Exception:
+            pass
+
+
+def _worker_loop(worker, tasks, events):
+    from flask import Flask
+    from utils.lazy_loading import import_resource
+    from utils.result_cache import cached_post
+    context_app=Flask("jobs")
+    while True:
+        task=tasks.get()
+        if task is None:
+            break
+        job_id, module_path, class_name, resource_kwargs, path, base_url, body = task
+        events.put((job_id,worker,"running",None))
+        _current_job.update(id=job_id,worker=worker,events=events)
+        try:
+            resource=import_resource(module_path,class_name)(**resource_kwargs)
+            #explainers read the body from flask.request, so the original request is rebuilt inside the worker
+            with context_app.test_request_context(path,method="POST",json=body,base_url=base_url):
+                result=cached_post(module_path+"."+class_name,resource,body,resource_kwargs.get("model_folder"),resource.post)
+            code=200
+            if isinstance(result,tuple):
+                result, code = result[0], result[1]
+            events.put((job_id,worker,"finished" if code<400 else "failed",(result,code)))
+        except Exception:
+            events.put((job_id,worker,"failed",(traceback.format_exc(),500)))
+        finally:
+            _current_job.clear()
+
+
+class JobManager:
+
+    def __init__(self, processes=JOB_WORKERS, max_queued=JOB_QUEUE_MAX, timeout=JOB_TIMEOUT, result_ttl=JOB_RESULT_TTL):
+        self.processes=max(int(processes),1)
+        self.max_queued=max_queued
+        self.timeout=timeout
+        self.result_ttl=result_ttl
+        self.jobs={}
+        self._lock=threading.Lock()
+        self._started=False
+
+    def _start(self):
+        #spawned workers do not inherit the state of TensorFlow or PyTorch from the server process
+        self._context=multiprocessing.get_context("spawn")
+        self._tasks=self._context.Queue()
+        self._events=self._context.Queue()
+        self._workers=[self._new_worker(i) for i in range(self.processes)]
+        threading.Thread(target=self._collect,daemon=True).start()
+        self._started=True
+
+    def _new_worker(self, index):
+        process=self._context.Process(target=_worker_loop,args=(index,self._tasks,self._events),daemon=True)
+        process.start()
+        return process
+
+    def submit(self, module_path, class_name, resource_kwargs, path, base_url, body, timeout=None):
+        with self._lock:
+            if not self._started:
+                self._start()
+            queued=sum(1 for job in self.jobs.values() if job["status"]=="queued")
+            if queued>=self.max_queued:
+                raise QueueFull("The job queue is full (" + str(self.max_queued) + " jobs waiting). Try again later.")
+            job_id=uuid.uuid4().hex
+            if timeout is None or (self.timeout is not None and timeout>self.timeout):
+                timeout=self.timeout
+            self.jobs[job_id]={"id":job_id,"explainer":path,"status":"queued","progress":0.0,"message":None,
+                               "submitted":time.time(),"started":None,"finished":None,"timeout":timeout,
+                               "worker":None,"result":None,"code":None}
+        self._tasks.put((job_id,module_path,class_name,resource_kwargs,path,base_url,body))
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job=self.jobs.get(job_id)
+            if job is None:
+                return None
+            job=dict(job)
+            if job["status"]=="queued":
+                job["queue_position"]=sum(1 for j in self.jobs.values() if j["status"]=="queued" and j["submitted"]<job["submitted"])
+        end=job["finished"] or time.time()
+        job["elapsed"]=None if job["started"] is None else round(end-job["started"],3)
+        job.pop("worker")
+        return job
+
+    def _collect(self):
+        while True:
+            try:
+                job_id, worker, event, value = self._events.get(timeout=1)
+                self._update(job_id,worker,event,value)
+            except queue.Empty:
+                pass
+            except Exception:
+                traceback.print_exc()
+            self._check_timeouts()
+            self._purge()
+
+    def _update(self, job_id, worker, event, value):
+        with self._lock:
+            job=self.jobs.get(job_id)
+            if job is None or job["status"] in ("finished","failed","timeout"):
+                return
+            if event=="running":
+                job.update(status="running",started=time.time(),worker=worker)
+            elif event=="progress":
+                job["progress"], job["message"] = value
+            else:
+                job.update(status=event,finished=time.time(),result=value[0],code=value[1])
+                if event=="finished":
+                    job["progress"]=1.0
+
+    def _check_timeouts(self):
+        with self._lock:
+            now=time.time()
+            for job in self.jobs.values():
+                if job["status"]!="running":
+                    continue
+                if not self._workers[job["worker"]].is_alive():
+                    job.update(status="failed",finished=now,code=500,result="The worker process running the explanation exited unexpectedly.")
+                elif job["timeout"] is not None and now-job["started"]>job["timeout"]:
+                    #a running explanation cannot be interrupted, so its worker is replaced by a new one
+                    self._workers[job["worker"]].terminate()
+                    self._workers[job["worker"]].join()
+                    job.update(status="timeout",finished=now,code=500,
+                               result="The explanation did not finish within " + str(job["timeout"]) + " seconds.")
+            for i, worker in enumerate(self._workers):
+                if not worker.is_alive():
+                    self._workers[i]=self._new_worker(i)
+
+    def _purge(self):
+        if self.result_ttl is None:
+            return
+        with self._lock:
+            now=time.time()
+            expired=[k for k,job in self.jobs.items() if job["finished"] is not None and now-job["finished"]>self.result_ttl]
+            for k in expired:
+                del self.jobs[k]
+
+
+JOB_MANAGER=JobManager()
+
+
+class Jobs(Resource):
+
+    def get(self, job_id):
+        job=JOB_MANAGER.status(job_id)
+        if job is None:
+            return "No job with id '" + job_id + "' was found. Results are kept for " + str(JOB_MANAGER.result_ttl) + " seconds.", NOT_FOUND
+        return job
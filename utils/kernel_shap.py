@@ -0,0 +1,129 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+from utils.cache import LRUCache, env_number, file_fingerprint
+
+#number of rows of the background data given to KernelExplainer. Its cost grows linearly with this number
+KERNEL_SHAP_BACKGROUND_SIZE=int(env_number("KERNEL_SHAP_BACKGROUND_SIZE",50))
+#number of training instances explained by KernelSHAPGlobal
+KERNEL_SHAP_SAMPLE_SIZE=int(env_number("KERNEL_SHAP_SAMPLE_SIZE",200))
+KERNEL_SHAP_PROCESSES=int(env_number("KERNEL_SHAP_PROCESSES",min(os.cpu_count() or 1,4)))
+KERNEL_SHAP_CHUNK_SIZE=int(env_number("KERNEL_SHAP_CHUNK_SIZE",20))
+
+BACKGROUND_METHODS=["kmeans","sample"]
+
+BACKGROUNDS=LRUCache("kernel_shap_backgrounds",max_items=int(env_number("KERNEL_SHAP_BACKGROUND_MAX_ITEMS",32)))
+
+
+def sample_rows(count, size, strata=None, seed=0):
+    #sorted positions of a random sample of size rows out of count. If strata (one value per row) is given, each
+    #stratum keeps its share of the rows (at least one), so the achieved size may differ slightly from size
+    if size is None or size>=count:
+        return np.arange(count)
+    rng=np.random.default_rng(seed)
+    if strata is None:
+        return np.sort(rng.choice(count,int(size),replace=False))
+    strata=np.asarray(strata)
+    rows=[]
+    for value in np.unique(strata):
+        idx=np.flatnonzero(strata==value)
+        k=min(len(idx),max(1,int(round(size*len(idx)/float(count)))))
+        rows.append(rng.choice(idx,k,replace=False))
+    return np.sort(np.concatenate(rows))
+
+
+def summarize_background(X, size=KERNEL_SHAP_BACKGROUND_SIZE, method="kmeans", strata=None, seed=0):
+    #returns the background data for KernelExplainer and its number of rows. kmeans uses the weighted centres of
+    #size clusters (shap.kmeans) and sample a random sample of the rows, stratified by strata if given
+    X=np.asarray(X)
+    if size is None or size>=len(X):
+        return X, len(X)
+    if method=="kmeans":
+        import shap
+        return shap.kmeans(X,int(size)), int(size)
+    if method=="sample":
+        rows=sample_rows(len(X),size,strata,seed)
+        return X[rows], len(rows)
+    raise Exception("Unknown background method '" + str(method) + "'. Use one of " + str(BACKGROUND_METHODS) + ".")
+
+
+def load_background(data_file, X, size=KERNEL_SHAP_BACKGROUND_SIZE, method="kmeans", strata=None):
+    #summarized background of the training data of a model, computed once per data file, size and method
+    path=data_file if isinstance(data_file,str) else data_file.name
+    key=(file_fingerprint(path),size,method,strata is not None)
+    return BACKGROUNDS.get_or_load(key,lambda: summarize_background(X,size,method,strata))
+
+
+def predictor_func(predictor):
+    #predictor is ("model", path, backend) or ("url", url), so the prediction function can be rebuilt in another process
+    if predictor[0]=="url":
+        from utils.remote_predict import remote_predict_func
+        return remote_predict_func(predictor[1])
+    from getmodelfiles import load_predict_func
+    return load_predict_func(predictor[1],predictor[2])
+
+
+_worker={}
+
+
+def _init_worker(predictor, background, kwargs):
+    import shap
+    _worker["explainer"]=shap.KernelExplainer(predictor_func(predictor),background,**kwargs)
+
+
+def _explain_chunk(X, nsamples):
+    return _worker["explainer"].shap_values(X,nsamples=nsamples,silent=True)
+
+
+def _concatenate(chunks):
+    #shap returns one array per output for multi-output models
+    if isinstance(chunks[0],list):
+        return [np.concatenate([c[i] for c in chunks]) for i in range(len(chunks[0]))]
+    return np.concatenate(chunks)
+
+
+def kernel_shap_values(predic_func, background, X, predictor=None, kwargs=None, nsamples="auto",
+                       processes=KERNEL_SHAP_PROCESSES, chunk_size=KERNEL_SHAP_CHUNK_SIZE, progress=None):
+    #SHAP values of the rows of X, explained in chunks. With a predictor (see predictor_func) and several processes the
+    #chunks are explained by a pool of processes, each one with its own KernelExplainer. Asynchronous jobs already run
+    #in daemonic processes, which cannot have children, so they use threads instead.
+    #Returns the values and the expected value of the explainer
+    import shap
+    kwargs=kwargs or {}
+    X=np.asarray(X)
+    chunks=[X[i:i+chunk_size] for i in range(0,len(X),chunk_size)]
+    explainer=shap.KernelExplainer(predic_func,background,**kwargs)
+    processes=max(min(int(processes),len(chunks)),1)
+    results=[None]*len(chunks)
+
+    def done(i, values):
+        results[i]=values
+        if progress is not None:
+            progress(sum(r is not None for r in results)/float(len(results)))
+
+    if processes==1:
+        for i, chunk in enumerate(chunks):
+            done(i,explainer.shap_values(chunk,nsamples=nsamples,silent=True))
+    elif predictor is not None and not multiprocessing.current_process().daemon:
+        context=multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes,mp_context=context,initializer=_init_worker,
+                                 initargs=(predictor,background,kwargs)) as executor:
+            futures={executor.submit(_explain_chunk,chunk,nsamples): i for i, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                done(futures[future],future.result())
+    else:
+        #KernelExplainer keeps the state of the instance being explained, so each thread has its own
+        local=threading.local()
+
+        def explain(chunk):
+            if not hasattr(local,"explainer"):
+                local.explainer=shap.KernelExplainer(predic_func,background,**kwargs)
+            return local.explainer.shap_values(chunk,nsamples=nsamples,silent=True)
+
+        with ThreadPoolExecutor(max_workers=processes) as executor:
+            futures={executor.submit(explain,chunk): i for i, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                done(futures[future],future.result())
+    return _concatenate(results), explainer.expected_value
@@ -0,0 +1,83 @@
+import sys
+import time
+import importlib
+import threading
+from http.client import ACCEPTED, BAD_REQUEST, SERVICE_UNAVAILABLE
+from flask import request
+from flask_restful import Resource
+from utils.cache import current_rss_mb
+
+HEAVY_LIBRARIES=["tensorflow","torch","shap","alibi","dalex","xplique","explainerdashboard","tslearn","dice_ml","lime","sklearn","matplotlib"]
+
+_import_lock=threading.Lock()
+
+
+def loaded_heavy_libraries():
+    return [lib for lib in HEAVY_LIBRARIES if lib in sys.modules]
+
+
+def import_resource(module_path, class_name):
+    with _import_lock:
+        start=time.time()
+        already_loaded=module_path in sys.modules
+        resource_class=getattr(importlib.import_module(module_path),class_name)
+        if not already_loaded:
+            print("Imported " + module_path + " in " + str(round(time.time()-start,2)) + "s")
+        return resource_class
+
+
+def lazy_resource(module_path, class_name):
+    #returns a Resource that can be registered in the API without importing the module of the explainer.
+    #The module is imported on the first request and every request is then forwarded to the real Resource.
+    #POST requests with ?async=1 are queued as jobs and run by the worker processes of utils.jobs
+    state={}
+
+    def resource_class():
+        if "class" not in state:
+            state["class"]=import_resource(module_path,class_name)
+        return state["class"]
+
+    class LazyResource(Resource):
+
+        def __init__(self,**kwargs):
+            self.resource_kwargs=kwargs
+
+        def get(self,*args,**kwargs):
+            return resource_class()(**self.resource_kwargs).get(*args,**kwargs)
+
+        def post(self,*args,**kwargs):
+            if request.args.get("async","").lower() in ("1","true","yes"):
+                return self.submit_job()
+            from utils.result_cache import cached_post
+            resource=resource_class()(**self.resource_kwargs)
+            return cached_post(module_path+"."+class_name,resource,request.get_json(silent=True),
+                               self.resource_kwargs.get("model_folder"),lambda: resource.post(*args,**kwargs))
+
+        def submit_job(self):
+            from utils.jobs import JOB_MANAGER, QueueFull
+            body=request.get_json(silent=True)
+            if body is None:
+                return "The json body is missing.",BAD_REQUEST
+            timeout=None
+            if request.args.get("timeout"):
+                try:
+                    timeout=float(request.args.get("timeout"))
+                except ValueError:
+                    return "The timeout must be a number of seconds.",BAD_REQUEST
+            try:
+                job_id=JOB_MANAGER.submit(module_path,class_name,self.resource_kwargs,request.path,request.host_url,body,timeout=timeout)
+            except QueueFull as e:
+                return str(e),SERVICE_UNAVAILABLE
+            return {"job_id":job_id,"status":"queued","url":request.host_url+"Jobs/"+job_id},ACCEPTED
+
+    LazyResource.__name__=class_name
+    LazyResource.resource_class=staticmethod(resource_class)
+    return LazyResource
+
+
+def startup_report(start_time):
+    rss=current_rss_mb()
+    heavy=loaded_heavy_libraries()
+    print("Server ready in " + str(round(time.time()-start_time,2)) + "s"
+          + ("" if rss is None else ", RSS " + str(round(rss)) + " MB")
+          + ". Heavy libraries loaded: " + (", ".join(heavy) if heavy else "none"))
@@ -0,0 +1,59 @@
+import copy
+import json
+import numpy as np
+from utils.cache import LRUCache, env_number, file_fingerprint
+
+#fitted LimeTabularExplainer objects. They only depend on the training data and the description of its features,
+#so the statistics and quartiles of the training data are computed once per data file
+LIME_EXPLAINERS=LRUCache("lime_tabular_explainers",max_items=int(env_number("LIME_CACHE_MAX_ITEMS",16)))
+
+
+class _Sampled(Exception):
+    pass
+
+
+def load_lime_explainer(data_file, training_data, kwargs):
+    #training_data is the numpy array of the training data without the target
+    import lime.lime_tabular
+    path=data_file if isinstance(data_file,str) else data_file.name
+    key=(file_fingerprint(path),json.dumps(kwargs,sort_keys=True,default=str))
+    return LIME_EXPLAINERS.get_or_load(key,lambda: lime.lime_tabular.LimeTabularExplainer(training_data,**kwargs))
+
+
+def with_seed(explainer, seed):
+    #shallow copy of a cached explainer with its own random state, so concurrent requests do not share it.
+    #The statistics of the training data are not copied
+    from sklearn.utils import check_random_state
+    random_state=check_random_state(seed)
+    explainer=copy.copy(explainer)
+    explainer.random_state=random_state
+    explainer.base=copy.copy(explainer.base)
+    explainer.base.random_state=random_state
+    if explainer.discretizer is not None:
+        explainer.discretizer=copy.copy(explainer.discretizer)
+        explainer.discretizer.random_state=random_state
+    return explainer
+
+
+def explain_instances(explainer, instances, predic_func, seeds, **kwargs):
+    #explanations of several instances with a single call to the model. The perturbations of every instance are sampled
+    #first and predicted together. Then each explanation is computed again from the same seed, so it draws the same
+    #perturbations, and receives their predictions
+    samples=[]
+
+    def record(data):
+        samples.append(np.array(data))
+        raise _Sampled()
+
+    for instance, seed in zip(instances,seeds):
+        try:
+            with_seed(explainer,seed).explain_instance(instance,record,**kwargs)
+        except _Sampled:
+            pass
+    predictions=np.asarray(predic_func(np.concatenate(samples)))
+    offsets=np.cumsum([0]+[len(s) for s in samples])
+
+    explanations=[]
+    for i, (instance, seed) in enumerate(zip(instances,seeds)):
+        explanations.append(with_seed(explainer,seed).explain_instance(instance,lambda data, i=i: predictions[offsets[i]:offsets[i+1]],**kwargs))
+    return explanations
@@ -0,0 +1,113 @@
+import numpy as np
+from utils.cache import LRUCache, env_number, file_fingerprint
+from utils.kernel_shap import sample_rows
+
+#individual conditional expectation curves of each feature, for all the outputs of the model, computed once per model,
+#training data, feature and grid. The partial dependence is their average
+PDP_CURVES=LRUCache("pdp_ice_curves",max_items=int(env_number("PDP_ICE_CACHE_MAX_ITEMS",64)),max_rss_mb=env_number("PDP_ICE_CACHE_MAX_RSS_MB"))
+#number of training rows whose curves are computed. The cost of a request does not grow with the size of the data
+PDP_ICE_SAMPLE_ROWS=int(env_number("PDP_ICE_SAMPLE_ROWS",5000))
+#maximum number of rows predicted with a single call to the model
+PDP_ICE_BATCH_ROWS=int(env_number("PDP_ICE_BATCH_ROWS",500000))
+
+GRID_RESOLUTION=100
+PERCENTILES=(0.05,0.95)
+ICE_LINES=50
+BAND_QUANTILES=((0.05,0.95),(0.25,0.75))
+
+
+def _path(f):
+    return f if isinstance(f,str) else f.name
+
+
+def feature_grid(values, categorical=False, grid_resolution=GRID_RESOLUTION, percentiles=PERCENTILES):
+    #same grid as scikit-learn: the unique values of categorical features and of features with few of them,
+    #otherwise grid_resolution equally spaced points between the percentiles
+    from scipy.stats.mstats import mquantiles
+    uniques=np.unique(values)
+    if categorical or len(uniques)<grid_resolution:
+        return uniques
+    emp_percentiles=mquantiles(values,prob=percentiles)
+    if np.allclose(emp_percentiles[0],emp_percentiles[1]):
+        raise ValueError("The percentiles are too close to each other, unable to build the grid. Please choose percentiles that are further apart.")
+    return np.linspace(emp_percentiles[0],emp_percentiles[1],num=grid_resolution,endpoint=True)
+
+
+def response_function(model, classification):
+    if classification and hasattr(model,"predict_proba"):
+        return model.predict_proba
+    if classification and hasattr(model,"decision_function"):
+        return model.decision_function
+    return model.predict
+
+
+def ice_curves(predict, X, feature, grid, batch_rows=PDP_ICE_BATCH_ROWS):
+    #(outputs, rows, grid points) array with the prediction of each row of X when feature takes each value of the grid.
+    #The rows are replicated once per grid point and predicted together, in chunks of at most batch_rows rows
+    rows_per_chunk=max(1,int(batch_rows//len(grid)))
+    chunks=[]
+    for start in range(0,len(X),rows_per_chunk):
+        chunk=X.iloc[start:start+rows_per_chunk]
+        stacked=chunk.loc[chunk.index.repeat(len(grid))].reset_index(drop=True)
+        stacked[stacked.columns[feature]]=np.tile(grid,len(chunk))
+        predictions=np.asarray(predict(stacked),dtype=np.float32)
+        if predictions.ndim==1:
+            predictions=predictions[:,np.newaxis]
+        chunks.append(predictions.reshape(len(chunk),len(grid),-1))
+    return np.moveaxis(np.concatenate(chunks),2,0)
+
+
+def load_curves(model, classification, dataframe, feature, categorical=False, model_file=None, data_file=None,
+                grid_resolution=GRID_RESOLUTION, sample_size=PDP_ICE_SAMPLE_ROWS):
+    #returns the grid and the curves of a sample of sample_size rows of dataframe (the training data without the target)
+    def compute():
+        rows=sample_rows(len(dataframe),sample_size)
+        grid=feature_grid(dataframe.iloc[:,feature].to_numpy(),categorical,grid_resolution)
+        return grid, ice_curves(response_function(model,classification),dataframe.iloc[rows],feature,grid)
+
+    if model_file is None or data_file is None:
+        return compute()
+    model_fp=file_fingerprint(_path(model_file))
+    key=(model_fp,file_fingerprint(_path(data_file)),str(dataframe.columns[feature]),bool(categorical),int(grid_resolution),int(sample_size))
+    if key not in PDP_CURVES:
+        PDP_CURVES.invalidate(lambda k: k[0][0]==model_fp[0] and k[0]!=model_fp)
+    return PDP_CURVES.get_or_load(key,compute)
+
+
+def output_index(curves, target=None):
+    #curves of the output to be explained: the given class of multiclass models, the positive class of binary ones
+    if target is not None and target<curves.shape[0]:
+        return target
+    return 1 if curves.shape[0]==2 else 0
+
+
+def plot_pdp(ax, grid, curves, categorical, feature_name):
+    average=curves.mean(axis=0)
+    if categorical:
+        ax.bar([str(g) for g in grid],average)
+    else:
+        ax.plot(grid,average)
+    ax.set_xlabel(feature_name)
+    ax.set_ylabel("Partial dependence")
+    return {"grid_values":grid.tolist(),"average":average.tolist()}
+
+
+def plot_ice(ax, grid, curves, feature_name, lines=ICE_LINES, centered=False):
+    #draws at most lines individual curves, the quantile bands of all the curves and their average. If centered,
+    #each curve starts at 0 at the first point of the grid
+    if centered:
+        curves=curves-curves[:,:1]
+    for row in sample_rows(len(curves),lines,seed=1):
+        ax.plot(grid,curves[row],color="tab:blue",alpha=0.3,linewidth=0.5)
+    bands={}
+    for low, high in BAND_QUANTILES:
+        q_low, q_high = np.quantile(curves,[low,high],axis=0)
+        ax.fill_between(grid,q_low,q_high,color="tab:blue",alpha=0.15,linewidth=0)
+        bands[str(low)]=q_low.tolist()
+        bands[str(high)]=q_high.tolist()
+    average=curves.mean(axis=0)
+    ax.plot(grid,average,color="tab:orange",linestyle="--",linewidth=2,label="average")
+    ax.set_xlabel(feature_name)
+    ax.set_ylabel("Centered ICE" if centered else "Partial dependence")
+    ax.legend()
+    return {"grid_values":grid.tolist(),"average":average.tolist(),"quantiles":bands,"centered":centered}
@@ -0,0 +1,151 @@
+import os
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from utils.cache import LRUCache, env_number, file_fingerprint, DERIVED_SUFFIX
+from utils.image_store import derived_key
+
+#loss of the model after permuting each feature, for every permutation round. Computed once per model, training data
+#and number of sampled rows, saved in the .store folder of the data, and extended when more rounds are requested
+PERMUTATION_LOSSES=LRUCache("permutation_losses",max_items=int(env_number("IMPORTANCE_CACHE_MAX_ITEMS",16)))
+IMPORTANCE_PROCESSES=int(env_number("IMPORTANCE_PROCESSES",min(os.cpu_count() or 1,4)))
+#default number of permutation rounds and of rows sampled in each round (the defaults of dalex)
+IMPORTANCE_B=int(env_number("IMPORTANCE_B",10))
+IMPORTANCE_N=int(env_number("IMPORTANCE_N",1000))
+IMPORTANCE_SEED=0
+
+#same loss functions dalex uses by default
+LOSS_FUNCTIONS={"classification":"1-auc","regression":"rmse"}
+
+
+def _path(f):
+    return f if isinstance(f,str) else f.name
+
+
+def _jsonable(value):
+    return json.loads(json.dumps(value))
+
+
+def _round(explainer_data, i):
+    #loss of the full model, of the model with the target permuted (baseline) and after permuting each feature, in
+    #the i-th round. Each round has its own generator, so a round gives the same result wherever it is computed
+    from numpy.random import SeedSequence, default_rng
+    from dalex.model_explanations._variable_importance.utils import loss_after_permutation
+    data, y, model, predict_function, loss_function, N = explainer_data
+    variables={c: [c] for c in data.columns}
+    rng=default_rng(SeedSequence(IMPORTANCE_SEED,spawn_key=(i,)))
+    return loss_after_permutation(data,y,model,predict_function,loss_function,variables,N,rng)
+
+
+_worker={}
+
+
+def _init_worker(model_path, backend, data, y, predict_function, loss_function, N):
+    from getmodelfiles import load_model
+    _worker["data"]=(data,y,load_model(model_path,backend),predict_function,loss_function,N)
+
+
+def _worker_round(i):
+    return _round(_worker["data"],i)
+
+
+def compute_rounds(explainer, rounds, N, loss_function, model_file=None, backend=None, processes=IMPORTANCE_PROCESSES):
+    #rounds are computed by a pool of processes, each one loading the model once. Asynchronous jobs already run in
+    #daemonic processes, which cannot have children, so they use threads instead
+    import pandas as pd
+    from dalex.model_explanations._variable_importance.checks import check_loss_function
+    loss_function=check_loss_function(loss_function)
+    explainer_data=(explainer.data,explainer.y,explainer.model,explainer.predict_function,loss_function,N)
+    processes=max(min(int(processes),len(rounds)),1)
+    if processes==1:
+        results=[_round(explainer_data,i) for i in rounds]
+    elif model_file is not None and not multiprocessing.current_process().daemon:
+        context=multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes,mp_context=context,initializer=_init_worker,
+                                 initargs=(_path(model_file),backend,explainer.data,explainer.y,explainer.predict_function,loss_function,N)) as executor:
+            results=list(executor.map(_worker_round,rounds))
+    else:
+        with ThreadPoolExecutor(max_workers=processes) as executor:
+            results=list(executor.map(lambda i: _round(explainer_data,i),rounds))
+    return pd.concat(results,sort=True).reset_index(drop=True)
+
+
+class PermutationLosses:
+    #rounds computed so far for one model, training data and N, with the label of the model given by dalex
+
+    def __init__(self, path=None, meta=None):
+        self.path=path
+        self.meta=meta
+        self.rounds=None
+        self.label=None
+        self.lock=threading.Lock()
+        saved=self._read()
+        if saved is not None:
+            import pandas as pd
+            self.rounds=pd.DataFrame(saved["rounds"])
+            self.label=saved["label"]
+
+    def _read(self):
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as f:
+                saved=json.load(f)
+        except (OSError, ValueError):
+            return None
+        return saved if saved.get("meta")==self.meta else None
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path),exist_ok=True)
+        tmp_path=self.path+"."+str(os.getpid())+".tmp"
+        with open(tmp_path,"w") as f:
+            json.dump({"meta":self.meta,"label":self.label,"rounds":self.rounds.to_dict(orient="list")},f)
+        os.replace(tmp_path,self.path)
+
+
+def load_permutation_losses(model_file, data_file, N, loss_function):
+    if model_file is None or data_file is None:
+        return PermutationLosses()
+    model_fp=file_fingerprint(_path(model_file))
+    data_fp=file_fingerprint(_path(data_file))
+    meta=_jsonable({"model":model_fp,"data":data_fp,"N":N,"loss_function":loss_function})
+    path=os.path.join(_path(data_file)+DERIVED_SUFFIX,"importance",derived_key(os.path.abspath(_path(model_file)),N)+".json")
+    key=(model_fp,data_fp,N,loss_function)
+    if key not in PERMUTATION_LOSSES:
+        PERMUTATION_LOSSES.invalidate(lambda k: k[0][0]==model_fp[0] and k[0]!=model_fp)
+    return PERMUTATION_LOSSES.get_or_load(key,lambda: PermutationLosses(path,meta))
+
+
+def variable_importance(make_explainer, model_type, variables=None, B=IMPORTANCE_B, N=IMPORTANCE_N, model_file=None,
+                        data_file=None, backend=None, processes=IMPORTANCE_PROCESSES):
+    #dalex VariableImportance of the given variables (all the features by default) from the first B rounds of the
+    #model. make_explainer returns the dx.Explainer, and is only called if rounds are missing
+    import pandas as pd
+    from dalex.model_explanations import VariableImportance
+    loss_function=LOSS_FUNCTIONS[model_type]
+    losses=load_permutation_losses(model_file,data_file,N,loss_function)
+    with losses.lock:
+        done=0 if losses.rounds is None else len(losses.rounds)
+        if done<B:
+            explainer=make_explainer()
+            print("Computing permutation rounds " + str(done) + " to " + str(B))
+            new_rounds=compute_rounds(explainer,list(range(done,B)),N,loss_function,model_file,backend,processes)
+            losses.rounds=new_rounds if losses.rounds is None else pd.concat([losses.rounds,new_rounds],ignore_index=True)
+            losses.label=explainer.label
+            losses.save()
+        rounds=losses.rounds.iloc[:B]
+        label=losses.label
+
+    if variables:
+        rounds=rounds[[v for v in variables if v in rounds.columns]+["_full_model_","_baseline_"]]
+    #same aggregation as dalex
+    result=rounds.mean().sort_values().reset_index()
+    result["label"]=label
+    result.rename(columns={0:"dropout_loss","index":"variable"},inplace=True)
+    parts=VariableImportance(loss_function=loss_function,N=N,B=B,variables=variables,keep_raw_permutations=True)
+    parts.result=result
+    parts.permutation=rounds.reset_index(drop=True)
+    return parts
@@ -0,0 +1,79 @@
+import json
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from utils.cache import env_number
+
+REMOTE_PREDICT_CHUNK_SIZE=int(env_number("REMOTE_PREDICT_CHUNK_SIZE",1000))
+REMOTE_PREDICT_WORKERS=int(env_number("REMOTE_PREDICT_WORKERS",4))
+REMOTE_PREDICT_BINARY=bool(env_number("REMOTE_PREDICT_BINARY",1))
+REMOTE_PREDICT_TIMEOUT=env_number("REMOTE_PREDICT_TIMEOUT",300)
+
+NPY_MIMETYPE="application/x-npy"
+
+_session=None
+_session_lock=threading.Lock()
+#urls whose server answered with npy content, so the inputs can also be sent as npy
+_binary_urls=set()
+
+
+def get_session():
+    #one session for the whole process, so connections to the prediction servers are kept alive and reused
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session=requests.Session()
+            adapter=HTTPAdapter(pool_connections=16,pool_maxsize=max(REMOTE_PREDICT_WORKERS,1)*4)
+            _session.mount("http://",adapter)
+            _session.mount("https://",adapter)
+        return _session
+
+
+def encode_npy(array):
+    buffer=BytesIO()
+    np.save(buffer,array,allow_pickle=False)
+    return buffer.getvalue()
+
+
+def decode_npy(content):
+    return np.load(BytesIO(content),allow_pickle=False)
+
+
+def _post_chunk(url, X, binary):
+    headers={"Accept": NPY_MIMETYPE+", application/json" if binary else "application/json"}
+    numeric=X.dtype.kind in "biuf"
+    if binary and numeric and url in _binary_urls:
+        headers["Content-Type"]=NPY_MIMETYPE
+        response=get_session().post(url,data=encode_npy(X.astype(np.float32)),headers=headers,timeout=REMOTE_PREDICT_TIMEOUT)
+    else:
+        response=get_session().post(url,data=dict(inputs=json.dumps(X.tolist())),headers=headers,timeout=REMOTE_PREDICT_TIMEOUT)
+    response.raise_for_status()
+    if response.headers.get("Content-Type","").startswith(NPY_MIMETYPE):
+        if numeric:
+            _binary_urls.add(url)
+        return decode_npy(response.content)
+    return np.array(json.loads(response.text))
+
+
+def remote_predict_func(url, chunk_size=REMOTE_PREDICT_CHUNK_SIZE, workers=REMOTE_PREDICT_WORKERS, binary=REMOTE_PREDICT_BINARY):
+    #prediction function for models served at an external url. Large inputs are split in chunks that are sent concurrently.
+    #The inputs are sent in the 'inputs' form field as JSON unless the server answers with npy content, in which case
+    #the next requests send float32 npy bodies
+    def predict(X):
+        X=np.asarray(X)
+        if chunk_size is None or len(X)<=chunk_size:
+            return _post_chunk(url,X,binary)
+        chunks=[X[i:i+chunk_size] for i in range(0,len(X),chunk_size)]
+        if url not in _binary_urls:
+            #the first chunk tells whether the server understands npy before the others are sent
+            results=[_post_chunk(url,chunks[0],binary)]
+            chunks=chunks[1:]
+        else:
+            results=[]
+        with ThreadPoolExecutor(max_workers=max(workers,1)) as executor:
+            results.extend(executor.map(lambda chunk: _post_chunk(url,chunk,binary),chunks))
+        return np.concatenate(results)
+    return predict
@@ -0,0 +1,149 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from flask import request
+from utils.cache import LRUCache, file_fingerprint, env_number
+from utils.validation import validate_params
+
+RESULT_CACHE_ENABLED=bool(env_number("RESULT_CACHE_ENABLED",1))
+RESULT_CACHE_TTL=env_number("RESULT_CACHE_TTL",86400)
+RESULT_CACHE_MAX_ITEMS=int(env_number("RESULT_CACHE_MAX_ITEMS",256))
+RESULT_CACHE_DISK_MB=env_number("RESULT_CACHE_DISK_MB",512)
+RESULT_CACHE_DIR=os.environ.get("RESULT_CACHE_DIR") or os.path.join(tempfile.gettempdir(),"explainer_results")
+
+
+def canonical_json(value):
+    return json.dumps(value,sort_keys=True,separators=(",",":"),default=str)
+
+
+def result_key(explainer, resource, body, model_folder):
+    #hash of the explainer, the model files, the request (instance, url, params...) and the params after filling in their defaults.
+    #Returns None if the request cannot be cached: explainers declaring a 'seed' param are only cached when a seed is given,
+    #unless they define cacheable(params) to decide it from the validated params
+    if not isinstance(body,dict) or "id" not in body:
+        return None
+    _id=str(body["id"])
+    params=body.get("params") or {}
+    if isinstance(params,str):
+        try:
+            params=json.loads(params)
+        except ValueError:
+            return None
+    if not isinstance(params,dict):
+        return None
+    try:
+        params_format=resource.get(_id)["params"]
+        params=validate_params(copy.deepcopy(params),params_format)
+    except Exception:
+        params_format={}
+    if hasattr(resource,"cacheable"):
+        if not resource.cacheable(params):
+            return None
+    elif "seed" in params_format and params.get("seed") in (None,""):
+        return None
+    try:
+        model_fingerprint=file_fingerprint(os.path.join(model_folder,_id))
+    except OSError:
+        return None
+    #the raw body is kept in the key because some explainers read their params without validating them
+    content=canonical_json([explainer,model_fingerprint,body,params])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    #two tiers: recent results in memory and all of them as JSON files on disk, both expiring after ttl seconds
+
+    def __init__(self, directory=RESULT_CACHE_DIR, ttl=RESULT_CACHE_TTL, max_items=RESULT_CACHE_MAX_ITEMS, max_disk_mb=RESULT_CACHE_DISK_MB):
+        self.directory=directory
+        self.ttl=ttl
+        self.max_disk_mb=max_disk_mb
+        self.memory=LRUCache("results",max_items=max_items)
+        self._disk_lock=threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory,key+".json")
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time()-stored_at>self.ttl
+
+    def get(self, key):
+        entry=self.memory.get(key)
+        if entry is not None:
+            if not self._expired(entry[0]):
+                return entry[1]
+            self.memory.invalidate(lambda k: k==key)
+        if self.max_disk_mb is None or self.max_disk_mb<=0:
+            return None
+        path=self._path(key)
+        try:
+            stored_at=os.path.getmtime(path)
+            if self._expired(stored_at):
+                os.remove(path)
+                return None
+            with open(path) as f:
+                result=json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.memory.put(key,(stored_at,result))
+        return result
+
+    def put(self, key, result):
+        now=time.time()
+        self.memory.put(key,(now,result))
+        if self.max_disk_mb is None or self.max_disk_mb<=0:
+            return
+        try:
+            os.makedirs(self.directory,exist_ok=True)
+            tmp_path=self._path(key)+"."+str(os.getpid())+".tmp"
+            with open(tmp_path,"w") as f:
+                json.dump(result,f)
+            os.replace(tmp_path,self._path(key))
+            self._enforce_disk_limit()
+        except (OSError, TypeError, ValueError) as e:
+            print("Could not store the explanation in the result cache: " + str(e))
+
+    def _enforce_disk_limit(self):
+        with self._disk_lock:
+            files=[]
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    path=os.path.join(self.directory,name)
+                    try:
+                        st=os.stat(path)
+                        files.append((st.st_mtime,st.st_size,path))
+                    except OSError:
+                        pass
+            total=sum(f[1] for f in files)
+            now=time.time()
+            for mtime, size, path in sorted(files):
+                if total<=self.max_disk_mb*1024*1024 and (self.ttl is None or now-mtime<=self.ttl):
+                    continue
+                try:
+                    os.remove(path)
+                    total-=size
+                except OSError:
+                    pass
+
+
+RESULT_CACHE=ResultCache()
+
+
+def cached_post(explainer, resource, body, model_folder, compute):
+    #returns the stored response of an identical previous request, or computes and stores it.
+    #Only successful responses (dictionaries, or lists of them for batch requests) are stored. The cache can be skipped for a request with ?cache=0
+    if not RESULT_CACHE_ENABLED or request.args.get("cache","1").lower() in ("0","false","no"):
+        return compute()
+    key=result_key(explainer,resource,body,model_folder)
+    if key is None:
+        return compute()
+    result=RESULT_CACHE.get(key)
+    if result is not None:
+        return result
+    result=compute()
+    if isinstance(result,(dict,list)):
+        RESULT_CACHE.put(key,result)
+    return result
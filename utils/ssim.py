@@ -0,0 +1,137 @@
+import numpy as np
+from utils.cache import LRUCache, env_number
+from utils.image_store import derived_array, derived_key
+
+#same constants as skimage.metrics.structural_similarity with its default (uniform) window
+K1=0.01
+K2=0.03
+WIN_SIZE=7
+SSIM_BATCH_SIZE=int(env_number("SSIM_BATCH_SIZE",256))
+THUMBNAIL_SIZE=int(env_number("SSIM_THUMBNAIL_SIZE",16))
+
+#thumbnails and window statistics of the training images
+SSIM_CACHE=LRUCache("ssim",max_items=int(env_number("SSIM_CACHE_MAX_ITEMS",16)),max_rss_mb=env_number("SSIM_CACHE_MAX_RSS_MB"))
+
+
+def ssim_data_range(model_info):
+    #range of the normalised images. skimage used 2 (the range of float images, -1 to 1) when it was not given
+    image=model_info["attributes"]["features"]["image"]
+    if "min" in image and "max" in image:
+        return float(image["max"])-float(image["min"])
+    return 2.0
+
+
+def full_ssim(query, image, data_range, channel_axis=None):
+    from skimage.metrics import structural_similarity
+    if channel_axis is None and query.ndim==3 and query.shape[-1]==1:
+        query, image = query[...,0], image[...,0]
+    return structural_similarity(query,image,data_range=data_range,channel_axis=channel_axis)
+
+
+def as_channels_last(images):
+    #(N,H,W) or (N,H,W,C) float64 stack with a channel axis
+    images=np.asarray(images,dtype=np.float64)
+    return images[...,np.newaxis] if images.ndim==3 else images
+
+
+def _window(shape, win_size):
+    #the window cannot be larger than the image, and it must be odd
+    win_size=min(win_size,shape[1],shape[2])
+    return win_size if win_size%2==1 else win_size-1
+
+
+def _box(images, win_size):
+    from scipy.ndimage import uniform_filter
+    return uniform_filter(images,size=(1,win_size,win_size,1))
+
+
+def window_stats(images, win_size=WIN_SIZE):
+    #box-filtered mean and variance of each image of a (N,H,W[,C]) stack, as a (N,2,H,W,C) float32 array.
+    #They do not depend on the query, so they can be computed once per training image
+    images=as_channels_last(images)
+    win_size=_window(images.shape,win_size)
+    cov_norm=win_size**2/(win_size**2-1.0)
+    ux=_box(images,win_size)
+    vx=cov_norm*(_box(images*images,win_size)-ux*ux)
+    return np.stack([ux,vx],axis=1).astype(np.float32)
+
+
+def batch_ssim(query, images, data_range, win_size=WIN_SIZE, batch_size=SSIM_BATCH_SIZE, stats=None):
+    #SSIM between query (H,W[,C]) and every image of images (N,H,W[,C]), averaged over channels, computed batch by batch.
+    #Same formula as skimage.metrics.structural_similarity with the uniform window, so the values match it.
+    #If the window_stats of the images are given, only the cross term with the query is filtered
+    images=as_channels_last(images)
+    query=as_channels_last(np.asarray(query)[np.newaxis])
+    if query.shape[1:]!=images.shape[1:]:
+        query=query.reshape((1,)+images.shape[1:])
+    win_size=_window(images.shape,win_size)
+    cov_norm=win_size**2/(win_size**2-1.0)
+    c1=(K1*data_range)**2
+    c2=(K2*data_range)**2
+    pad=(win_size-1)//2
+    uy=_box(query,win_size)
+    vy=cov_norm*(_box(query*query,win_size)-uy*uy)
+    scores=np.empty(len(images))
+    for start in range(0,len(images),batch_size):
+        x=images[start:start+batch_size]
+        if stats is None:
+            ux=_box(x,win_size)
+            vx=cov_norm*(_box(x*x,win_size)-ux*ux)
+        else:
+            ux=stats[start:start+batch_size,0].astype(np.float64)
+            vx=stats[start:start+batch_size,1].astype(np.float64)
+        vxy=cov_norm*(_box(x*query,win_size)-ux*uy)
+        s=((2*ux*uy+c1)*(2*vxy+c2))/((ux*ux+uy*uy+c1)*(vx+vy+c2))
+        s=s[:,pad:s.shape[1]-pad,pad:s.shape[2]-pad,:]
+        scores[start:start+batch_size]=s.reshape(len(x),-1).mean(axis=1)
+    return scores
+
+
+def thumbnail_factor(shape, size=THUMBNAIL_SIZE):
+    return max(1,int(round(min(shape[0],shape[1])/float(size))))
+
+
+def downsample(images, factor):
+    #mean of factor x factor blocks of a (N,H,W[,C]) stack
+    images=as_channels_last(images)
+    if factor==1:
+        return images.astype(np.float32)
+    n, h, w, c = images.shape
+    h, w = h//factor*factor, w//factor*factor
+    blocks=images[:,:h,:w].reshape(n,h//factor,factor,w//factor,factor,c)
+    return blocks.mean(axis=(2,4)).astype(np.float32)
+
+
+def _load_class_array(name, dataset, class_key, key_parts, compute_batch, batch_size=SSIM_BATCH_SIZE, mmap_mode=None):
+    #array with one row per image of a class, computed batch by batch the first time and saved with the dataset
+    folder=dataset.derived_folder+"/"+name
+    image_info=sorted((k,str(v)) for k,v in dataset.model_info["attributes"]["features"]["image"].items())
+    key=derived_key(dataset.fingerprint,class_key,image_info,key_parts)
+    count=dataset.count(class_key)
+
+    def compute():
+        chunks=[compute_batch(dataset.images(class_key,np.arange(start,min(start+batch_size,count))))
+                for start in range(0,count,batch_size)]
+        return np.concatenate(chunks)
+
+    return SSIM_CACHE.get_or_load(folder+"/"+key,lambda: derived_array(folder,key,compute,count=count,mmap_mode=mmap_mode))
+
+
+def load_thumbnails(dataset, class_key, factor):
+    #downsampled images of a class
+    return _load_class_array("thumbnails",dataset,class_key,factor,lambda images: downsample(images,factor))
+
+
+def load_window_stats(dataset, class_key, win_size=WIN_SIZE):
+    #twice the size of the images in float32, so they are memory-mapped once saved
+    return _load_class_array("ssim_stats",dataset,class_key,win_size,lambda images: window_stats(images,win_size),mmap_mode="r")
+
+
+def class_ssim(query, dataset, class_key, data_range, rows=None, batch_size=SSIM_BATCH_SIZE):
+    #SSIM between the query and the images of a class (or the given rows), using their precomputed window statistics.
+    #Images are read batch by batch, so a large class is never held in memory as floats
+    stats=load_window_stats(dataset,class_key)
+    rows=np.arange(dataset.count(class_key)) if rows is None else np.asarray(rows)
+    scores=[batch_ssim(query,dataset.images(class_key,rows[start:start+batch_size]),data_range,stats=stats[rows[start:start+batch_size]])
+            for start in range(0,len(rows),batch_size)]
+    return np.concatenate(scores) if scores else np.empty(0)
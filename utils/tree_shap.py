@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+from utils.cache import LRUCache, env_number, file_fingerprint, DERIVED_SUFFIX
+from utils.image_store import derived_key
+
+#SHAP values of the whole training data, computed by TreeSHAP once per model and data file and saved in the .store
+#folder of the data as a float32 (rows, outputs, features) array, together with a json file describing what was computed
+TREE_SHAP_CHUNK_SIZE=int(env_number("TREE_SHAP_CHUNK_SIZE",10000))
+#the summary plot of large datasets is drawn with a sample of the rows
+TREE_SHAP_PLOT_ROWS=int(env_number("TREE_SHAP_PLOT_ROWS",5000))
+#XGBoost and LightGBM models are explained with the contributions computed by the libraries themselves
+TREE_SHAP_NATIVE=bool(env_number("TREE_SHAP_NATIVE",1))
+
+TREE_SHAP=LRUCache("tree_shap",max_items=int(env_number("TREE_SHAP_CACHE_MAX_ITEMS",8)),max_rss_mb=env_number("TREE_SHAP_CACHE_MAX_RSS_MB"))
+
+
+def _path(f):
+    return f if isinstance(f,str) else f.name
+
+
+def _jsonable(value):
+    return json.loads(json.dumps(value))
+
+
+def _lightgbm_binary(model):
+    booster=getattr(model,"booster_",model)
+    return str(booster.params.get("objective",""))=="binary"
+
+
+class NativeTreeExplainer:
+    #exact TreeSHAP values computed by XGBoost (pred_contribs) or LightGBM (pred_contrib) with all their threads,
+    #without building shap's copy of the trees. Same shap_values and expected_value as shap.TreeExplainer,
+    #including the two outputs shap gives to LightGBM binary classifiers
+
+    def __init__(self, model, backend):
+        from utils import ontologyConstants
+        self.model=model
+        self.xgboost=backend in ontologyConstants.XGBOOST_URIS
+        self.expected_value=None
+
+    def contributions(self, X):
+        #(rows, outputs, features + 1) array, the last column being the expected value of the output
+        n_features=X.shape[1]
+        if self.xgboost:
+            import xgboost
+            booster=self.model.get_booster() if hasattr(self.model,"get_booster") else self.model
+            phi=np.asarray(booster.predict(xgboost.DMatrix(X),pred_contribs=True,validate_features=False))
+        else:
+            phi=np.asarray(self.model.predict(X,pred_contrib=True))
+            if _lightgbm_binary(self.model):
+                phi=np.stack([-phi,phi],axis=1)
+        return phi.reshape(len(phi),-1,n_features+1)
+
+    def shap_values(self, X):
+        phi=self.contributions(X)
+        if len(phi):
+            self.expected_value=phi[0,:,-1] if phi.shape[1]>1 else float(phi[0,0,-1])
+        values=phi[:,:,:-1]
+        #one array per output for multi-output models, like shap
+        if values.shape[1]>1:
+            return [values[:,i,:] for i in range(values.shape[1])]
+        return values[:,0,:]
+
+
+def tree_explainer(model, backend, **kwargs):
+    from utils import ontologyConstants
+    if TREE_SHAP_NATIVE and (backend in ontologyConstants.XGBOOST_URIS or backend in ontologyConstants.LIGHTGBM_URIS):
+        return NativeTreeExplainer(model,backend)
+    import shap
+    return shap.Explainer(model,**kwargs)
+
+
+def rows_md5(dataframe, count):
+    #hash of the contents of the first count rows, used to check that the rows already explained did not change
+    import pandas as pd
+    return hashlib.md5(pd.util.hash_pandas_object(dataframe.iloc[:count],index=False).to_numpy().tobytes()).hexdigest()
+
+
+def as_outputs(values):
+    #(rows, outputs, features) array from the list of arrays per output (or the single array) returned by shap
+    if isinstance(values,list):
+        return np.stack([np.asarray(v) for v in values],axis=1)
+    values=np.asarray(values)
+    if values.ndim==2:
+        return values[:,np.newaxis,:]
+    #(rows, features, outputs) in recent versions of shap
+    return np.moveaxis(values,2,1)
+
+
+def compute_shap_values(explainer, dataframe, start=0, chunk_size=TREE_SHAP_CHUNK_SIZE, progress=None):
+    chunks=[]
+    total=len(dataframe)-start
+    for i in range(start,len(dataframe),chunk_size):
+        chunks.append(as_outputs(explainer.shap_values(dataframe.iloc[i:i+chunk_size])).astype(np.float32))
+        if progress is not None:
+            progress(min(i+chunk_size-start,total)/float(total))
+    return np.concatenate(chunks) if chunks else None
+
+
+def _read_meta(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(npy_path, meta_path, values, meta):
+    os.makedirs(os.path.dirname(npy_path),exist_ok=True)
+    tmp_path=npy_path+"."+str(os.getpid())+".tmp.npy"
+    np.save(tmp_path,values,allow_pickle=False)
+    os.replace(tmp_path,npy_path)
+    tmp_path=meta_path+"."+str(os.getpid())+".tmp"
+    with open(tmp_path,"w") as f:
+        json.dump(meta,f)
+    os.replace(tmp_path,meta_path)
+
+
+def _load(model_path, data_path, dataframe, make_explainer, incremental, progress):
+    model_fp=_jsonable(file_fingerprint(model_path))
+    data_fp=_jsonable(file_fingerprint(data_path))
+    folder=data_path+DERIVED_SUFFIX+"/tree_shap"
+    #one file per model, overwritten when the model changes
+    key=derived_key(os.path.abspath(model_path),list(dataframe.columns))
+    npy_path=os.path.join(folder,key+".npy")
+    meta_path=os.path.join(folder,key+".json")
+
+    meta=_read_meta(meta_path)
+    values=None
+    if meta is not None and meta["model"]==model_fp and os.path.exists(npy_path):
+        if meta["data"]==data_fp and meta["rows"]==len(dataframe):
+            return np.load(npy_path,mmap_mode="r"), np.array(meta["expected_value"])
+        #rows appended to the data file: only the new rows are explained
+        if incremental and meta["rows"]<=len(dataframe) and meta["rows_md5"]==rows_md5(dataframe,meta["rows"]):
+            values=np.load(npy_path)
+
+    start=0 if values is None else len(values)
+    if start<len(dataframe):
+        explainer=make_explainer()
+        print("Computing the TreeSHAP values of rows " + str(start) + " to " + str(len(dataframe)))
+        new_values=compute_shap_values(explainer,dataframe,start,progress=progress)
+        values=new_values if values is None else np.concatenate([values,new_values])
+        expected_value=np.atleast_1d(np.asarray(explainer.expected_value,dtype=float)).tolist()
+    elif values is not None:
+        expected_value=meta["expected_value"]
+    else:
+        raise Exception("No data found.")
+    _save(npy_path,meta_path,values,{"model":model_fp,"data":data_fp,"rows":len(values),
+                                     "rows_md5":rows_md5(dataframe,len(values)),"expected_value":expected_value})
+    return np.load(npy_path,mmap_mode="r"), np.array(expected_value)
+
+
+def tree_shap_values(model_file, data_file, dataframe, make_explainer, incremental=True, progress=None):
+    #returns the (rows, outputs, features) SHAP values of the rows of dataframe (the training data without the target)
+    #and the expected value of each output. make_explainer returns the explainer, and is only called if something has
+    #to be computed. With incremental=True, the rows appended to the data since the last computation are the only ones explained
+    model_path=_path(model_file)
+    data_path=_path(data_file)
+    key=(file_fingerprint(model_path),file_fingerprint(data_path),tuple(dataframe.columns))
+    TREE_SHAP.invalidate(lambda k: k[0][0]==key[0][0] and k[1][0]==key[1][0] and k!=key)
+    return TREE_SHAP.get_or_load(key,lambda: _load(model_path,data_path,dataframe,make_explainer,incremental,progress))
+
+
+def summary_rows(count, size=TREE_SHAP_PLOT_ROWS, seed=0):
+    if size is None or count<=size:
+        return np.arange(count)
+    return np.sort(np.random.default_rng(seed).choice(count,size,replace=False))
+
+
+def shap_aggregates(values, feature_names):
+    #per feature statistics of the SHAP values of one output, computed by chunks so a memory-mapped matrix is read once
+    total_abs=np.zeros(len(feature_names))
+    total=np.zeros(len(feature_names))
+    total_sq=np.zeros(len(feature_names))
+    for i in range(0,len(values),TREE_SHAP_CHUNK_SIZE):
+        chunk=np.asarray(values[i:i+TREE_SHAP_CHUNK_SIZE],dtype=np.float64)
+        total_abs+=np.abs(chunk).sum(axis=0)
+        total+=chunk.sum(axis=0)
+        total_sq+=(chunk*chunk).sum(axis=0)
+    n=float(max(len(values),1))
+    mean=total/n
+    std=np.sqrt(np.maximum(total_sq/n-mean*mean,0))
+    order=np.argsort(-total_abs)
+    return {feature_names[i]:{"mean_abs_shap":float(total_abs[i]/n),"mean_shap":float(mean[i]),"std_shap":float(std[i])} for i in order}
+
+
+if __name__=="__main__":
+    #python -m utils.tree_shap <model folder> <id> [...] computes the values before the first request
+    from getmodelfiles import get_model_files, load_model, load_data
+    for _id in sys.argv[2:]:
+        model_file, model_info_file, data_file = get_model_files(_id,sys.argv[1])
+        model_info=json.load(model_info_file)
+        target_name=model_info["attributes"]["target_names"][0]
+        model=load_model(model_file,model_info["backend"])
+        dataframe=load_data(data_file).drop([target_name],axis=1)
+        values, _ = tree_shap_values(model_file,data_file,dataframe,lambda: tree_explainer(model,model_info["backend"]))
+        print(_id + ": " + str(values.shape))
@@ -11,7 +11,8 @@ def validate_params(params, params_format):
 
         param=params.get(param_name,"")
 
-        if not param:
+        #numbers equal to 0 (e.g. a seed of 0) are values, not missing params
+        if not param and type(param) not in (int,float):
             if param_format["required"]: #if required, abort execution
                 raise "Required parameter '" + param_name +"' was not included in the request." 
             else: